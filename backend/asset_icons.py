@@ -0,0 +1,157 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from threading import Lock
+from time import time
+from typing import Callable, Dict, Optional, List
+
+import requests
+from requests.adapters import HTTPAdapter
+from PIL import Image
+
+DEFAULT_ICON_WORKERS = 8
+DEFAULT_ICON_FAILURE_TTL = 86400.0  # seconds
+ICON_REQUEST_TIMEOUT = 15.0  # seconds
+FAILED_ICONS_FILENAME = 'failed_icons.json'
+# Rejected API keys and rate limits say nothing about the asset, so these lookups are retried on the next request
+RETRYABLE_STATUS_CODES = (401, 403, 429)
+
+IconCallback = Callable[[str, Optional[str]], None]  # (asset ticker, icon path or None if the lookup failed)
+
+
+class IconLookupFailed(Exception):
+    """
+    Raised when an asset has no icon which can be downloaded
+    """
+
+
+def download_asset_icon(session: requests.Session, asset_ticker: str, icon_path: str, api_key: str) -> None:
+    """
+    Download the asset icon using the CryptoCompare API
+    :param icon_path: path to save the downloaded icon
+    :raise IconLookupFailed: if the asset or its logo is not found
+    :raise requests.RequestException: if the request failed for a reason which may be temporary
+    :raise OSError: if the icon can't be saved
+    """
+    url = f'https://data-api.cryptocompare.com/asset/v1/data/by/symbol?asset_symbol={asset_ticker}&api_key={api_key}'
+    try:
+        response = session.get(url, timeout=ICON_REQUEST_TIMEOUT)
+        response.raise_for_status()
+        logo_url = response.json()['Data']['LOGO_URL']
+        logo_response = session.get(logo_url, timeout=ICON_REQUEST_TIMEOUT)
+        logo_response.raise_for_status()
+        image = Image.open(BytesIO(logo_response.content), formats=('PNG',))
+        image.load()
+    except requests.HTTPError as e:
+        status_code = e.response.status_code
+        if status_code in RETRYABLE_STATUS_CODES or status_code >= 500:
+            raise
+        raise IconLookupFailed(f'{asset_ticker} icon lookup failed: {e}') from e
+    except (ValueError, KeyError, TypeError, OSError) as e:
+        # requests exceptions are OSErrors as well, the JSON and image decoding errors are ValueErrors and OSErrors
+        if isinstance(e, requests.RequestException):
+            raise
+        raise IconLookupFailed(f'{asset_ticker} icon lookup failed: {e!r}') from e
+    # A partially written icon would be taken for a downloaded one, so the file is replaced at once
+    temp_path = f'{icon_path}.tmp'
+    image.save(temp_path, format='PNG')
+    os.replace(temp_path, icon_path)
+
+
+class AssetIconService:
+    """
+    The class downloads the asset icons in a thread pool sharing a single HTTP session, so the icons of a whole
+    watchlist are fetched concurrently and the connections to the API are reused. Downloaded icons are kept in the
+    icons directory, failed lookups are remembered for failure_ttl seconds, so they aren't repeated on every launch
+    """
+
+    def __init__(self, icons_dir: str, dispatch: Callable[..., None], max_workers: int = DEFAULT_ICON_WORKERS,
+                 failure_ttl: float = DEFAULT_ICON_FAILURE_TTL):
+        """
+        :param dispatch: called with a callback and its arguments to run the callback in the UI thread
+        :param max_workers: max concurrent downloads
+        """
+        self.icons_dir = icons_dir
+        self.dispatch = dispatch
+        self.failure_ttl = failure_ttl
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='icons')
+        self.lock = Lock()
+        self.pending: Dict[str, List[IconCallback]] = {}  # {asset ticker: callbacks waiting for the download}
+        self.failed_icons_path = os.path.join(icons_dir, FAILED_ICONS_FILENAME)
+        self.failed_icons = self.load_failed_icons()  # {asset ticker: lookup failure time}
+
+    def load_failed_icons(self) -> Dict[str, float]:
+        try:
+            with open(self.failed_icons_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f'Error reading the failed icon lookups: {e}')
+            return {}
+
+    def save_failed_icons(self) -> None:
+        try:
+            with open(self.failed_icons_path, 'w') as f:
+                json.dump(self.failed_icons, f)
+        except OSError as e:
+            print(f'Error writing the failed icon lookups: {e}')
+
+    def get_icon_path(self, asset_ticker: str) -> str:
+        return os.path.join(self.icons_dir, f'{asset_ticker}.png')
+
+    def is_lookup_failed(self, asset_ticker: str) -> bool:
+        failed_at = self.failed_icons.get(asset_ticker)
+        return failed_at is not None and time() - failed_at < self.failure_ttl
+
+    def request_icon(self, asset_ticker: str, api_key: str, callback: IconCallback) -> Optional[str]:
+        """
+        Get the path of a downloaded icon or start downloading it. Must be called in the UI thread
+        :param callback: called in the UI thread when the download started by this request is finished
+        :return: icon path if the icon is already downloaded, None otherwise
+        """
+        icon_path = self.get_icon_path(asset_ticker)
+        if os.path.isfile(icon_path):
+            return icon_path
+        if self.is_lookup_failed(asset_ticker):
+            self.dispatch(callback, asset_ticker, None)
+            return None
+        with self.lock:
+            callbacks = self.pending.get(asset_ticker)
+            if callbacks is not None:
+                callbacks.append(callback)
+                return None
+            self.pending[asset_ticker] = [callback]
+        self.executor.submit(self.fetch_icon, asset_ticker, icon_path, api_key)
+        return None
+
+    def fetch_icon(self, asset_ticker: str, icon_path: str, api_key: str) -> None:
+        result: Optional[str] = None
+        try:
+            download_asset_icon(self.session, asset_ticker, icon_path, api_key)
+            result = icon_path
+        except IconLookupFailed as e:
+            print(e)
+            self.dispatch(self.remember_failure, asset_ticker)
+        except requests.RequestException as e:
+            print(f'Error downloading the {asset_ticker} icon: {e}')
+        except Exception as e:
+            # Saving the icon failed or something unexpected did, the executor would swallow the error
+            print(f'Error fetching the {asset_ticker} icon: {e!r}')
+        finally:
+            with self.lock:
+                callbacks = self.pending.pop(asset_ticker)
+            for callback in callbacks:
+                self.dispatch(callback, asset_ticker, result)
+
+    def remember_failure(self, asset_ticker: str) -> None:
+        self.failed_icons[asset_ticker] = time()
+        self.save_failed_icons()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
@@ -0,0 +1,95 @@
+import json
+import os
+from time import time
+from typing import Set, Optional, Dict, Any
+
+import requests
+
+COIN_LIST_URL = 'https://min-api.cryptocompare.com/data/all/coinlist?summary=true'
+DEFAULT_COIN_LIST_CACHE_FILE = 'coin_list_cache.json'
+DEFAULT_COIN_LIST_TTL = 86400.0  # seconds
+COIN_LIST_RETRY_INTERVAL = 300.0  # seconds, wait before the next refresh after a failed one
+COIN_LIST_REQUEST_TIMEOUT = 30.0  # seconds
+
+
+def parse_coin_list(data: Dict[str, Dict[str, Any]]) -> Set[str]:
+    return {coin['Symbol'] for coin in data.values()}
+
+
+class CoinListCache:
+    """
+    The class keeps the set of all CryptoCompare coins in a file, so the app can start with the cached set and refresh
+    it in the background when it expires. A refresh is a conditional request, an unchanged coin list is not downloaded
+    again when the server supports ETag or Last-Modified validation
+    """
+
+    def __init__(self, filename: str = DEFAULT_COIN_LIST_CACHE_FILE, ttl: float = DEFAULT_COIN_LIST_TTL):
+        self.filename = filename
+        self.ttl = ttl
+        self.fetched_at = 0.0
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+
+    def load(self) -> Set[str]:
+        """
+        Read the cached coin set
+        :return: cached coins, empty set if there is no valid cache
+        """
+        try:
+            with open(self.filename) as f:
+                cache = json.load(f)
+            coins = set(cache['coins'])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f'Error reading the coin list cache: {e}')
+            return set()
+        self.fetched_at = cache.get('fetched_at', 0.0)
+        self.etag = cache.get('etag')
+        self.last_modified = cache.get('last_modified')
+        return coins
+
+    def save(self, coins: Set[str]) -> None:
+        cache = {'fetched_at': self.fetched_at, 'etag': self.etag, 'last_modified': self.last_modified,
+                 'coins': sorted(coins)}
+        # The cache is replaced at once, so an interrupted write never leaves a broken file
+        temp_filename = f'{self.filename}.tmp'
+        try:
+            with open(temp_filename, 'w') as f:
+                json.dump(cache, f)
+            os.replace(temp_filename, self.filename)
+        except OSError as e:
+            print(f'Error writing the coin list cache: {e}')
+
+    def get_expiry_delay(self) -> float:
+        """
+        :return: seconds until the cached coin set expires, 0 if it has already expired
+        """
+        return max(0.0, self.fetched_at + self.ttl - time())
+
+    def refresh(self, cached_coins: Set[str]) -> Optional[Set[str]]:
+        """
+        Revalidate the cached coin set with the API and update the cache. Blocks until the request is finished
+        :param cached_coins: coins returned by the last load or refresh, kept when the coin list is not modified
+        :return: current coins, None if the request failed
+        """
+        headers = {}
+        if cached_coins:
+            if self.etag is not None:
+                headers['If-None-Match'] = self.etag
+            if self.last_modified is not None:
+                headers['If-Modified-Since'] = self.last_modified
+        try:
+            response = requests.get(COIN_LIST_URL, headers=headers, timeout=COIN_LIST_REQUEST_TIMEOUT)
+            response.raise_for_status()
+            if response.status_code == 304:
+                coins = cached_coins
+            else:
+                coins = parse_coin_list(response.json()['Data'])
+        except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as e:
+            print(f'Error refreshing the coin list: {e}')
+            return None
+        self.fetched_at = time()
+        self.etag = response.headers.get('ETag', self.etag)
+        self.last_modified = response.headers.get('Last-Modified', self.last_modified)
+        self.save(coins)
+        return coins
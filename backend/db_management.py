@@ -1,34 +1,449 @@
-from datetime import datetime
-from typing import Tuple, Any, List
+from datetime import datetime, date, timedelta
+from abc import ABC, abstractmethod
+from typing import Tuple, Any, List, Dict, Optional, Iterator, Union
+from contextlib import contextmanager
+from queue import LifoQueue, Empty
+from threading import Lock
+from time import monotonic
+import asyncio
+import re
+import sqlite3
 import mysql.connector as connector
 from mysql.connector.abstracts import MySQLConnectionAbstract, MySQLCursorAbstract
-from mysql.connector.pooling import PooledMySQLConnection
 
 MAX_INT = 2147483647
 MIN_DATETIME = datetime(1000, 1, 1)
 MAX_DATETIME = datetime(9999, 12, 31)
 
+DB_ENGINES = ('mysql', 'sqlite')
+DEFAULT_DB_ENGINE = 'mysql'
+DEFAULT_SQLITE_PATH = 'crypto_data.db'
+# Errors raised by the supported db engines
+DB_ERRORS = (connector.Error, sqlite3.Error)
+SQLITE_PLACEHOLDER_PATTERN = re.compile('%[s%]')
 
-class DBManager:
-    def __init__(self, db_host: str, db_user: str, db_password: str, db_name: str):
+MIGRATIONS_LOCK_NAME = 'py_crypto_dashboard_migrations'
+MIGRATIONS_LOCK_TIMEOUT = 60  # seconds
+# Schema migrations applied on top of the tables created in DBManager.create_database_and_tables:
+# (version, description, queries). Migrations are applied in order and only once, new migrations must be appended
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, 'Index historical data by asset and update time', [
+        "CREATE INDEX asset_time_idx ON historical_data (asset_name, update_time)"
+    ]),
+    (2, 'Widen historical data ids', [
+        "ALTER TABLE historical_data MODIFY update_id BIGINT AUTO_INCREMENT"
+    ]),
+    (3, 'Add per-minute and per-hour rollup tables', [
+        f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                asset_name CHAR(100),
+                open_time DATETIME,
+                `open` DOUBLE,
+                high DOUBLE,
+                low DOUBLE,
+                `close` DOUBLE,
+                tick_count INT,
+                first_time DATETIME,
+                last_time DATETIME,
+                PRIMARY KEY (asset_name, open_time)
+            )
+        """ for table in ('candles_1m', 'candles_1h')
+    ] + [
+        # Updates inserted after this migration are rolled up by the writer, older ones by backfill_rollups
+        "CREATE TABLE IF NOT EXISTS rollup_backfill (id INT PRIMARY KEY, max_update_id BIGINT, "
+        "backfilled_update_id BIGINT)",
+        "INSERT INTO rollup_backfill SELECT 1, COALESCE(MAX(update_id), 0), 0 FROM historical_data"
+    ]),
+    (4, 'Add trade and top of book tables', [
+        """
+            CREATE TABLE IF NOT EXISTS trades (
+                update_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                asset_name CHAR(100),
+                market CHAR(100),
+                trade_time DATETIME,
+                side TINYINT,
+                trade_id VARCHAR(100),
+                price DOUBLE,
+                quantity DOUBLE,
+                total DOUBLE,
+                INDEX trades_asset_time_idx (asset_name, trade_time)
+            )
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS top_of_book (
+                update_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                asset_name CHAR(100),
+                market CHAR(100),
+                update_time DATETIME,
+                bid DOUBLE,
+                bid_quantity DOUBLE,
+                ask DOUBLE,
+                ask_quantity DOUBLE,
+                INDEX top_of_book_asset_time_idx (asset_name, update_time)
+            )
+        """
+    ]),
+]
+# Tables of the additional websocket channels: (table, time column), their rows expire with the raw price updates
+CHANNEL_TABLES = (('trades', 'trade_time'), ('top_of_book', 'update_time'))
+DEFAULT_PARTITION_MONTHS_AHEAD = 3
+DEFAULT_POOL_SIZE = 5
+DEFAULT_POOL_TIMEOUT = 10.0  # seconds
+DEFAULT_HEALTH_CHECK_INTERVAL = 30.0  # seconds
+DEFAULT_STREAM_CHUNK_SIZE = 10000
+DEFAULT_RETENTION_BATCH_SIZE = 5000
+DEFAULT_RETENTION_INTERVAL = 3600.0  # seconds
+DEFAULT_RETENTION_BATCH_PAUSE = 0.1  # seconds
+
+
+class PooledConnection:
+    """
+    The class wraps a pooled MySQL connection and keeps its cursors between checkouts, so prepared statements are
+    prepared on the server only once per connection
+    """
+
+    def __init__(self, connection: MySQLConnectionAbstract):
+        self.connection = connection
+        self.cursor: MySQLCursorAbstract = connection.cursor(buffered=True)
+        self.prepared_cursors: Dict[str, MySQLCursorAbstract] = {}
+        self.last_used = monotonic()
+        self.stale = False
+
+    def get_cursor(self, query: str, prepared: bool) -> MySQLCursorAbstract:
+        """
+        Get a cursor for the query. Prepared statement cursors are cached by query
+        """
+        if not prepared:
+            return self.cursor
+        cursor = self.prepared_cursors.get(query)
+        if cursor is None:
+            cursor = self.connection.cursor(prepared=True)
+            self.prepared_cursors[query] = cursor
+        return cursor
+
+    def execute(self, query: str, values: tuple, prepared: bool) -> MySQLCursorAbstract:
+        cursor = self.get_cursor(query, prepared)
+        cursor.execute(query, values)
+        return cursor
+
+    def executemany(self, query: str, values: List[tuple]) -> MySQLCursorAbstract:
+        cursor = self.get_cursor(query, False)
+        cursor.executemany(query, values)
+        return cursor
+
+    def check_health(self, health_check_interval: float) -> None:
+        """
+        Ping the server if the connection was idle for too long or failed during the last checkout and reconnect if
+        it is lost. Prepared statements don't survive a reconnect, so the cursors are recreated
+        """
+        if not self.stale and monotonic() - self.last_used < health_check_interval:
+            return
+        if not self.connection.is_connected():
+            self.connection.reconnect(attempts=3, delay=1)
+            self.cursor = self.connection.cursor(buffered=True)
+            self.prepared_cursors.clear()
+        self.stale = False
+
+    def close(self) -> None:
+        try:
+            self.connection.close()
+        except connector.Error:
+            pass
+
+
+class SQLiteConnection:
+    """
+    The class wraps a pooled SQLite connection with the PooledConnection interface. Queries are written with the
+    MySQL %s placeholders, which are translated to the SQLite ones. SQLite caches compiled statements by itself
+    """
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+        self.last_used = monotonic()
+        self.stale = False
+
+    @staticmethod
+    def translate_query(query: str) -> str:
+        return SQLITE_PLACEHOLDER_PATTERN.sub(lambda match: '%' if match.group() == '%%' else '?', query)
+
+    def execute(self, query: str, values: tuple, prepared: bool) -> sqlite3.Cursor:
+        return self.connection.execute(self.translate_query(query), values)
+
+    def executemany(self, query: str, values: List[tuple]) -> sqlite3.Cursor:
+        return self.connection.executemany(self.translate_query(query), values)
+
+    def check_health(self, health_check_interval: float) -> None:
+        self.stale = False  # An embedded db connection can't be lost
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class DBSession:
+    """
+    A connection checked out from the pool. All statements executed through the session run on the same connection
+    """
+
+    def __init__(self, pooled_connection: Union[PooledConnection, SQLiteConnection], use_prepared_statements: bool):
+        self.pooled_connection = pooled_connection
+        self.use_prepared_statements = use_prepared_statements
+        self.rowcount = 0
+
+    def execute(self, query: str, values: tuple = (), prepared: Optional[bool] = None) -> List[tuple]:
+        """
+        Execute a single query
+        :param prepared: run the query as a server-side prepared statement, defaults to the db manager setting
+        :return: fetched rows, empty list for queries without a result set
+        """
+        if prepared is None:
+            prepared = self.use_prepared_statements
+        cursor = self.pooled_connection.execute(query, values, prepared)
+        res = cursor.fetchall() if cursor.description is not None else []
+        self.rowcount = cursor.rowcount
+        return res
+
+    def executemany(self, query: str, values: List[tuple]) -> int:
+        """
+        Execute a single query for every values tuple. Multi-row INSERT queries are sent to the MySQL server as a
+        single statement, so they never use prepared statements
+        :return: number of affected rows
+        """
+        cursor = self.pooled_connection.executemany(query, values)
+        self.rowcount = cursor.rowcount
+        return self.rowcount
+
+    def commit(self) -> None:
+        self.pooled_connection.connection.commit()
+
+
+class DBManager(ABC):
+    """
+    Base class of the storage engines. Queries are written with %s placeholders and run on pooled connections
+    through sessions. The engine specific SQL is built by the get_*_sql and get_*_query methods
+    """
+    partition_history = False
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE, pool_timeout: float = DEFAULT_POOL_TIMEOUT,
+                 health_check_interval: float = DEFAULT_HEALTH_CHECK_INTERVAL, use_prepared_statements: bool = False):
+        self.pool_size = pool_size
+        self.use_prepared_statements = use_prepared_statements
+        self.pool_timeout = pool_timeout
+        self.health_check_interval = health_check_interval
+        self.idle_connections: LifoQueue[Union[PooledConnection, SQLiteConnection]] = LifoQueue()
+        self.pool_lock = Lock()
+        self.opened_connections = 0
+        self.rollup_backfilled = False
+        self.create_database_and_tables()
+        self.run_migrations()
+
+    @abstractmethod
+    def open_connection(self) -> Union[PooledConnection, SQLiteConnection]:
+        raise NotImplementedError
+
+    def acquire_connection(self) -> Union[PooledConnection, SQLiteConnection]:
+        """
+        Check out a connection from the pool. A new connection is opened while the pool is below its size, otherwise
+        the call waits for a connection to be released
+        """
+        try:
+            pooled_connection = self.idle_connections.get_nowait()
+        except Empty:
+            with self.pool_lock:
+                can_open = self.opened_connections < self.pool_size
+                if can_open:
+                    self.opened_connections += 1
+            if can_open:
+                try:
+                    return self.open_connection()
+                except DB_ERRORS:
+                    with self.pool_lock:
+                        self.opened_connections -= 1
+                    raise
+            try:
+                pooled_connection = self.idle_connections.get(timeout=self.pool_timeout)
+            except Empty:
+                raise connector.PoolError(f"No free db connection after {self.pool_timeout} seconds")
+        try:
+            pooled_connection.check_health(self.health_check_interval)
+        except DB_ERRORS:
+            self.discard_connection(pooled_connection)
+            raise
+        return pooled_connection
+
+    def release_connection(self, pooled_connection: Union[PooledConnection, SQLiteConnection]) -> None:
+        pooled_connection.last_used = monotonic()
+        self.idle_connections.put(pooled_connection)
+
+    def discard_connection(self, pooled_connection: Union[PooledConnection, SQLiteConnection]) -> None:
+        pooled_connection.close()
+        with self.pool_lock:
+            self.opened_connections -= 1
+
+    @contextmanager
+    def session(self) -> Iterator[DBSession]:
+        """
+        Check out a connection for running several statements or transactions on it. Nothing is committed
+        automatically
+        """
+        pooled_connection = self.acquire_connection()
+        try:
+            yield DBSession(pooled_connection, self.use_prepared_statements)
+        except DB_ERRORS:
+            pooled_connection.stale = True
+            raise
+        finally:
+            self.release_connection(pooled_connection)
+
+    @contextmanager
+    def transaction(self) -> Iterator[DBSession]:
+        """
+        Check out a connection and run the statements executed through the session as a single transaction. The
+        transaction is committed on exit and rolled back if an exception is raised
+        """
+        with self.session() as db_session:
+            try:
+                yield db_session
+                db_session.commit()
+            except BaseException:
+                try:
+                    db_session.pooled_connection.connection.rollback()
+                except DB_ERRORS:
+                    pass
+                raise
+
+    def execute_transaction(self, queries: List[str], values: List[tuple]) -> Any:
+        with self.transaction() as db_session:
+            res = []
+            for i in range(len(queries)):
+                res = db_session.execute(queries[i], values[i])
+        return res
+
+    def execute_many(self, query: str, values: List[tuple]) -> None:
+        """
+        Execute a single query for every values tuple in one transaction. Multi-row INSERT queries are sent to the
+        MySQL server as a single statement
+        """
+        with self.transaction() as db_session:
+            db_session.executemany(query, values)
+
+    @abstractmethod
+    def stream_query(self, query: str, values: tuple = (), chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE) \
+            -> Iterator[List[tuple]]:
+        """
+        Execute a query on a dedicated connection and yield its result in chunks, so the whole result set is never
+        held in memory
+        """
+        raise NotImplementedError
+
+    def close_pool(self) -> None:
+        """
+        Close all idle pooled connections
+        """
+        while True:
+            try:
+                pooled_connection = self.idle_connections.get_nowait()
+            except Empty:
+                break
+            self.discard_connection(pooled_connection)
+
+    @abstractmethod
+    def create_database_and_tables(self) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def run_migrations(self) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_epoch_bucket_sql(self, column: str) -> str:
+        """
+        Get an SQL expression which numbers the epoch-aligned buckets of a datetime column, the bucket size in seconds
+        is passed as a %s parameter
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_upsert_rollup_query(self, table: str) -> str:
+        """
+        Get the query which inserts a rollup candle or merges it into the existing candle of the same bucket. Merging
+        is order-independent: the open and close prices are only replaced by the candles with earlier first and later
+        last updates
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_delete_expired_batch_query(self, table: str, order_column: str, time_column: str) -> str:
+        """
+        Get the query which deletes the first %s rows older than %s in the given order
+        """
+        raise NotImplementedError
+
+    def is_rollup_backfilled(self) -> bool:
+        """
+        Check if the updates inserted before the rollup tables were created are rolled up. A finished backfill stays
+        finished, so the db is only queried until it is
+        """
+        if not self.rollup_backfilled:
+            query = "SELECT backfilled_update_id >= max_update_id FROM rollup_backfill WHERE id = 1"
+            res = self.execute_transaction([query], [()])
+            self.rollup_backfilled = bool(res and res[0][0])
+        return self.rollup_backfilled
+
+    def get_watchlist_assets(self) -> List[Tuple[str, int, int]]:
+        """
+        :return: list of (asset ticker, price decimals, change decimals)
+        """
+        query = "SELECT asset_ticker, price_decimals, change_decimals FROM watchlist_assets"
+        return self.execute_transaction([query], [()])
+
+    def add_watchlist_asset(self, asset_ticker: str, price_decimals: int, change_decimals: int) -> None:
+        query = "INSERT INTO watchlist_assets (price_decimals, change_decimals, asset_ticker) VALUES (%s, %s, %s)"
+        self.execute_transaction([query], [(price_decimals, change_decimals, asset_ticker)])
+
+    def update_watchlist_asset_settings(self, asset_ticker: str, price_decimals: int, change_decimals: int) -> None:
+        query = "UPDATE watchlist_assets SET price_decimals = %s, change_decimals = %s WHERE asset_ticker = %s"
+        self.execute_transaction([query], [(price_decimals, change_decimals, asset_ticker)])
+
+    def delete_watchlist_asset(self, asset_ticker: str) -> None:
+        query = "DELETE FROM watchlist_assets WHERE asset_ticker = %s"
+        self.execute_transaction([query], [(asset_ticker,)])
+
+    def get_api_keys(self) -> List[Tuple[str, str, bool]]:
+        """
+        :return: list of (name, key, active)
+        """
+        query = "SELECT name, `key`, active FROM api_keys"
+        return self.execute_transaction([query], [()])
+
+    def add_api_key(self, name: str, key: str) -> None:
+        query = "INSERT INTO api_keys (name, `key`) VALUES (%s, %s)"
+        self.execute_transaction([query], [(name, key)])
+
+    def set_active_api_key(self, previous_name: str, name: str) -> None:
+        query = "UPDATE api_keys SET active = %s WHERE name = %s"
+        self.execute_transaction([query, query], [(False, previous_name), (True, name)])
+
+    def delete_api_key(self, name: str) -> None:
+        query = "DELETE FROM api_keys WHERE name = %s"
+        self.execute_transaction([query], [(name,)])
+
+
+class MySQLDBManager(DBManager):
+    """
+    The storage engine for a MySQL server
+    """
+
+    def __init__(self, db_host: str, db_user: str, db_password: str, db_name: str, pool_size: int = DEFAULT_POOL_SIZE,
+                 use_prepared_statements: bool = False, pool_timeout: float = DEFAULT_POOL_TIMEOUT,
+                 health_check_interval: float = DEFAULT_HEALTH_CHECK_INTERVAL, partition_history: bool = False):
         self.db_host = db_host
         self.db_user = db_user
         self.db_password = db_password
         self.db_name = db_name
-        self.create_database_and_tables()
-
-    def connect_to_db(self) -> Tuple[PooledMySQLConnection | MySQLConnectionAbstract, MySQLCursorAbstract]:
-        try:
-            db_connection = connector.connect(
-                host=self.db_host,
-                user=self.db_user,
-                password=self.db_password,
-                database=self.db_name
-            )
-            db_cursor = db_connection.cursor()
-            return db_connection, db_cursor
-        except connector.Error as e:
-            print(f"Error connecting to MySQL: {e}")
+        self.partition_history = partition_history
+        super().__init__(pool_size, pool_timeout, health_check_interval, use_prepared_statements)
+        if partition_history:
+            self.partition_historical_data()
 
     @staticmethod
     def close_db_connection(db_connection, db_cursor) -> None:
@@ -36,16 +451,36 @@ class DBManager:
             db_cursor.close()
             db_connection.close()
 
-    def execute_transaction(self, queries: List[str], values: List[tuple]) -> Any:
-        db_connection, db_cursor = self.connect_to_db()
-        for i in range(len(queries)):
-            db_cursor.execute(queries[i], values[i])
-        res = db_cursor.fetchall()
-        db_connection.commit()
-        self.close_db_connection(db_connection, db_cursor)
-        return res
+    def open_connection(self) -> PooledConnection:
+        db_connection = connector.connect(host=self.db_host, user=self.db_user, password=self.db_password,
+                                          database=self.db_name)
+        return PooledConnection(db_connection)
 
-    def create_database_and_tables(self):
+    def stream_query(self, query: str, values: tuple = (), chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE) \
+            -> Iterator[List[tuple]]:
+        """
+        Execute a query on a dedicated connection and yield its result in chunks. The rows are read from the server
+        by an unbuffered cursor while the chunks are consumed, so the whole result set is never held in memory
+        """
+        db_connection = connector.connect(host=self.db_host, user=self.db_user, password=self.db_password,
+                                          database=self.db_name)
+        db_cursor = db_connection.cursor(buffered=False)
+        try:
+            db_cursor.execute(query, values)
+            while True:
+                rows = db_cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            try:
+                # Closing the connection before all rows were read discards the rest of the result set
+                db_cursor.close()
+                db_connection.close()
+            except connector.Error:
+                pass
+
+    def create_database_and_tables(self) -> None:
         """
         Creates the application db structure
         """
@@ -81,7 +516,403 @@ class DBManager:
                     change_decimals INT
                 )
             """)
+            db_cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INT PRIMARY KEY,
+                    description VARCHAR(200),
+                    applied_at DATETIME
+                )
+            """)
             db_connection.commit()
             self.close_db_connection(db_connection, db_cursor)
         except connector.Error as e:
             print(f"Error creating database or tables: {e}")
+
+    def run_migrations(self) -> None:
+        """
+        Upgrade the db schema in place by applying the migrations which are not recorded in the schema_migrations
+        table yet. A named lock prevents several app instances from applying the same migration
+        """
+        try:
+            with self.session() as db_session:
+                db_session.execute("SELECT GET_LOCK(%s, %s)", (MIGRATIONS_LOCK_NAME, MIGRATIONS_LOCK_TIMEOUT),
+                                   prepared=False)
+                try:
+                    applied = {row[0] for row in db_session.execute("SELECT version FROM schema_migrations")}
+                    for version, description, queries in MIGRATIONS:
+                        if version in applied:
+                            continue
+                        for query in queries:
+                            db_session.execute(query, prepared=False)
+                        db_session.execute("INSERT INTO schema_migrations (version, description, applied_at) "
+                                           "VALUES (%s, %s, %s)", (version, description, datetime.now()))
+                        db_session.commit()
+                        print(f"Applied db migration {version}: {description}")
+                finally:
+                    db_session.execute("SELECT RELEASE_LOCK(%s)", (MIGRATIONS_LOCK_NAME,), prepared=False)
+        except connector.Error as e:
+            print(f"Error migrating database: {e}")
+
+    def get_epoch_bucket_sql(self, column: str) -> str:
+        return f"FLOOR(UNIX_TIMESTAMP({column}) / %s)"
+
+    def get_upsert_rollup_query(self, table: str) -> str:
+        # The open and close columns have to be updated before the first_time and last_time they are compared with
+        return f"""
+            INSERT INTO {table} (asset_name, open_time, `open`, high, low, `close`, tick_count, first_time, last_time)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                `open` = IF(VALUES(first_time) < first_time, VALUES(`open`), `open`),
+                first_time = LEAST(first_time, VALUES(first_time)),
+                `close` = IF(VALUES(last_time) >= last_time, VALUES(`close`), `close`),
+                last_time = GREATEST(last_time, VALUES(last_time)),
+                high = GREATEST(high, VALUES(high)),
+                low = LEAST(low, VALUES(low)),
+                tick_count = tick_count + VALUES(tick_count)
+        """
+
+    def get_delete_expired_batch_query(self, table: str, order_column: str, time_column: str) -> str:
+        return f"DELETE FROM {table} WHERE {time_column} < %s ORDER BY {order_column} LIMIT %s"
+
+    @staticmethod
+    def to_days(day: date) -> int:
+        """
+        Python equivalent of the MySQL TO_DAYS function which is used as the partitioning expression
+        """
+        return day.toordinal() + 365
+
+    @staticmethod
+    def get_month_start(year: int, month: int) -> date:
+        """
+        Get the first day of a month, months above 12 roll over to the next years
+        """
+        return date(year + (month - 1) // 12, (month - 1) % 12 + 1, 1)
+
+    def get_history_partitions(self, db_session: DBSession) -> List[Tuple[str, Optional[int]]]:
+        """
+        Get the historical data partitions in ascending order
+        :return: list of (partition name, upper bound in days since year 0), the bound is None for the MAXVALUE
+        partition
+        """
+        query = """
+            SELECT partition_name, partition_description FROM information_schema.partitions
+            WHERE table_schema = %s AND table_name = 'historical_data' AND partition_name IS NOT NULL
+            ORDER BY partition_ordinal_position
+        """
+        rows = db_session.execute(query, (self.db_name,), prepared=False)
+        return [(name, None if bound == 'MAXVALUE' else int(bound)) for name, bound in rows]
+
+    def partition_historical_data(self, months_ahead: int = DEFAULT_PARTITION_MONTHS_AHEAD) -> None:
+        """
+        Partition the historical data table by month, so the old data can be removed by dropping whole partitions.
+        Rows older than the current month are kept in the p_old partition. Partitions are created in advance for the
+        next months_ahead months, the rest goes into the p_future partition until it is reorganized
+        """
+        today = date.today()
+        month_starts = [self.get_month_start(today.year, today.month + i) for i in range(months_ahead + 2)]
+        try:
+            with self.session() as db_session:
+                partitions = self.get_history_partitions(db_session)
+                if not partitions:
+                    definitions = [f"PARTITION p_old VALUES LESS THAN (TO_DAYS('{month_starts[0]}'))"]
+                    for i in range(months_ahead + 1):
+                        definitions.append(f"PARTITION p{month_starts[i]:%Y%m} "
+                                           f"VALUES LESS THAN (TO_DAYS('{month_starts[i + 1]}'))")
+                    definitions.append("PARTITION p_future VALUES LESS THAN MAXVALUE")
+                    # MySQL requires the partitioning column to be a part of every unique key
+                    db_session.execute("ALTER TABLE historical_data DROP PRIMARY KEY, "
+                                       "ADD PRIMARY KEY (update_id, update_time)", prepared=False)
+                    db_session.execute("ALTER TABLE historical_data PARTITION BY RANGE (TO_DAYS(update_time)) "
+                                       f"({', '.join(definitions)})", prepared=False)
+                    print(f"Partitioned historical data into {len(definitions)} partitions")
+                    return
+                bounded_partitions = [bound for name, bound in partitions if bound is not None]
+                if bounded_partitions and bounded_partitions[-1] >= self.to_days(month_starts[-1]):
+                    return
+                definitions = []
+                for i in range(months_ahead + 1):
+                    if not bounded_partitions or self.to_days(month_starts[i + 1]) > bounded_partitions[-1]:
+                        definitions.append(f"PARTITION p{month_starts[i]:%Y%m} "
+                                           f"VALUES LESS THAN (TO_DAYS('{month_starts[i + 1]}'))")
+                definitions.append("PARTITION p_future VALUES LESS THAN MAXVALUE")
+                db_session.execute("ALTER TABLE historical_data REORGANIZE PARTITION p_future "
+                                   f"INTO ({', '.join(definitions)})", prepared=False)
+        except connector.Error as e:
+            print(f"Error partitioning historical data: {e}")
+
+    def drop_history_partitions_before(self, before: datetime) -> List[str]:
+        """
+        Drop the historical data partitions which only contain rows older than the given time
+        :return: names of the dropped partitions
+        """
+        before_days = self.to_days(before.date())
+        with self.session() as db_session:
+            expired = [name for name, bound in self.get_history_partitions(db_session)
+                       if bound is not None and bound <= before_days]
+            if expired:
+                db_session.execute(f"ALTER TABLE historical_data DROP PARTITION {', '.join(expired)}",
+                                   prepared=False)
+        return expired
+
+
+def adapt_datetime(value: datetime) -> str:
+    return value.isoformat(' ')
+
+
+def convert_datetime(value: bytes) -> datetime:
+    return datetime.fromisoformat(value.decode())
+
+
+# Datetimes are stored as ISO formatted text, which is ordered like the datetimes
+sqlite3.register_adapter(datetime, adapt_datetime)
+sqlite3.register_converter('DATETIME', convert_datetime)
+
+
+class SQLiteDBManager(DBManager):
+    """
+    The embedded storage engine, the db is a single file and needs no server. The db runs in WAL mode, so the
+    history writer doesn't block the readers
+    """
+
+    def __init__(self, db_path: str = DEFAULT_SQLITE_PATH, pool_size: int = DEFAULT_POOL_SIZE,
+                 pool_timeout: float = DEFAULT_POOL_TIMEOUT):
+        self.db_path = db_path
+        super().__init__(pool_size, pool_timeout)
+
+    def connect(self) -> sqlite3.Connection:
+        # Pooled connections are used by one thread at a time, but not always by the one which opened them
+        connection = sqlite3.connect(self.db_path, timeout=self.pool_timeout, detect_types=sqlite3.PARSE_DECLTYPES,
+                                     check_same_thread=False)
+        connection.execute("PRAGMA synchronous = NORMAL")
+        return connection
+
+    def open_connection(self) -> SQLiteConnection:
+        return SQLiteConnection(self.connect())
+
+    def stream_query(self, query: str, values: tuple = (), chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE) \
+            -> Iterator[List[tuple]]:
+        """
+        Execute a query on a dedicated connection and yield its result in chunks. SQLite steps through the result
+        while the chunks are consumed, so the whole result set is never held in memory
+        """
+        connection = self.connect()
+        try:
+            cursor = connection.execute(SQLiteConnection.translate_query(query), values)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            connection.close()
+
+    def create_database_and_tables(self) -> None:
+        """
+        Creates the application db structure. The tables are created in their latest schema, so the MySQL migrations
+        don't apply to SQLite
+        """
+        connection = self.connect()
+        try:
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS api_keys (
+                    name TEXT PRIMARY KEY,
+                    `key` TEXT,
+                    active BOOLEAN DEFAULT FALSE
+                );
+                CREATE TABLE IF NOT EXISTS historical_data (
+                    update_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    asset_name TEXT,
+                    update_time DATETIME,
+                    price REAL,
+                    `change` REAL
+                );
+                CREATE INDEX IF NOT EXISTS asset_time_idx ON historical_data (asset_name, update_time);
+                CREATE TABLE IF NOT EXISTS watchlist_assets (
+                    asset_ticker TEXT PRIMARY KEY,
+                    price_decimals INTEGER,
+                    change_decimals INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS rollup_backfill (
+                    id INTEGER PRIMARY KEY,
+                    max_update_id INTEGER,
+                    backfilled_update_id INTEGER
+                );
+                INSERT OR IGNORE INTO rollup_backfill SELECT 1, COALESCE(MAX(update_id), 0), 0 FROM historical_data;
+                CREATE TABLE IF NOT EXISTS trades (
+                    update_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    asset_name TEXT,
+                    market TEXT,
+                    trade_time DATETIME,
+                    side INTEGER,
+                    trade_id TEXT,
+                    price REAL,
+                    quantity REAL,
+                    total REAL
+                );
+                CREATE INDEX IF NOT EXISTS trades_asset_time_idx ON trades (asset_name, trade_time);
+                CREATE TABLE IF NOT EXISTS top_of_book (
+                    update_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    asset_name TEXT,
+                    market TEXT,
+                    update_time DATETIME,
+                    bid REAL,
+                    bid_quantity REAL,
+                    ask REAL,
+                    ask_quantity REAL
+                );
+                CREATE INDEX IF NOT EXISTS top_of_book_asset_time_idx ON top_of_book (asset_name, update_time);
+            """)
+            for table in ('candles_1m', 'candles_1h'):
+                connection.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        asset_name TEXT,
+                        open_time DATETIME,
+                        `open` REAL,
+                        high REAL,
+                        low REAL,
+                        `close` REAL,
+                        tick_count INTEGER,
+                        first_time DATETIME,
+                        last_time DATETIME,
+                        PRIMARY KEY (asset_name, open_time)
+                    )
+                """)
+            connection.commit()
+        finally:
+            connection.close()
+
+    def run_migrations(self) -> None:
+        pass
+
+    def get_epoch_bucket_sql(self, column: str) -> str:
+        # Integer division of the positive epoch seconds rounds down
+        return f"(CAST(strftime('%%s', {column}, 'utc') AS INTEGER) / %s)"
+
+    def get_upsert_rollup_query(self, table: str) -> str:
+        # SQLite evaluates all the SET expressions with the old column values
+        return f"""
+            INSERT INTO {table} (asset_name, open_time, `open`, high, low, `close`, tick_count, first_time, last_time)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (asset_name, open_time) DO UPDATE SET
+                `open` = CASE WHEN excluded.first_time < first_time THEN excluded.`open` ELSE `open` END,
+                first_time = MIN(first_time, excluded.first_time),
+                `close` = CASE WHEN excluded.last_time >= last_time THEN excluded.`close` ELSE `close` END,
+                last_time = MAX(last_time, excluded.last_time),
+                high = MAX(high, excluded.high),
+                low = MIN(low, excluded.low),
+                tick_count = tick_count + excluded.tick_count
+        """
+
+    def get_delete_expired_batch_query(self, table: str, order_column: str, time_column: str) -> str:
+        return f"""
+            DELETE FROM {table} WHERE rowid IN (
+                SELECT rowid FROM {table} WHERE {time_column} < %s ORDER BY {order_column} LIMIT %s
+            )
+        """
+
+
+def create_db_manager(db_engine: str = DEFAULT_DB_ENGINE, db_host: str = '', db_user: str = '', db_password: str = '',
+                      db_name: str = '', sqlite_path: str = DEFAULT_SQLITE_PATH, pool_size: int = DEFAULT_POOL_SIZE,
+                      use_prepared_statements: bool = False, partition_history: bool = False) -> DBManager:
+    """
+    Create the storage engine selected in the config
+    :param db_engine: 'mysql' or 'sqlite'
+    :param sqlite_path: SQLite db file, the MySQL settings are ignored by the SQLite engine
+    """
+    if db_engine == 'mysql':
+        return MySQLDBManager(db_host, db_user, db_password, db_name, pool_size, use_prepared_statements,
+                              partition_history=partition_history)
+    if db_engine == 'sqlite':
+        return SQLiteDBManager(sqlite_path, pool_size)
+    raise ValueError(f'Unknown db engine {db_engine!r}, supported engines are {DB_ENGINES}')
+
+
+class RetentionManager:
+    """
+    The class periodically removes raw price updates older than the retention period, older data stays available as
+    rollup candles. Rows are deleted in small batches with pauses in between, so the table is never locked for long.
+    Whole monthly partitions are dropped instead when the historical data table is partitioned
+    """
+
+    def __init__(self, db_manager: DBManager, raw_retention_days: int, rollup_1m_retention_days: Optional[int] = None,
+                 batch_size: int = DEFAULT_RETENTION_BATCH_SIZE, interval: float = DEFAULT_RETENTION_INTERVAL,
+                 batch_pause: float = DEFAULT_RETENTION_BATCH_PAUSE):
+        self.db_manager = db_manager
+        self.raw_retention_days = raw_retention_days
+        self.rollup_1m_retention_days = rollup_1m_retention_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.batch_pause = batch_pause
+        self.removed_rows = 0
+        self.dropped_partitions = 0
+        self.time_spent = 0.0
+        self.backfill_warning_printed = False
+
+    def delete_expired_batch(self, table: str, order_column: str, time_column: str, cutoff: datetime) -> int:
+        """
+        Delete a single batch of rows older than the cutoff
+        :return: number of deleted rows
+        """
+        query = self.db_manager.get_delete_expired_batch_query(table, order_column, time_column)
+        with self.db_manager.transaction() as db_session:
+            db_session.execute(query, (cutoff, self.batch_size), prepared=False)
+            return db_session.rowcount
+
+    async def delete_expired(self, table: str, order_column: str, time_column: str, cutoff: datetime) -> int:
+        """
+        Delete all rows older than the cutoff batch by batch
+        :return: number of deleted rows
+        """
+        removed = 0
+        while True:
+            batch_removed = await asyncio.to_thread(self.delete_expired_batch, table, order_column, time_column,
+                                                    cutoff)
+            removed += batch_removed
+            if batch_removed < self.batch_size:
+                return removed
+            await asyncio.sleep(self.batch_pause)
+
+    async def run_once(self) -> Dict[str, float]:
+        """
+        Apply the retention policy once
+        :return: removed rows, dropped partitions and time spent in seconds
+        """
+        start_time = monotonic()
+        removed = 0
+        dropped = 0
+        now = datetime.now()
+        raw_cutoff = now - timedelta(days=self.raw_retention_days)
+        # Removing the updates which are not rolled up yet would lose the data
+        if await asyncio.to_thread(self.db_manager.is_rollup_backfilled):
+            if self.db_manager.partition_history:
+                dropped = len(await asyncio.to_thread(self.db_manager.drop_history_partitions_before, raw_cutoff))
+            removed += await self.delete_expired('historical_data', 'update_id', 'update_time', raw_cutoff)
+        elif not self.backfill_warning_printed:
+            print("Raw historical data is kept until the rollups are backfilled, run backfill_rollups.py")
+            self.backfill_warning_printed = True
+        # Trades and top of book updates are not rolled up
+        for table, time_column in CHANNEL_TABLES:
+            removed += await self.delete_expired(table, 'update_id', time_column, raw_cutoff)
+        if self.rollup_1m_retention_days is not None:
+            rollup_cutoff = now - timedelta(days=self.rollup_1m_retention_days)
+            removed += await self.delete_expired('candles_1m', 'asset_name, open_time', 'open_time', rollup_cutoff)
+        time_spent = monotonic() - start_time
+        self.removed_rows += removed
+        self.dropped_partitions += dropped
+        self.time_spent += time_spent
+        return {'removed_rows': removed, 'dropped_partitions': dropped, 'time_spent': time_spent}
+
+    async def run(self) -> None:
+        """
+        Apply the retention policy every interval seconds
+        """
+        while True:
+            try:
+                stats = await self.run_once()
+                if stats['removed_rows'] or stats['dropped_partitions']:
+                    print(f"Retention removed {stats['removed_rows']} rows and {stats['dropped_partitions']} "
+                          f"partitions in {stats['time_spent']:.2f} s")
+            except DB_ERRORS as e:
+                print(f"Error applying retention policy: {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,270 @@
+import csv
+import shutil
+import zipfile
+from abc import ABC, abstractmethod
+from os import path, remove
+from tempfile import TemporaryFile
+from datetime import datetime
+from threading import Event
+from typing import Iterable, List, Optional, Callable, Tuple, Dict, Type, Any
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+from backend.db_management import DBManager, DEFAULT_STREAM_CHUNK_SIZE
+from backend.market_data_management import iter_historical_data, get_candles
+
+DATETIME_FORMAT = '%Y-%m-%d_%H:%M:%S'
+
+ExportColumn = Tuple[str, str]  # (column name, column kind: 'time', 'float' or 'int')
+HISTORICAL_DATA_COLUMNS: List[ExportColumn] = [('update_time', 'time'), ('price', 'float'), ('change', 'float')]
+CANDLE_COLUMNS: List[ExportColumn] = [('open_time', 'time'), ('open', 'float'), ('high', 'float'), ('low', 'float'),
+                                      ('close', 'float'), ('tick_count', 'int')]
+
+
+class ExportCancelled(Exception):
+    """
+    Raised when the export is cancelled by the user
+    """
+
+
+class UnsupportedExportFormat(Exception):
+    """
+    Raised when there is no exporter for the output file extension
+    """
+
+
+def datetime_to_epoch_ns(value: datetime) -> int:
+    """
+    Convert a naive local datetime to nanoseconds since the epoch
+    """
+    return int(value.timestamp()) * 1_000_000_000 + value.microsecond * 1000
+
+
+def get_column_array(rows: List[tuple], index: int, kind: str) -> np.ndarray:
+    """
+    Get a typed array of a single column from a chunk of rows. Time columns are converted to int64 nanoseconds since
+    the epoch
+    """
+    if kind == 'time':
+        return np.fromiter((datetime_to_epoch_ns(row[index]) for row in rows), dtype=np.int64, count=len(rows))
+    dtype = np.float64 if kind == 'float' else np.int64
+    return np.fromiter((row[index] for row in rows), dtype=dtype, count=len(rows))
+
+
+class HistoricalDataExporter(ABC):
+    """
+    Base class for the historical data file writers. The data is written chunk by chunk, so an exporter never holds
+    more than a single chunk of rows in memory
+    """
+    extensions: Tuple[str, ...] = ()
+
+    def __init__(self, output_filename: str, asset_name: str, columns: List[ExportColumn]):
+        self.output_filename = output_filename
+        self.asset_name = asset_name
+        self.columns = columns
+
+    @abstractmethod
+    def write_chunk(self, rows: List[tuple]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def close(self) -> None:
+        raise NotImplementedError
+
+    def abort(self) -> None:
+        """
+        Close the exporter and remove the partially written file
+        """
+        try:
+            self.close()
+        finally:
+            if path.isfile(self.output_filename):
+                remove(self.output_filename)
+
+
+class CSVExporter(HistoricalDataExporter):
+    """
+    Writes rows to a csv file with formatted timestamps
+    """
+    extensions = ('.csv',)
+
+    def __init__(self, output_filename: str, asset_name: str, columns: List[ExportColumn]):
+        super().__init__(output_filename, asset_name, columns)
+        self.file = open(output_filename, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(['Asset'] + [name.capitalize() for name, kind in columns])
+        self.time_indexes = [i for i, (name, kind) in enumerate(columns) if kind == 'time']
+
+    def format_row(self, row: tuple) -> List[Any]:
+        formatted = [self.asset_name, *row]
+        for i in self.time_indexes:
+            formatted[i + 1] = row[i].strftime(DATETIME_FORMAT)
+        return formatted
+
+    def write_chunk(self, rows: List[tuple]) -> None:
+        self.writer.writerows(self.format_row(row) for row in rows)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class ArrowExporter(HistoricalDataExporter):
+    """
+    Writes typed record batches to an Arrow IPC file. Requires pyarrow
+    """
+    extensions = ('.arrow', '.feather')
+
+    def __init__(self, output_filename: str, asset_name: str, columns: List[ExportColumn]):
+        super().__init__(output_filename, asset_name, columns)
+        types = {'time': pa.int64(), 'float': pa.float64(), 'int': pa.int64()}
+        self.schema = pa.schema([(name, types[kind]) for name, kind in columns], metadata={'asset': asset_name})
+        self.writer = self.open_writer()
+
+    def open_writer(self) -> Any:
+        return pa.ipc.new_file(self.output_filename, self.schema)
+
+    def write_chunk(self, rows: List[tuple]) -> None:
+        arrays = [pa.array(get_column_array(rows, i, kind)) for i, (name, kind) in enumerate(self.columns)]
+        self.writer.write_batch(pa.record_batch(arrays, schema=self.schema))
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class ParquetExporter(ArrowExporter):
+    """
+    Writes every chunk as a Parquet row group. Requires pyarrow
+    """
+    extensions = ('.parquet',)
+
+    def open_writer(self) -> Any:
+        return pq.ParquetWriter(self.output_filename, self.schema)
+
+    def write_chunk(self, rows: List[tuple]) -> None:
+        arrays = [pa.array(get_column_array(rows, i, kind)) for i, (name, kind) in enumerate(self.columns)]
+        self.writer.write_table(pa.table(arrays, schema=self.schema))
+
+
+class NPZExporter(HistoricalDataExporter):
+    """
+    Writes every column as a NumPy array of an .npz archive, the asset name is saved as the 'asset' array. Columns
+    are buffered in temporary files until the row count needed for the array headers is known
+    """
+    extensions = ('.npz',)
+
+    def __init__(self, output_filename: str, asset_name: str, columns: List[ExportColumn]):
+        super().__init__(output_filename, asset_name, columns)
+        self.column_files = [TemporaryFile() for _ in columns]
+        self.dtypes = [np.dtype(np.float64 if kind == 'float' else np.int64) for name, kind in columns]
+        self.row_count = 0
+
+    def write_chunk(self, rows: List[tuple]) -> None:
+        for i, (name, kind) in enumerate(self.columns):
+            self.column_files[i].write(get_column_array(rows, i, kind).tobytes())
+        self.row_count += len(rows)
+
+    def close(self) -> None:
+        if self.column_files[0].closed:
+            return
+        try:
+            with zipfile.ZipFile(self.output_filename, 'w', allowZip64=True) as archive:
+                for (name, kind), dtype, column_file in zip(self.columns, self.dtypes, self.column_files):
+                    with archive.open(f'{name}.npy', 'w', force_zip64=True) as f:
+                        header = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                                  'shape': (self.row_count,)}
+                        np.lib.format.write_array_header_1_0(f, header)
+                        column_file.seek(0)
+                        shutil.copyfileobj(column_file, f)
+                with archive.open('asset.npy', 'w') as f:
+                    np.lib.format.write_array(f, np.array(self.asset_name))
+        finally:
+            for column_file in self.column_files:
+                column_file.close()
+
+    def abort(self) -> None:
+        for column_file in self.column_files:
+            column_file.close()
+        if path.isfile(self.output_filename):
+            remove(self.output_filename)
+
+
+def get_exporters() -> Dict[str, Type[HistoricalDataExporter]]:
+    """
+    Get the available exporters by output file extension. Arrow based formats are only available with pyarrow
+    installed
+    """
+    exporters = [CSVExporter, NPZExporter]
+    if pa is not None:
+        exporters += [ArrowExporter, ParquetExporter]
+    return {extension: exporter for exporter in exporters for extension in exporter.extensions}
+
+
+def get_exporter_class(output_filename: str) -> Type[HistoricalDataExporter]:
+    """
+    Pick the exporter by the output file extension
+    """
+    exporters = get_exporters()
+    extension = path.splitext(output_filename)[1].lower()
+    if extension not in exporters:
+        raise UnsupportedExportFormat(f'Unsupported file format, supported formats are {", ".join(exporters)}')
+    return exporters[extension]
+
+
+def export_chunks(exporter: HistoricalDataExporter, chunks: Iterable[List[tuple]],
+                  progress_callback: Optional[Callable[[int], None]] = None,
+                  cancel_event: Optional[Event] = None) -> None:
+    """
+    Write chunks of rows with the exporter. The partially written file is removed if the export fails or is
+    cancelled
+    :param progress_callback: called with the number of exported rows after every chunk
+    :param cancel_event: stops the export between chunks when set
+    """
+    processed = 0
+    try:
+        for chunk in chunks:
+            if cancel_event is not None and cancel_event.is_set():
+                raise ExportCancelled()
+            exporter.write_chunk(chunk)
+            processed += len(chunk)
+            if progress_callback is not None:
+                progress_callback(processed)
+        exporter.close()
+    except BaseException:
+        exporter.abort()
+        raise
+
+
+def export_historical_data(db_manager: DBManager, asset_name: str, start_date: datetime, end_date: datetime,
+                           output_filename: str, progress_callback: Optional[Callable[[int], None]] = None,
+                           cancel_event: Optional[Event] = None, chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE) -> None:
+    """
+    Stream the historical data for a specific asset within a given date range from the db to a file. The file format
+    is picked by the output file extension
+    """
+    exporter_class = get_exporter_class(output_filename)
+    chunks = iter_historical_data(db_manager, asset_name, start_date, end_date, chunk_size)
+    try:
+        export_chunks(exporter_class(output_filename, asset_name, HISTORICAL_DATA_COLUMNS), chunks,
+                      progress_callback, cancel_event)
+    finally:
+        chunks.close()
+
+
+def export_candles(db_manager: DBManager, asset_name: str, start_date: datetime, end_date: datetime, interval: str,
+                   output_filename: str, progress_callback: Optional[Callable[[int], None]] = None,
+                   cancel_event: Optional[Event] = None, chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE) -> None:
+    """
+    Aggregate the historical data for a specific asset within a given date range into OHLC candles and save them to
+    a file. The file format is picked by the output file extension
+    """
+    exporter_class = get_exporter_class(output_filename)
+    candles = get_candles(db_manager, asset_name, start_date, end_date, interval)
+    chunks = (candles[i:i + chunk_size] for i in range(0, len(candles), chunk_size))
+    export_chunks(exporter_class(output_filename, asset_name, CANDLE_COLUMNS), chunks, progress_callback,
+                  cancel_event)
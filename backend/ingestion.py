@@ -0,0 +1,264 @@
+import asyncio
+import multiprocessing
+from queue import Full
+from itertools import count
+from threading import Thread, Lock
+from typing import Dict, Iterable, Optional, Any, List, Sequence, Callable, Tuple
+
+from backend.db_management import DBManager, create_db_manager
+from backend.market_data_management import WSManager, BatchWriter, DEFAULT_HISTORY_FLUSH_INTERVAL, \
+    DEFAULT_HISTORY_BATCH_SIZE, DEFAULT_HISTORY_QUEUE_SIZE, DEFAULT_WS_URL, DEFAULT_WS_CONNECTIONS, \
+    DEFAULT_TICK_BUFFER_SIZE, DEFAULT_WS_CHANNELS, DEFAULT_WS_EXCHANGES, CHANNEL_INSERTS, RecentTicksSummary, \
+    check_ws_channels, insert_many_to_historical_data
+from backend.ws_replay import WSRecorder
+from backend.market_updates import MarketUpdateSink, MarketUpdateQueue, MarketUpdate
+from backend.ws_decoding import get_decoder
+
+INGESTION_MODES = ('thread', 'process')
+DEFAULT_INGESTION_MODE = 'thread'
+UPDATE_BATCHES_QUEUE_SIZE = 64  # Max update batches waiting to be sent from the ingestion process
+FORWARD_INTERVAL = 0.01  # seconds, min time between update batches sent from the ingestion process
+PROCESS_STOP_TIMEOUT = 30.0  # seconds
+
+
+class IngestionService:
+    """
+    The class runs the websocket client, the message processing and the batched history writer in a single asyncio
+    loop, which is either the background thread of the app, a separate process or the headless collector. Parsed
+    market data is passed to the market update sink
+    """
+
+    def __init__(self, db_manager: DBManager, market_updates: MarketUpdateSink, api_keys: List[str],
+                 assets: Iterable[str], history_flush_interval: float = DEFAULT_HISTORY_FLUSH_INTERVAL,
+                 history_batch_size: int = DEFAULT_HISTORY_BATCH_SIZE,
+                 history_queue_size: int = DEFAULT_HISTORY_QUEUE_SIZE, ws_decoder: Optional[str] = None,
+                 ws_url: str = DEFAULT_WS_URL, ws_record_file: Optional[str] = None,
+                 ws_connections: int = DEFAULT_WS_CONNECTIONS, tick_buffer_size: int = DEFAULT_TICK_BUFFER_SIZE,
+                 ws_channels: Sequence[str] = DEFAULT_WS_CHANNELS, ws_exchanges: Sequence[str] = DEFAULT_WS_EXCHANGES,
+                 print_stats: bool = False):
+        """
+        :param api_keys: API keys of the websocket connections, the active key first
+        :param ws_decoder: websocket message decoder name, None picks the fastest available decoder
+        :param ws_url: streamer url, a local replay server doesn't need an API key
+        :param ws_record_file: record the received websocket frames to this file
+        :param ws_connections: number of websocket connections the subscriptions are spread over
+        :param tick_buffer_size: recent ticks kept in memory per asset
+        :param ws_channels: subscribed websocket channels, the trades and top of book are written to their own tables
+        :param ws_exchanges: exchanges of the trade and top of book subscriptions
+        :param print_stats: print the websocket and db writer counters when the service is stopped
+        """
+        self.history_writer = BatchWriter(db_manager, 'historical data', insert_many_to_historical_data,
+                                          history_flush_interval, history_batch_size, history_queue_size)
+        # The other channels are written by their own writers with the same batching settings
+        self.channel_writers = {
+            channel: BatchWriter(db_manager, channel.replace('_', ' '), CHANNEL_INSERTS[channel],
+                                 history_flush_interval, history_batch_size, history_queue_size)
+            for channel in ws_channels if channel in CHANNEL_INSERTS
+        }
+        self.recorder = WSRecorder(ws_record_file) if ws_record_file is not None else None
+        self.ws_manager = WSManager(market_updates, self.history_writer, api_keys, assets, get_decoder(ws_decoder),
+                                    ws_url, self.recorder, ws_connections, tick_buffer_size, ws_channels,
+                                    ws_exchanges, self.channel_writers)
+        self.print_stats = print_stats
+        self.task_group: Optional[asyncio.TaskGroup] = None
+        self.ws_task: Optional[asyncio.Task] = None
+
+    def subscribe_asset(self, asset_ticker: str) -> None:
+        self.ws_manager.subscribe_asset(asset_ticker)
+
+    def unsubscribe_asset(self, asset_ticker: str) -> None:
+        self.ws_manager.unsubscribe_asset(asset_ticker)
+
+    def get_recent_ticks_summary(self, asset_ticker: str, seconds: float, points: int) -> Optional[RecentTicksSummary]:
+        """
+        Summarize the asset ticks received in the last seconds from the in-memory tick buffer, sent with queries
+        """
+        return self.ws_manager.get_recent_ticks_summary(asset_ticker, seconds, points)
+
+    def start_ws(self) -> None:
+        self.ws_task = self.task_group.create_task(self.ws_manager.ws_subscribe())
+
+    def stop_ws(self) -> None:
+        if self.ws_task is not None:
+            self.ws_task.cancel()
+            self.ws_manager.stop_active_ws()
+            self.ws_task = None
+
+    def restart_ws(self, api_keys: List[str]) -> None:
+        """
+        Reconnect the websocket connections with new API keys, no keys only stop them
+        """
+        self.stop_ws()
+        if any(api_keys):
+            self.ws_manager.set_api_keys(api_keys)
+            self.start_ws()
+
+    def stop(self) -> None:
+        self.stop_ws()
+        self.history_writer.stop()  # The writer flushes queued updates before run returns
+        for writer in self.channel_writers.values():
+            writer.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.print_stats:
+            print(f'Websocket stopped: {self.ws_manager.stats()}')
+
+    async def run(self) -> None:
+        """
+        Run the history writer and the websocket subscription until the service is stopped
+        """
+        async with asyncio.TaskGroup() as tg:
+            self.task_group = tg
+            tg.create_task(self.history_writer.run())
+            for writer in self.channel_writers.values():
+                tg.create_task(writer.run())
+            if self.ws_manager.has_api_key() or self.ws_manager.ws_url != DEFAULT_WS_URL:
+                self.start_ws()
+        if self.print_stats:
+            # The writers have flushed their queues by now
+            for writer in (self.history_writer, *self.channel_writers.values()):
+                print(f'{writer.name.capitalize()} writer stopped: {writer.stats()}')
+
+
+async def forward_updates(market_updates: MarketUpdateQueue, pending_event: asyncio.Event,
+                          update_batches: multiprocessing.Queue) -> None:
+    """
+    Send the pending market updates to the app process in batches. The batches which don't fit into the full queue
+    are put back and coalesced with the newer updates
+    """
+    while True:
+        await pending_event.wait()
+        pending_event.clear()
+        updates = market_updates.drain()
+        if updates:
+            try:
+                update_batches.put_nowait(updates)
+            except Full:
+                market_updates.restore(updates)
+        await asyncio.sleep(FORWARD_INTERVAL)
+
+
+async def run_ingestion(db_settings: Dict[str, Any], service_settings: Dict[str, Any], api_keys: List[str],
+                        assets: Iterable[str], commands: multiprocessing.Queue, update_batches: multiprocessing.Queue,
+                        query_results: multiprocessing.Queue) -> None:
+    db_manager = create_db_manager(**db_settings)
+    pending_event = asyncio.Event()
+    market_updates = MarketUpdateQueue(pending_event.set)
+    service = IngestionService(db_manager, market_updates, api_keys, assets, **service_settings)
+
+    async def handle_commands():
+        while True:
+            command, *args = await asyncio.to_thread(commands.get)
+            if command == 'query':
+                # ('query', query id, service method name, *args), the result is sent back with the query id
+                query_id, query, *args = args
+                query_results.put((query_id, getattr(service, query)(*args)))
+                continue
+            getattr(service, command)(*args)
+            if command == 'stop':
+                forwarder_task.cancel()
+                return
+
+    try:
+        async with asyncio.TaskGroup() as tg:
+            forwarder_task = tg.create_task(forward_updates(market_updates, pending_event, update_batches))
+            tg.create_task(service.run())
+            tg.create_task(handle_commands())
+    finally:
+        db_manager.close_pool()
+
+
+def run_ingestion_process(db_settings: Dict[str, Any], service_settings: Dict[str, Any], api_keys: List[str],
+                          assets: Iterable[str], commands: multiprocessing.Queue, update_batches: multiprocessing.Queue,
+                          query_results: multiprocessing.Queue) -> None:
+    """
+    Entrypoint of the ingestion process
+    """
+    asyncio.run(run_ingestion(db_settings, service_settings, api_keys, assets, commands, update_batches,
+                              query_results))
+
+
+class IngestionProcess:
+    """
+    The class runs the ingestion service in a separate process, so neither a message burst nor a slow db can take
+    CPU time from the UI process. Commands are sent with the names of the IngestionService methods, market updates
+    come back in batches and are put into the market update queue of the app by a receiver thread. Queries are
+    IngestionService methods whose results are sent back, their callbacks are called by another receiver thread
+    """
+
+    def __init__(self, market_updates: MarketUpdateQueue, db_settings: Dict[str, Any],
+                 service_settings: Dict[str, Any], api_keys: List[str], assets: Iterable[str]):
+        """
+        :param db_settings: create_db_manager arguments
+        :param service_settings: IngestionService history writer and websocket arguments
+        """
+        # Fail in the app process if the decoder or a channel is not available
+        get_decoder(service_settings.get('ws_decoder'))
+        check_ws_channels(service_settings.get('ws_channels', ()))
+        self.market_updates = market_updates
+        # The app process has Tk and the asyncio thread running, so the ingestion process is spawned, not forked
+        context = multiprocessing.get_context('spawn')
+        self.commands = context.Queue()
+        self.update_batches = context.Queue(maxsize=UPDATE_BATCHES_QUEUE_SIZE)
+        self.query_results = context.Queue()
+        self.query_ids = count()
+        self.query_callbacks: Dict[int, Callable[[Any], None]] = {}
+        self.query_callbacks_lock = Lock()
+        self.process = context.Process(target=run_ingestion_process, name='ingestion', daemon=True,
+                                       args=(db_settings, service_settings, list(api_keys), list(assets), self.commands,
+                                             self.update_batches, self.query_results))
+        self.receiver_thread = Thread(target=self.receive_updates, name='ingestion-receiver', daemon=True)
+        self.query_receiver_thread = Thread(target=self.receive_query_results, name='ingestion-query-receiver',
+                                            daemon=True)
+
+    def start(self) -> None:
+        self.process.start()
+        self.receiver_thread.start()
+        self.query_receiver_thread.start()
+
+    def send_command(self, command: str, *args) -> None:
+        self.commands.put((command, *args))
+
+    def send_query(self, query: str, args: tuple, callback: Callable[[Any], None]) -> None:
+        """
+        Call an IngestionService method in the ingestion process, the callback is called with its result in the query
+        receiver thread. The queries of a stopped process are never answered
+        """
+        with self.query_callbacks_lock:
+            query_id = next(self.query_ids)
+            self.query_callbacks[query_id] = callback
+        self.send_command('query', query_id, query, *args)
+
+    def receive_query_results(self) -> None:
+        while True:
+            query_result: Optional[Tuple[int, Any]] = self.query_results.get()
+            if query_result is None:
+                return
+            query_id, result = query_result
+            with self.query_callbacks_lock:
+                callback = self.query_callbacks.pop(query_id)
+            callback(result)
+
+    def receive_updates(self) -> None:
+        while True:
+            updates: Optional[Dict[str, MarketUpdate]] = self.update_batches.get()
+            if updates is None:
+                return
+            self.market_updates.put_many(updates)
+
+    def stop(self) -> None:
+        """
+        Stop the ingestion process after it flushes the queued history updates
+        """
+        if not self.process.is_alive():
+            return
+        self.send_command('stop')
+        self.process.join(PROCESS_STOP_TIMEOUT)
+        if self.process.is_alive():
+            print('Ingestion process did not stop in time, terminating it')
+            self.process.terminate()
+            self.process.join()
+        self.update_batches.put(None)
+        self.query_results.put(None)
+        self.receiver_thread.join()
+        self.query_receiver_thread.join()
@@ -1,66 +1,101 @@
 import websockets
 import json
 import asyncio
-from typing import Dict, Union, Optional, List, Set
+import numpy as np
+from typing import Dict, Union, Optional, List, Set, Tuple, Iterator, Deque, Iterable, Callable, Sequence, Any
+from collections import deque
 from datetime import datetime
-import requests
-from os.path import isfile
-from PIL import Image
-from io import BytesIO
+from time import monotonic, time, perf_counter
 
-import frontend.main_app
-from backend.db_management import DBManager
+from backend.db_management import DBManager, DB_ERRORS, DEFAULT_STREAM_CHUNK_SIZE
+from backend.market_updates import MarketUpdateSink
+from backend.market_state import MarketState
+from backend.ws_replay import WSRecorder
+from backend.ws_decoding import WSMessageDecoder, WSMessage, AggIndexUpdate, AGG_INDEX_UPDATE_TYPE, TRADE_TYPE, \
+    TOP_OF_BOOK_TYPE, get_decoder, get_message_type, get_agg_index_update, get_trade_update, get_top_of_book_update
+from backend.rollups import RollupAccumulator, upsert_rollups, get_rollup_table, get_rollup_candles, to_candles
 
+DEFAULT_HISTORY_FLUSH_INTERVAL = 1.0  # seconds
+DEFAULT_HISTORY_BATCH_SIZE = 500
+DEFAULT_HISTORY_QUEUE_SIZE = 100000
+DEFAULT_WS_URL = 'wss://streamer.cryptocompare.com/v2'
+# seconds, the unread frames of a busy stream can delay the closing handshake, so it is not waited for long
+WS_CLOSE_TIMEOUT = 1.0
+DEFAULT_WS_CONNECTIONS = 1
+DEFAULT_TICK_BUFFER_SIZE = 3600  # recent ticks kept in memory per asset
+QUOTE_SYMBOL = 'USD'
+WS_CHANNELS = ('agg_index', 'trades', 'top_of_book')
+DEFAULT_WS_CHANNELS = ('agg_index',)
+DEFAULT_WS_EXCHANGES = ('Coinbase',)  # Exchanges of the trade and top of book subscriptions
 
-def download_asset_icon(asset_ticker: str, icon_path: str, api_key: str) -> bool:
+HistoricalDataRow = Tuple[str, datetime, float, float]  # (asset_name, update_time, price, change)
+# (asset_name, market, trade_time, side, trade_id, price, quantity, total)
+TradeRow = Tuple[str, str, datetime, int, str, float, float, float]
+# (asset_name, market, update_time, bid, bid_quantity, ask, ask_quantity)
+TopOfBookRow = Tuple[str, str, datetime, Optional[float], Optional[float], Optional[float], Optional[float]]
+Candle = Tuple[datetime, float, float, float, float, int]  # (open_time, open, high, low, close, tick_count)
+# {'tick_count', 'first_time' and 'last_time' in epoch ms, 'open', 'high', 'low', 'close', 'sparkline': prices}
+RecentTicksSummary = Dict[str, Any]
+CANDLE_INTERVALS = {'1m': 60, '5m': 300, '1h': 3600, '1d': 86400}  # seconds
+
+
+def insert_to_historical_data(db_manager: DBManager, asset_name: str, price: int, update_time: datetime, change: float):
     """
-    Download the asset icon using the CryptoCompare API
-    :param asset_ticker: asset ticker
-    :param icon_path: path to save the downloaded icon
-    :param api_key: CryptoCompare API key
+    Insert a single asset update to the historical data table
     """
-    url = f'https://data-api.cryptocompare.com/asset/v1/data/by/symbol?asset_symbol={asset_ticker}&api_key={api_key}'
-    if not isfile(icon_path):
-        try:
-            response = requests.get(url)
-            response.raise_for_status()  # Raise an exception for 4xx or 5xx status codes just in case :)
-            asset_data = response.json()
-            logo_url = asset_data['Data']['LOGO_URL']
-            logo_response = requests.get(logo_url)
-            logo_response.raise_for_status()  # Same as comment above
-            image = Image.open(BytesIO(logo_response.content), formats=('PNG',))
-            image.save(icon_path)
-            return True
-        except requests.HTTPError:
-            return False
-    else:
-        return True
+    query = "INSERT INTO historical_data (asset_name, update_time, price, `change`) VALUES (%s, %s, %s, %s)"
+    values = (asset_name, update_time, price, change)
+    db_manager.execute_transaction([query], [values])
 
 
-def get_valid_assets() -> Set[str]:
+def insert_many_to_historical_data(db_manager: DBManager, rows: List[HistoricalDataRow]) -> None:
     """
-    Get a set of all available coins from the CryptoCompare API
+    Insert a batch of asset updates to the historical data table using a single multi-row INSERT and merge them into
+    the rollup tables in the same transaction
     """
-    url = 'https://min-api.cryptocompare.com/data/all/coinlist?summary=true'
-    try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an exception for 4xx or 5xx status codes just in case :)
-        data = response.json()['Data']
-        coins = set()
-        for key in data:
-            coins.add(data[key]['Symbol'])
-        return coins
-    except requests.exceptions.RequestException as e:
-        print(e)
+    query = "INSERT INTO historical_data (asset_name, update_time, price, `change`) VALUES (%s, %s, %s, %s)"
+    accumulator = RollupAccumulator()
+    for asset_name, update_time, price, change in rows:
+        accumulator.add(asset_name, update_time, price)
+    with db_manager.transaction() as db_session:
+        db_session.executemany(query, rows)
+        upsert_rollups(db_manager, db_session, accumulator)
 
 
-def insert_to_historical_data(db_manager: DBManager, asset_name: str, price: int, update_time: datetime, change: float):
+def insert_many_trades(db_manager: DBManager, rows: List[TradeRow]) -> None:
     """
-    Insert a single asset update to the historical data table
+    Insert a batch of trade prints to the trades table
     """
-    query = "INSERT INTO historical_data (asset_name, update_time, price, `change`) VALUES (%s, %s, %s, %s)"
-    values = (asset_name, update_time, price, change)
-    db_manager.execute_transaction([query], [values])
+    query = ("INSERT INTO trades (asset_name, market, trade_time, side, trade_id, price, quantity, total) "
+             "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)")
+    with db_manager.transaction() as db_session:
+        db_session.executemany(query, rows)
+
+
+def insert_many_top_of_book(db_manager: DBManager, rows: List[TopOfBookRow]) -> None:
+    """
+    Insert a batch of top of book updates to the top of book table
+    """
+    query = ("INSERT INTO top_of_book (asset_name, market, update_time, bid, bid_quantity, ask, ask_quantity) "
+             "VALUES (%s, %s, %s, %s, %s, %s, %s)")
+    with db_manager.transaction() as db_session:
+        db_session.executemany(query, rows)
+
+
+# Batch insert functions of the persisted websocket channels besides the aggregated index
+CHANNEL_INSERTS: Dict[str, Callable[[DBManager, List[tuple]], None]] = {
+    'trades': insert_many_trades,
+    'top_of_book': insert_many_top_of_book
+}
+
+
+def check_ws_channels(channels: Iterable[str]) -> None:
+    """
+    :raise ValueError: if a channel is not supported
+    """
+    for channel in channels:
+        if channel not in WS_CHANNELS:
+            raise ValueError(f'Unknown websocket channel {channel!r}, supported channels are {WS_CHANNELS}')
 
 
 def get_historical_data(db_manager: DBManager, asset_name: str, start_date: datetime,
@@ -75,77 +110,714 @@ def get_historical_data(db_manager: DBManager, asset_name: str, start_date: date
     return result
 
 
-class WSManager:
+def get_candles(db_manager: DBManager, asset_name: str, start_date: datetime, end_date: datetime,
+                interval: str, use_rollups: bool = True) -> List[Candle]:
+    """
+    Aggregate the historical data for a specific asset within a given date range into OHLC candles in the db.
+    Candles are aligned to the epoch, so daily candles start at midnight UTC. Open and close prices are taken from the
+    first and the last inserted update of the candle
+    :param interval: candle interval, one of the CANDLE_INTERVALS keys
+    :param use_rollups: build the candles from the coarsest fitting rollup table instead of the raw updates. The raw
+        updates are used until the updates inserted before the rollup tables were created are backfilled
+    """
+    seconds = CANDLE_INTERVALS[interval]
+    rollup_table = get_rollup_table(seconds)
+    if use_rollups and rollup_table is not None and db_manager.is_rollup_backfilled():
+        rollup_seconds, table = rollup_table
+        return get_rollup_candles(db_manager, asset_name, start_date, end_date, seconds, rollup_seconds, table)
+    query = f"""
+        SELECT candles.bucket * %s, open_data.price, candles.high, candles.low, close_data.price,
+               candles.tick_count
+        FROM (
+            SELECT {db_manager.get_epoch_bucket_sql('update_time')} AS bucket, MIN(update_id) AS open_id,
+                   MAX(update_id) AS close_id, MAX(price) AS high, MIN(price) AS low, COUNT(*) AS tick_count
+            FROM historical_data WHERE asset_name = %s AND update_time BETWEEN %s AND %s
+            GROUP BY bucket
+        ) AS candles
+        JOIN historical_data AS open_data ON open_data.update_id = candles.open_id
+        JOIN historical_data AS close_data ON close_data.update_id = candles.close_id
+        ORDER BY candles.bucket
+    """
+    values = (seconds, seconds, asset_name, start_date, end_date)
+    return to_candles(db_manager.execute_transaction([query], [values]))
+
+
+def count_historical_data(db_manager: DBManager, asset_name: str, start_date: datetime, end_date: datetime) -> int:
+    """
+    Count the historical data rows for a specific asset within a given date range
+    """
+    query = "SELECT COUNT(*) FROM historical_data WHERE asset_name = %s AND update_time BETWEEN %s AND %s"
+    values = (asset_name, start_date, end_date)
+    return db_manager.execute_transaction([query], [values])[0][0]
+
+
+def iter_historical_data(db_manager: DBManager, asset_name: str, start_date: datetime, end_date: datetime,
+                         chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE) -> Iterator[List[Tuple[datetime, float, float]]]:
+    """
+    Stream the historical data for a specific asset within a given date range in chunks ordered by update time
+    :return: iterator of (update_time, price, change) row chunks
+    """
+    query = """
+        SELECT update_time, price, `change` FROM historical_data
+        WHERE asset_name = %s AND update_time BETWEEN %s AND %s ORDER BY update_time
+    """
+    values = (asset_name, start_date, end_date)
+    return db_manager.stream_query(query, values, chunk_size)
+
+
+class BatchWriter:
     """
-    The class is used to manage websocket connections and provide real-time market data
+    The class buffers rows in a bounded queue and writes them to a db table in batches. A batch is flushed when it
+    reaches batch_size rows or when flush_interval seconds have passed since its first row. The price history and
+    every persisted websocket channel have their own writer
     """
 
-    def __init__(self, app: 'frontend.main_app.App', db_manager: DBManager, api_key: str,
-                 watchlist_assets: Dict[str, Dict[str, float]], assets_settings: Dict[str, Dict[str, Optional[int]]]):
-        self.app = app
+    def __init__(self, db_manager: DBManager, name: str, insert_rows: Callable[[DBManager, List[tuple]], None],
+                 flush_interval: float = DEFAULT_HISTORY_FLUSH_INTERVAL, batch_size: int = DEFAULT_HISTORY_BATCH_SIZE,
+                 max_queue_size: int = DEFAULT_HISTORY_QUEUE_SIZE):
+        """
+        :param name: name of the written data in the messages, e.g. 'historical data'
+        :param insert_rows: writes a batch of rows to the db in a single transaction
+        """
         self.db_manager = db_manager
+        self.insert_rows = insert_rows
+        self.name = name
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.queue: asyncio.Queue[Optional[tuple]] = asyncio.Queue(maxsize=max_queue_size)
+        self.stopping = False
+        self.queued_count = 0
+        self.dropped_count = 0
+        self.written_count = 0
+        self.failed_count = 0
+        self.reported_dropped_count = 0
+
+    def put(self, row: tuple) -> bool:
+        """
+        Queue a row for writing without blocking the event loop
+        :return: False if the row was dropped because the queue is full or the writer is stopping
+        """
+        if self.stopping:
+            self.dropped_count += 1
+            return False
+        try:
+            self.queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.dropped_count += 1
+            return False
+        self.queued_count += 1
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the writer counters
+        """
+        return {
+            'queued': self.queued_count,
+            'pending': self.queue.qsize(),
+            'written': self.written_count,
+            'dropped': self.dropped_count,
+            'failed': self.failed_count
+        }
+
+    def stop(self) -> None:
+        """
+        Stop accepting new rows. The run coroutine flushes the remaining queue and returns
+        """
+        self.stopping = True
+        try:
+            self.queue.put_nowait(None)  # Wakes up the writer if it waits for new updates
+        except asyncio.QueueFull:
+            pass
+
+    async def collect_batch(self) -> List[tuple]:
+        """
+        Wait for the next batch of rows until it is full or the flush interval expires
+        """
+        loop = asyncio.get_running_loop()
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            try:
+                row = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                if self.stopping:
+                    break
+                timeout = None if deadline is None else deadline - loop.time()
+                if timeout is not None and timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self.queue.get(), timeout)
+                except TimeoutError:
+                    break
+            if row is None:
+                continue
+            if deadline is None:
+                deadline = loop.time() + self.flush_interval
+            batch.append(row)
+        return batch
+
+    async def flush(self, batch: List[tuple]) -> None:
+        """
+        Write a batch of rows to the db in a worker thread
+        """
+        try:
+            await asyncio.to_thread(self.insert_rows, self.db_manager, batch)
+            self.written_count += len(batch)
+        except DB_ERRORS as e:
+            self.failed_count += len(batch)
+            print(f"Error writing {self.name}: {e}")
+        if self.dropped_count != self.reported_dropped_count:
+            print(f"{self.name.capitalize()} queue is full, {self.dropped_count - self.reported_dropped_count} "
+                  f"rows dropped")
+            self.reported_dropped_count = self.dropped_count
+
+    async def run(self) -> None:
+        """
+        Write queued rows to the db until the writer is stopped and the queue is drained
+        """
+        while not self.stopping or not self.queue.empty():
+            batch = await self.collect_batch()
+            if batch:
+                await self.flush(batch)
+
+
+class TickBuffer:
+    """
+    Fixed-capacity ring buffer of the recent ticks of an asset, kept in contiguous int64 time and float64 price
+    arrays. Every tick is written twice, capacity items apart, so the last n ticks always form a contiguous slice,
+    which is returned as a read-only view without copying. The views are valid until the ticks are overwritten, copy
+    them to keep them
+    """
+
+    def __init__(self, capacity: int = DEFAULT_TICK_BUFFER_SIZE):
+        """
+        :param capacity: max ticks kept, the buffer takes 32 bytes per tick
+        """
+        self.capacity = capacity
+        self.times = np.zeros(2 * capacity, dtype=np.int64)  # epoch milliseconds
+        self.prices = np.zeros(2 * capacity, dtype=np.float64)
+        self.position = 0  # index of the next write
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, timestamp: int, price: float) -> None:
+        """
+        :param timestamp: epoch milliseconds
+        """
+        position = self.position
+        mirror_position = position + self.capacity
+        self.times[position] = timestamp
+        self.times[mirror_position] = timestamp
+        self.prices[position] = price
+        self.prices[mirror_position] = price
+        position += 1
+        self.position = position if position < self.capacity else 0
+        if self.count < self.capacity:
+            self.count += 1
+
+    def last(self, count: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the last ticks, oldest first
+        :param count: max number of ticks
+        :return: (times, prices) views
+        """
+        end = self.position + self.capacity
+        start = end - min(count, self.count)
+        times = self.times[start:end]
+        prices = self.prices[start:end]
+        times.flags.writeable = False
+        prices.flags.writeable = False
+        return times, prices
+
+    def since(self, start_time: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the ticks received at or after the start time, oldest first
+        :param start_time: epoch milliseconds
+        :return: (times, prices) views
+        """
+        times, prices = self.last(self.count)
+        start = int(np.searchsorted(times, start_time))
+        return times[start:], prices[start:]
+
+    def sample(self, start_time: int, points: int) -> np.ndarray:
+        """
+        Get evenly spaced prices since the start time, e.g. for a sparkline
+        :param start_time: epoch milliseconds
+        :param points: max number of prices
+        :return: prices array
+        """
+        times, prices = self.since(start_time)
+        if len(prices) <= points:
+            return prices.copy()
+        return prices[np.linspace(0, len(prices) - 1, points).astype(np.intp)]
+
+    def summarize(self, start_time: int, points: int) -> Optional[RecentTicksSummary]:
+        """
+        Summarize the ticks received since the start time, the summary holds no views of the buffer
+        :param start_time: epoch milliseconds
+        :param points: max number of sparkline prices
+        :return: summary or None if no ticks were received since the start time
+        """
+        times, prices = self.since(start_time)
+        if not len(prices):
+            return None
+        return {
+            'tick_count': len(prices),
+            'first_time': int(times[0]),
+            'last_time': int(times[-1]),
+            'open': float(prices[0]),
+            'high': float(prices.max()),
+            'low': float(prices.min()),
+            'close': float(prices[-1]),
+            'sparkline': self.sample(start_time, points).tolist()
+        }
+
+
+class WSConnection:
+    """
+    A single websocket connection of the WSManager. It keeps its share of the subscriptions and its own counters, the
+    received messages are processed by the manager, so all the connections feed the same update pipeline
+    """
+
+    def __init__(self, manager: 'WSManager', index: int, api_key: str):
+        self.manager = manager
+        self.index = index
         self.api_key = api_key
-        self.watchlist_assets = watchlist_assets
-        self.assets_settings = assets_settings
+        self.assets: Set[str] = set()  # Assets assigned to the connection by the manager
         self.active_ws: Optional[websockets.WebSocketClientProtocol] = None
-        self.db_connection = None
-        self.db_cursor = None
+        # Subscriptions restored on every (re)connect and the changes which are not sent to the server yet
+        self.subscriptions: Set[str] = set()
+        self.pending_changes: Deque[Tuple[str, str]] = deque()  # (action, sub)
+        self.pending_changes_event = asyncio.Event()
+        self.failed = False  # Set when the server rejects the API key
+        self.connects = 0
+        self.connected_since: Optional[float] = None  # monotonic time of the first connect
+        self.messages_received = 0
+        self.updates_received = 0
+
+    def add_asset(self, asset: str) -> None:
+        self.assets.add(asset)
+        for sub in self.manager.get_asset_subs(asset):
+            self.add_change('SubAdd', sub)
+
+    def remove_asset(self, asset: str) -> None:
+        self.assets.discard(asset)
+        for sub in self.manager.get_asset_subs(asset):
+            self.add_change('SubRemove', sub)
+
+    def add_change(self, action: str, sub: str) -> None:
+        self.pending_changes.append((action, sub))
+        self.pending_changes_event.set()
+
+    async def send_subscription_changes(self, ws: websockets.WebSocketClientProtocol) -> None:
+        """
+        Restore the subscriptions on a new connection and keep sending the pending subscription changes. Consecutive
+        changes with the same action are sent in a single message. A change is only removed from the queue after it
+        is sent, so the changes interrupted by a disconnect are replayed after the reconnect
+        """
+        try:
+            if self.subscriptions:
+                await ws.send(json.dumps({'action': 'SubAdd', 'subs': sorted(self.subscriptions)}))
+            while True:
+                while self.pending_changes:
+                    action = self.pending_changes[0][0]
+                    count = 0
+                    while count < len(self.pending_changes) and self.pending_changes[count][0] == action:
+                        count += 1
+                    subs = [self.pending_changes[i][1] for i in range(count)]
+                    await ws.send(json.dumps({'action': action, 'subs': subs}))
+                    for _ in range(count):
+                        self.pending_changes.popleft()
+                    if action == 'SubAdd':
+                        self.subscriptions.update(subs)
+                    else:
+                        self.subscriptions.difference_update(subs)
+                self.pending_changes_event.clear()
+                await self.pending_changes_event.wait()
+        except websockets.ConnectionClosed:
+            pass
+
+    async def run(self) -> None:
+        """
+        Keep the connection open and reconnect automatically if it is lost. Returns if the API key is rejected
+        """
+        url = f"{self.manager.ws_url}?api_key={self.api_key}"
+        async for ws in websockets.connect(url, close_timeout=WS_CLOSE_TIMEOUT):
+            self.active_ws = ws
+            self.connects += 1
+            if self.connected_since is None:
+                self.connected_since = monotonic()
+            sender_task = asyncio.create_task(self.send_subscription_changes(ws))
+            try:
+                async for message in ws:
+                    self.messages_received += 1
+                    if not self.manager.process_message(self, message):
+                        print(f'Invalid API key on websocket connection {self.index}')
+                        await ws.close()
+                        self.failed = True
+                        self.manager.reassign_assets(self)
+                        return
+            except websockets.ConnectionClosed:
+                continue
+            finally:
+                sender_task.cancel()
+
+    def close(self) -> None:
+        if self.active_ws is not None:
+            asyncio.create_task(self.active_ws.close())
+            self.active_ws = None
+
+    def stats(self) -> Dict[str, Union[int, float, bool]]:
+        elapsed = monotonic() - self.connected_since if self.connected_since is not None else 0.0
+        return {
+            'assets': len(self.assets),
+            'connects': self.connects,
+            'failed': self.failed,
+            'messages_received': self.messages_received,
+            'updates_received': self.updates_received,
+            'messages_per_second': round(self.messages_received / elapsed, 1) if elapsed else 0.0
+        }
+
+
+class WSChannel:
+    """
+    A streamer channel. The messages of the channel are routed to its handler by their type, the channel builds the
+    subscriptions of an asset and counts its messages together with the time spent handling them
+    """
+
+    def __init__(self, name: str, message_type: str,
+                 handler: Callable[[WSMessage, Optional[Dict[str, Any]]], None], get_subs: Callable[[str], List[str]]):
+        """
+        :param handler: processes a message of the channel, it is called with the raw message and the decoded message
+            if it had to be decoded to find its type, otherwise None and the handler decodes the message itself
+        :param get_subs: builds the subscriptions of an asset
+        """
+        self.name = name
+        self.message_type = message_type
+        self.handler = handler
+        self.get_subs = get_subs
+        self.messages_received = 0
+        self.processing_time = 0.0
+
+    def stats(self, elapsed: float) -> Dict[str, float]:
+        """
+        :param elapsed: seconds since the websocket was started
+        """
+        return {
+            'messages_received': self.messages_received,
+            'messages_per_second': round(self.messages_received / elapsed, 1) if elapsed else 0.0,
+            'processing_us_per_message': (round(self.processing_time / self.messages_received * 1e6, 2)
+                                          if self.messages_received else 0.0)
+        }
+
+
+class WSManager:
+    """
+    The class is used to manage websocket connections and provide real-time market data. The subscriptions are spread
+    over several connections, optionally opened with different API keys, to stay under the per-connection
+    subscription and message limits of the streamer. The assets are kept evenly spread when they are added or removed
+    """
+
+    def __init__(self, market_updates: MarketUpdateSink, history_writer: BatchWriter, api_keys: List[str],
+                 assets: Iterable[str], decoder: Optional[WSMessageDecoder] = None, ws_url: str = DEFAULT_WS_URL,
+                 recorder: Optional[WSRecorder] = None, connection_count: int = DEFAULT_WS_CONNECTIONS,
+                 tick_buffer_size: int = DEFAULT_TICK_BUFFER_SIZE, channels: Iterable[str] = DEFAULT_WS_CHANNELS,
+                 exchanges: Sequence[str] = DEFAULT_WS_EXCHANGES,
+                 channel_writers: Optional[Dict[str, BatchWriter]] = None):
+        """
+        :param market_updates: sink which receives the latest market data of the assets, the UI update queue or a
+        headless sink
+        :param api_keys: keys the connections are opened with, in turn
+        :param assets: initially subscribed assets
+        :param decoder: websocket message decoder, the fastest available one by default
+        :param ws_url: streamer url, can point at a local replay server
+        :param recorder: records every received frame
+        :param connection_count: number of websocket connections, at least one connection is opened per API key
+        :param tick_buffer_size: recent ticks kept in memory per asset, 0 keeps none
+        :param channels: subscribed channels, see WS_CHANNELS
+        :param exchanges: exchanges of the trade and top of book subscriptions
+        :param channel_writers: {channel: writer of its table}, the channels without a writer are not persisted
+        """
+        self.ws_url = ws_url
+        self.recorder = recorder
+        self.messages_received = 0
+        self.updates_processed = 0
+        self.market_updates = market_updates
+        self.decoder = decoder if decoder is not None else get_decoder()
+        self.history_writer = history_writer
+        self.connection_count = connection_count
+        self.tick_buffer_size = tick_buffer_size
+        self.exchanges = exchanges
+        self.channel_writers = channel_writers if channel_writers is not None else {}
+        self.started_at: Optional[float] = None
+        check_ws_channels(channels)
+        self.channels: Dict[str, WSChannel] = {}  # {message type: channel}
+        for channel_name in channels:
+            self.register_channel(self.create_channel(channel_name))
+        # Market data is owned by the ingestion side, the sink only receives copies
+        self.market_state = MarketState()
+        self.tick_buffers: Dict[str, TickBuffer] = {}
+        for asset in assets:
+            self.add_market_state(asset)
+        self.api_keys: List[str] = []
+        self.connections: List[WSConnection] = []
+        self.asset_connections: Dict[str, WSConnection] = {}
+        self.set_api_keys(api_keys)
 
     @staticmethod
     def calculate_percentage_change(open_price: float, cur_price: float) -> float:
         """
         Calculate the price percentage change since the beginning of the trade day
         """
+        if not open_price:
+            return 0  # The open price is not received yet
         return ((cur_price - open_price) / open_price) * 100
 
-    async def ws_subscribe_to_agg_index(self) -> None:
+    @staticmethod
+    def get_agg_index_sub(asset: str) -> str:
+        return f"{AGG_INDEX_UPDATE_TYPE}~CCCAGG~{asset}~{QUOTE_SYMBOL}"
+
+    def get_exchange_subs(self, message_type: str, asset: str) -> List[str]:
+        return [f"{message_type}~{exchange}~{asset}~{QUOTE_SYMBOL}" for exchange in self.exchanges]
+
+    def create_channel(self, name: str) -> WSChannel:
+        if name == 'agg_index':
+            return WSChannel(name, AGG_INDEX_UPDATE_TYPE, self.process_agg_index_message,
+                             lambda asset: [self.get_agg_index_sub(asset)])
+        if name == 'trades':
+            return WSChannel(name, TRADE_TYPE, self.process_trade_message,
+                             lambda asset: self.get_exchange_subs(TRADE_TYPE, asset))
+        return WSChannel(name, TOP_OF_BOOK_TYPE, self.process_top_of_book_message,
+                         lambda asset: self.get_exchange_subs(TOP_OF_BOOK_TYPE, asset))
+
+    def register_channel(self, channel: WSChannel) -> None:
+        """
+        Route the messages of the channel type to its handler. Must be called before the assets are subscribed
+        """
+        self.channels[channel.message_type] = channel
+
+    def get_asset_subs(self, asset: str) -> List[str]:
+        """
+        Get the subscriptions of the asset in all the channels
+        """
+        return [sub for channel in self.channels.values() for sub in channel.get_subs(asset)]
+
+    def add_market_state(self, asset: str) -> None:
+        self.market_state.add(asset)
+        if self.tick_buffer_size:
+            self.tick_buffers[asset] = TickBuffer(self.tick_buffer_size)
+
+    def get_recent_ticks(self, asset: str, seconds: Optional[float] = None,
+                         count: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Subscribe to the aggregated index channel
+        Get the recent ticks of the asset from memory. Must be called in the ingestion loop, the views are overwritten
+        by the next ticks
+        :param seconds: only the ticks received in the last seconds
+        :param count: only the last ticks
+        :return: (times, prices) views, epoch milliseconds and prices, oldest first
+        """
+        tick_buffer = self.tick_buffers.get(asset)
+        if tick_buffer is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        if seconds is None:
+            return tick_buffer.last(len(tick_buffer) if count is None else count)
+        times, prices = tick_buffer.since(round((time() - seconds) * 1000))
+        if count is not None:
+            start = max(0, len(times) - count)
+            times, prices = times[start:], prices[start:]
+        return times, prices
+
+    def get_recent_ticks_summary(self, asset: str, seconds: float, points: int) -> Optional[RecentTicksSummary]:
+        """
+        Summarize the ticks of the asset received in the last seconds from memory. The summary is a copy, so it can be
+        passed out of the ingestion loop
+        :param points: max number of sparkline prices
+        :return: summary or None if the asset has no ticks in the window
+        """
+        tick_buffer = self.tick_buffers.get(asset)
+        if tick_buffer is None:
+            return None
+        return tick_buffer.summarize(round((time() - seconds) * 1000), points)
+
+    def has_api_key(self) -> bool:
+        return any(self.api_keys)
+
+    def set_api_keys(self, api_keys: List[str]) -> None:
+        """
+        Create the connections for the API keys and spread the assets over them. Must be called while the websocket
+        is stopped
+        """
+        self.api_keys = [api_key for api_key in api_keys if api_key] or ['']
+        connection_count = max(self.connection_count, len(self.api_keys))
+        self.connections = [WSConnection(self, i, self.api_keys[i % len(self.api_keys)])
+                            for i in range(connection_count)]
+        self.asset_connections = {}
+        for asset in self.market_state:
+            self.assign_asset(asset)
+
+    def assign_asset(self, asset: str) -> None:
+        """
+        Subscribe to the asset on the least loaded connection
+        """
+        connections = [connection for connection in self.connections if not connection.failed]
+        if not connections:
+            return
+        connection = min(connections, key=lambda c: len(c.assets))
+        connection.add_asset(asset)
+        self.asset_connections[asset] = connection
+
+    def rebalance(self) -> None:
+        """
+        Move assets from the most to the least loaded connections until their loads differ by one asset at most
+        """
+        connections = [connection for connection in self.connections if not connection.failed]
+        if len(connections) < 2:
+            return
+        while True:
+            source = max(connections, key=lambda c: len(c.assets))
+            target = min(connections, key=lambda c: len(c.assets))
+            if len(source.assets) - len(target.assets) <= 1:
+                return
+            asset = min(source.assets)
+            source.remove_asset(asset)
+            target.add_asset(asset)
+            self.asset_connections[asset] = target
+
+    def reassign_assets(self, failed_connection: WSConnection) -> None:
+        """
+        Move the assets of a connection whose API key was rejected to the remaining connections
+        """
+        failed_connection.pending_changes.clear()
+        failed_connection.subscriptions.clear()
+        assets = sorted(failed_connection.assets)
+        failed_connection.assets.clear()
+        for asset in assets:
+            del self.asset_connections[asset]
+            self.assign_asset(asset)
+        if assets and not any(not connection.failed for connection in self.connections):
+            print(f'No websocket connection left for {len(assets)} assets')
+
+    def subscribe_asset(self, asset: str) -> None:
+        """
+        Subscribe to the asset market data on a live connection without reconnecting
+        """
+        if asset not in self.market_state:
+            self.add_market_state(asset)
+        if asset not in self.asset_connections:
+            self.assign_asset(asset)
+
+    def unsubscribe_asset(self, asset: str) -> None:
+        """
+        Unsubscribe from the asset market data on its connection without reconnecting
+        """
+        self.market_state.remove(asset)
+        self.tick_buffers.pop(asset, None)
+        connection = self.asset_connections.pop(asset, None)
+        if connection is not None:
+            connection.remove_asset(asset)
+            self.rebalance()
+
+    def process_message(self, connection: WSConnection, message: Union[str, bytes]) -> bool:
+        """
+        Process a message received by one of the connections
+        :return: False if the server rejected the API key of the connection
+        """
+        self.messages_received += 1
+        if self.recorder is not None:
+            self.recorder.record(message)
+        # Only the messages of the subscribed channels are decoded by their handlers, heartbeats and subscription
+        # confirmations are dropped after the type check
+        decoded = None
+        message_type = get_message_type(message)
+        if message_type is None:
+            decoded = self.decoder.decode(message)
+            message_type = decoded.get('TYPE')
+        channel = self.channels.get(message_type)
+        if channel is not None:
+            connection.updates_received += 1
+            start = perf_counter()
+            channel.handler(message, decoded)
+            channel.processing_time += perf_counter() - start
+            channel.messages_received += 1
+        elif message_type == '401':
+            return False
+        return True
+
+    def process_agg_index_message(self, message: WSMessage, decoded: Optional[Dict[str, Any]] = None) -> None:
+        if decoded is None:
+            self.process_ws_agg_idx_update(self.decoder.decode_agg_index_update(message))
+        else:
+            self.process_ws_agg_idx_update(get_agg_index_update(decoded))
+
+    def process_trade_message(self, message: WSMessage, decoded: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Queue a trade print of a subscribed asset for the batched db insert
+        """
+        trade = self.decoder.decode_trade(message) if decoded is None else get_trade_update(decoded)
+        writer = self.channel_writers.get('trades')
+        if writer is None or trade.from_symbol not in self.market_state or trade.price is None:
+            return
+        trade_time = datetime.fromtimestamp(trade.timestamp) if trade.timestamp is not None else datetime.now()
+        writer.put((trade.from_symbol, trade.market, trade_time, trade.side, trade.trade_id, trade.price,
+                        trade.quantity, trade.total))
+
+    def process_top_of_book_message(self, message: WSMessage, decoded: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Queue a top of book update of a subscribed asset for the batched db insert
+        """
+        top_of_book = self.decoder.decode_top_of_book(message) if decoded is None else get_top_of_book_update(decoded)
+        writer = self.channel_writers.get('top_of_book')
+        if writer is None or top_of_book.from_symbol not in self.market_state:
+            return
+        writer.put((top_of_book.from_symbol, top_of_book.market, datetime.now(), top_of_book.bid,
+                        top_of_book.bid_quantity, top_of_book.ask, top_of_book.ask_quantity))
+
+    async def ws_subscribe(self) -> None:
+        """
+        Subscribe to the channels on all the connections, they reconnect automatically if they are lost
         Docs reference: https://min-api.cryptocompare.com/documentation/websockets?key=Channels&cat=AggregateIndex
         """
-        url = "wss://streamer.cryptocompare.com/v2?api_key=" + self.api_key
-        subs = [f"5~CCCAGG~{asset}~USD" for asset in self.watchlist_assets]
-        async for ws in websockets.connect(url):
-            self.active_ws = ws
-            try:
-                await ws.send(json.dumps({
-                    'action': 'SubAdd',
-                    'subs': subs
-                }))
-                while True:
-                    try:
-                        data = await ws.recv()
-                        data = json.loads(data)
-                        self.process_ws_agg_idx_update(data)
-                    except websockets.ConnectionClosed:
-                        continue
-            except websockets.ConnectionClosedError:
-                print('Invalid API key')
-                break
+        if self.started_at is None:
+            self.started_at = monotonic()
+        async with asyncio.TaskGroup() as tg:
+            for connection in self.connections:
+                tg.create_task(connection.run())
+
+    def stats(self) -> Dict[str, Union[int, list, dict]]:
+        """
+        Get the message counters, in total, per connection and per channel
+        """
+        elapsed = monotonic() - self.started_at if self.started_at is not None else 0.0
+        return {'messages_received': self.messages_received, 'updates_processed': self.updates_processed,
+                'connections': [connection.stats() for connection in self.connections],
+                'channels': {channel.name: channel.stats(elapsed) for channel in self.channels.values()}}
 
     def stop_active_ws(self) -> None:
-        if self.active_ws is not None:
-            asyncio.create_task(self.active_ws.close())
-            self.active_ws = None
+        for connection in self.connections:
+            connection.close()
 
-    def process_ws_agg_idx_update(self, update: Dict[str, Union[str, int, float]]) -> None:
-        """
-        Process the websocket message data and update the market data
-        :param update: ws message
-        """
-        if 'TYPE' in update and update['TYPE'] == '5':
-            if 'FROMSYMBOL' in update and update['FROMSYMBOL'] in self.watchlist_assets:
-                asset = update['FROMSYMBOL']
-                if 'OPENDAY' in update:
-                    self.watchlist_assets[asset]['open_price'] = update['OPENDAY']
-                if 'PRICE' in update:
-                    price = update['PRICE']
-                    open_price = self.watchlist_assets[asset]['open_price']
-                    change = self.calculate_percentage_change(open_price, price)
-                    self.watchlist_assets[asset]['price'] = price
-                    self.watchlist_assets[asset]['change'] = change
-                    self.app.update_watchlist_asset(asset)
-                    # Inserting data into bd
-                    update_time = datetime.now()
-                    insert_to_historical_data(self.db_manager, asset, price, update_time, change)
-                    
\ No newline at end of file
+    def process_ws_agg_idx_update(self, update: AggIndexUpdate) -> None:
+        """
+        Process the aggregated index update and update the market data
+        :param update: decoded ws message
+        """
+        asset_state = self.market_state.get(update.from_symbol)
+        if asset_state is None:
+            return
+        if update.open_day is not None:
+            asset_state.open_price = update.open_day
+        if update.price is not None:
+            price = update.price
+            change = self.calculate_percentage_change(asset_state.open_price, price)
+            self.market_state.set_price(asset_state, price, change)
+            self.updates_processed += 1
+            self.market_updates.put(update.from_symbol, asset_state.to_update())
+            update_time = time()
+            tick_buffer = self.tick_buffers.get(update.from_symbol)
+            if tick_buffer is not None:
+                tick_buffer.append(round(update_time * 1000), price)
+            # Queueing data for the batched db insert
+            self.history_writer.put((update.from_symbol, datetime.fromtimestamp(update_time), price, change))
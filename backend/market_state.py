@@ -0,0 +1,133 @@
+from typing import Dict, List, Optional, Iterator, Tuple
+
+from backend.db_management import MAX_INT
+from backend.market_updates import MarketUpdate
+
+
+class AssetState:
+    """
+    Market data and display settings of a watchlist asset. The version is the store version of its last change
+    """
+    __slots__ = ('asset_id', 'ticker', 'open_price', 'price', 'change', 'price_rounding', 'change_rounding',
+                 'version')
+
+    def __init__(self, asset_id: int, ticker: str, price_rounding: int = MAX_INT, change_rounding: int = MAX_INT):
+        self.asset_id = asset_id
+        self.ticker = ticker
+        self.open_price = 0.0
+        self.price = 0.0
+        self.change = 0.0
+        self.price_rounding = price_rounding
+        self.change_rounding = change_rounding
+        self.version = 0
+
+    def to_update(self) -> MarketUpdate:
+        return {'open_price': self.open_price, 'price': self.price, 'change': self.change}
+
+    def get_settings(self) -> Dict[str, int]:
+        return {'price_rounding': self.price_rounding, 'change_rounding': self.change_rounding}
+
+
+class MarketState:
+    """
+    The class stores the state of the watchlist assets as slotted records indexed by small integer asset ids. A record
+    is looked up by its ticker once per update and then changed through its attributes. Every change increments the
+    store version and stamps it on the changed record, so a consumer remembers the last version it has seen and asks
+    only for the assets changed since. The store is not thread-safe, the UI and the ingestion side have their own
+    """
+
+    def __init__(self):
+        self.assets: List[Optional[AssetState]] = []  # Indexed by asset id, None for the removed assets
+        self.ids: Dict[str, int] = {}  # {ticker: asset id}
+        self.free_ids: List[int] = []  # Ids of the removed assets, reused by the next added assets
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, ticker: str) -> bool:
+        return ticker in self.ids
+
+    def __iter__(self) -> Iterator[str]:
+        """
+        Iterate over the tickers in the order they were added
+        """
+        return iter(self.ids)
+
+    def __getitem__(self, ticker: str) -> AssetState:
+        return self.assets[self.ids[ticker]]
+
+    def get(self, ticker: str) -> Optional[AssetState]:
+        asset_id = self.ids.get(ticker)
+        if asset_id is None:
+            return None
+        return self.assets[asset_id]
+
+    def get_by_id(self, asset_id: int) -> Optional[AssetState]:
+        return self.assets[asset_id]
+
+    def add(self, ticker: str, price_rounding: int = MAX_INT, change_rounding: int = MAX_INT) -> AssetState:
+        """
+        Add an asset, an already stored asset is returned unchanged
+        """
+        asset_state = self.get(ticker)
+        if asset_state is not None:
+            return asset_state
+        if self.free_ids:
+            asset_id = self.free_ids.pop()
+        else:
+            asset_id = len(self.assets)
+            self.assets.append(None)
+        asset_state = AssetState(asset_id, ticker, price_rounding, change_rounding)
+        self.assets[asset_id] = asset_state
+        self.ids[ticker] = asset_id
+        self.touch(asset_state)
+        return asset_state
+
+    def remove(self, ticker: str) -> None:
+        asset_id = self.ids.pop(ticker, None)
+        if asset_id is not None:
+            self.assets[asset_id] = None
+            self.free_ids.append(asset_id)
+            self.version += 1
+
+    def touch(self, asset_state: AssetState) -> None:
+        """
+        Mark the asset as changed, e.g. after its settings are changed
+        """
+        self.version += 1
+        asset_state.version = self.version
+
+    def set_price(self, asset_state: AssetState, price: float, change: float) -> None:
+        asset_state.price = price
+        asset_state.change = change
+        self.version += 1
+        asset_state.version = self.version
+
+    def apply(self, ticker: str, update: MarketUpdate) -> Optional[AssetState]:
+        """
+        Apply a market update received from the ingestion side
+        :return: the updated asset, None if the asset is not stored
+        """
+        asset_state = self.get(ticker)
+        if asset_state is None:
+            return None
+        asset_state.open_price = update['open_price']
+        self.set_price(asset_state, update['price'], update['change'])
+        return asset_state
+
+    def changed_since(self, version: int) -> List[AssetState]:
+        """
+        Get the assets changed after the given store version
+        """
+        if version >= self.version:
+            return []
+        return [asset_state for asset_state in self.assets if asset_state is not None and asset_state.version > version]
+
+    def snapshot(self, since_version: int = 0) -> Tuple[int, Dict[str, MarketUpdate]]:
+        """
+        Copy the market data of the assets changed after the given store version, all the assets by default
+        :return: (current store version, {ticker: market data})
+        """
+        return self.version, {asset_state.ticker: asset_state.to_update()
+                              for asset_state in self.changed_since(since_version)}
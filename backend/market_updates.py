@@ -0,0 +1,105 @@
+from abc import ABC, abstractmethod
+from threading import Lock
+from typing import Dict, Callable, Optional
+
+MarketUpdate = Dict[str, float]  # {'open_price': float, 'price': float, 'change': float}
+
+
+class MarketUpdateSink(ABC):
+    """
+    Receives the latest market data of the assets from WSManager. Implementations must not block, put is called
+    for every processed price update in the ingestion loop
+    """
+
+    @abstractmethod
+    def put(self, asset_ticker: str, update: MarketUpdate) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+
+class LatestMarketUpdates(MarketUpdateSink):
+    """
+    The sink keeps the latest market data of every asset, used when no UI consumes the updates
+    """
+
+    def __init__(self):
+        self.updates: Dict[str, MarketUpdate] = {}
+        self.received_count = 0
+
+    def put(self, asset_ticker: str, update: MarketUpdate) -> None:
+        self.updates[asset_ticker] = update
+        self.received_count += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'received': self.received_count,
+            'assets': len(self.updates)
+        }
+
+
+class MarketUpdateQueue(MarketUpdateSink):
+    """
+    The class hands the latest market data of every asset from the ingestion side to the UI. An update which is not
+    consumed yet is replaced by a newer update of the same asset, so the queue never holds more than one update per
+    asset and neither a burst of messages nor a slow consumer can grow it. The lock only guards dict operations, so a
+    producer is never blocked by the consumer
+    """
+
+    def __init__(self, on_pending: Optional[Callable[[], None]] = None):
+        """
+        :param on_pending: called by the producer when the queue stops being empty, used to wake up the consumer
+        """
+        self.on_pending = on_pending
+        self.lock = Lock()
+        self.updates: Dict[str, MarketUpdate] = {}
+        self.received_count = 0
+        self.coalesced_count = 0
+
+    def put(self, asset_ticker: str, update: MarketUpdate) -> None:
+        self.put_many({asset_ticker: update})
+
+    def put_many(self, updates: Dict[str, MarketUpdate]) -> None:
+        """
+        Queue updates, the pending updates of the same assets are replaced
+        """
+        with self.lock:
+            was_empty = not self.updates
+            for asset_ticker, update in updates.items():
+                if asset_ticker in self.updates:
+                    self.coalesced_count += 1
+                self.updates[asset_ticker] = update
+            self.received_count += len(updates)
+        if was_empty and updates and self.on_pending is not None:
+            self.on_pending()
+
+    def restore(self, updates: Dict[str, MarketUpdate]) -> None:
+        """
+        Put back drained updates which could not be delivered. Newer updates of the same assets are kept
+        """
+        with self.lock:
+            was_empty = not self.updates
+            for asset_ticker, update in updates.items():
+                self.updates.setdefault(asset_ticker, update)
+        if was_empty and updates and self.on_pending is not None:
+            self.on_pending()
+
+    def drain(self) -> Dict[str, MarketUpdate]:
+        """
+        Take all pending updates
+        """
+        with self.lock:
+            updates, self.updates = self.updates, {}
+        return updates
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the queue counters
+        """
+        return {
+            'received': self.received_count,
+            'coalesced': self.coalesced_count,
+            'pending': len(self.updates)
+        }
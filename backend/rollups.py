@@ -0,0 +1,144 @@
+from datetime import datetime
+from typing import Dict, List, Tuple, Optional, Callable
+
+from backend.db_management import DBManager, DBSession
+
+ROLLUP_TABLES = {60: 'candles_1m', 3600: 'candles_1h'}  # {bucket size in seconds: table name}
+DEFAULT_BACKFILL_CHUNK_SIZE = 50000
+EPOCH = datetime.fromtimestamp(0)  # In local time like the stored datetimes
+
+# (asset_name, open_time, open, high, low, close, tick_count, first_time, last_time)
+RollupRow = Tuple[str, datetime, float, float, float, float, int, datetime, datetime]
+
+
+def get_bucket_start(update_time: datetime, seconds: int) -> datetime:
+    """
+    Get the start of the epoch-aligned bucket which contains the update time. Times before the epoch, e.g. the
+    default start of a date range, are clamped to it, datetime.timestamp fails for them on Windows
+    """
+    if update_time <= EPOCH:
+        return EPOCH
+    timestamp = update_time.timestamp()
+    return datetime.fromtimestamp(timestamp - timestamp % seconds)
+
+
+def get_rollup_table(interval_seconds: int) -> Optional[Tuple[int, str]]:
+    """
+    Get the coarsest rollup table which candles of the given interval can be built from
+    :return: (bucket size in seconds, table name) or None if no rollup fits the interval
+    """
+    fitting = [seconds for seconds in ROLLUP_TABLES if interval_seconds % seconds == 0]
+    if not fitting:
+        return None
+    seconds = max(fitting)
+    return seconds, ROLLUP_TABLES[seconds]
+
+
+class RollupAccumulator:
+    """
+    The class aggregates price updates into OHLC candles of every rollup table in memory. The candles are merged into
+    the rollup tables by upsert_rollups
+    """
+
+    def __init__(self):
+        # {bucket size: {(asset_name, open_time): [open, high, low, close, tick_count, first_time, last_time]}}
+        self.candles: Dict[int, Dict[Tuple[str, datetime], list]] = {seconds: {} for seconds in ROLLUP_TABLES}
+
+    def add(self, asset_name: str, update_time: datetime, price: float) -> None:
+        for seconds, candles in self.candles.items():
+            key = (asset_name, get_bucket_start(update_time, seconds))
+            candle = candles.get(key)
+            if candle is None:
+                candles[key] = [price, price, price, price, 1, update_time, update_time]
+                continue
+            if update_time < candle[5]:
+                candle[0] = price
+                candle[5] = update_time
+            if update_time >= candle[6]:
+                candle[3] = price
+                candle[6] = update_time
+            candle[1] = max(candle[1], price)
+            candle[2] = min(candle[2], price)
+            candle[4] += 1
+
+    def get_rows(self, seconds: int) -> List[RollupRow]:
+        return [(asset_name, open_time, *candle) for (asset_name, open_time), candle in self.candles[seconds].items()]
+
+    def clear(self) -> None:
+        for candles in self.candles.values():
+            candles.clear()
+
+
+def upsert_rollups(db_manager: DBManager, db_session: DBSession, accumulator: RollupAccumulator) -> None:
+    """
+    Merge the accumulated candles into the rollup tables of the session db
+    """
+    for seconds, table in ROLLUP_TABLES.items():
+        rows = accumulator.get_rows(seconds)
+        if rows:
+            db_session.executemany(db_manager.get_upsert_rollup_query(table), rows)
+
+
+def to_candles(rows: List[tuple]) -> list:
+    """
+    Convert the bucket epochs selected by the candle queries to datetimes. MySQL sums the tick counts as decimals
+    """
+    return [(datetime.fromtimestamp(int(open_time)), open_price, high, low, close_price, int(tick_count))
+            for open_time, open_price, high, low, close_price, tick_count in rows]
+
+
+def get_rollup_candles(db_manager: DBManager, asset_name: str, start_date: datetime, end_date: datetime,
+                       interval_seconds: int, rollup_seconds: int, table: str) -> list:
+    """
+    Build OHLC candles from a rollup table. The rollup buckets which overlap the date range are included as a whole
+    """
+    query = f"""
+        SELECT candles.bucket * %s, open_data.`open`, candles.high, candles.low, close_data.`close`,
+               candles.tick_count
+        FROM (
+            SELECT {db_manager.get_epoch_bucket_sql('open_time')} AS bucket, MIN(open_time) AS first_open_time,
+                   MAX(open_time) AS last_open_time, MAX(high) AS high, MIN(low) AS low,
+                   SUM(tick_count) AS tick_count
+            FROM {table} WHERE asset_name = %s AND open_time BETWEEN %s AND %s
+            GROUP BY bucket
+        ) AS candles
+        JOIN {table} AS open_data ON open_data.asset_name = %s AND open_data.open_time = candles.first_open_time
+        JOIN {table} AS close_data ON close_data.asset_name = %s AND close_data.open_time = candles.last_open_time
+        ORDER BY candles.bucket
+    """
+    values = (interval_seconds, interval_seconds, asset_name, get_bucket_start(start_date, rollup_seconds), end_date,
+              asset_name, asset_name)
+    return to_candles(db_manager.execute_transaction([query], [values]))
+
+
+def backfill_rollups(db_manager: DBManager, chunk_size: int = DEFAULT_BACKFILL_CHUNK_SIZE,
+                     progress_callback: Optional[Callable[[int, int], None]] = None) -> int:
+    """
+    Build the rollups for the historical data inserted before the rollup tables were created. The raw data is read
+    in chunks ordered by update id and the progress is saved with every chunk, so the backfill can be interrupted
+    and resumed without counting any update twice
+    :param progress_callback: called with the last backfilled and the last update id to backfill after every chunk
+    :return: number of backfilled updates
+    """
+    backfilled_count = 0
+    accumulator = RollupAccumulator()
+    max_update_id, backfilled_update_id = db_manager.execute_transaction(
+        ["SELECT max_update_id, backfilled_update_id FROM rollup_backfill WHERE id = 1"], [()])[0]
+    while backfilled_update_id < max_update_id:
+        with db_manager.transaction() as db_session:
+            query = """
+                SELECT update_id, asset_name, update_time, price FROM historical_data
+                WHERE update_id > %s AND update_id <= %s ORDER BY update_id LIMIT %s
+            """
+            rows = db_session.execute(query, (backfilled_update_id, max_update_id, chunk_size))
+            for update_id, asset_name, update_time, price in rows:
+                accumulator.add(asset_name, update_time, price)
+            upsert_rollups(db_manager, db_session, accumulator)
+            accumulator.clear()
+            backfilled_update_id = rows[-1][0] if rows else max_update_id
+            db_session.execute("UPDATE rollup_backfill SET backfilled_update_id = %s WHERE id = 1",
+                               (backfilled_update_id,))
+        backfilled_count += len(rows)
+        if progress_callback is not None:
+            progress_callback(backfilled_update_id, max_update_id)
+    return backfilled_count
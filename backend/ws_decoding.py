@@ -0,0 +1,198 @@
+import json
+from abc import ABC, abstractmethod
+from typing import Dict, Union, Optional, Any, NamedTuple, Type
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+WSMessage = Union[str, bytes]
+
+AGG_INDEX_UPDATE_TYPE = '5'
+TRADE_TYPE = '0'
+TOP_OF_BOOK_TYPE = '30'
+TYPE_MARKER = '"TYPE":"'
+TYPE_MARKER_BYTES = TYPE_MARKER.encode()
+
+
+class AggIndexUpdate(NamedTuple):
+    """
+    The fields of an aggregated index update used by the app, missing fields are None
+    """
+    from_symbol: Optional[str]
+    price: Optional[float]
+    open_day: Optional[float]
+
+
+class TradeUpdate(NamedTuple):
+    """
+    A trade print of an exchange, missing fields are None
+    """
+    market: Optional[str]
+    from_symbol: Optional[str]
+    side: Optional[int]  # 1 sell, 2 buy, 4 unknown
+    trade_id: Optional[str]
+    timestamp: Optional[int]  # epoch seconds
+    quantity: Optional[float]
+    price: Optional[float]
+    total: Optional[float]  # quantity * price in the quote currency
+
+
+class TopOfBookUpdate(NamedTuple):
+    """
+    The best bid and ask of an exchange. An update may carry only one side of the book, the other one is None
+    """
+    market: Optional[str]
+    from_symbol: Optional[str]
+    bid: Optional[float]
+    bid_quantity: Optional[float]
+    ask: Optional[float]
+    ask_quantity: Optional[float]
+
+
+def get_agg_index_update(message: Dict[str, Any]) -> AggIndexUpdate:
+    return AggIndexUpdate(message.get('FROMSYMBOL'), message.get('PRICE'), message.get('OPENDAY'))
+
+
+def get_trade_update(message: Dict[str, Any]) -> TradeUpdate:
+    return TradeUpdate(message.get('M'), message.get('FSYM'), message.get('F'), message.get('ID'), message.get('TS'),
+                       message.get('Q'), message.get('P'), message.get('TOTAL'))
+
+
+def get_top_of_book_update(message: Dict[str, Any]) -> TopOfBookUpdate:
+    bids = message.get('BID')
+    asks = message.get('ASK')
+    bid = bids[0] if bids else {}
+    ask = asks[0] if asks else {}
+    return TopOfBookUpdate(message.get('M'), message.get('FSYM'), bid.get('P'), bid.get('Q'), ask.get('P'),
+                           ask.get('Q'))
+
+
+def get_message_type(message: WSMessage) -> Optional[str]:
+    """
+    Get the message TYPE without decoding the message. CryptoCompare sends compact JSON, so the type is found with a
+    substring search
+    :return: message type or None if the message is formatted differently and has to be decoded to get it
+    """
+    if isinstance(message, bytes):
+        start = message.find(TYPE_MARKER_BYTES)
+        if start == -1:
+            return None
+        start += len(TYPE_MARKER_BYTES)
+        end = message.find(b'"', start)
+        return message[start:end].decode() if end != -1 else None
+    start = message.find(TYPE_MARKER)
+    if start == -1:
+        return None
+    start += len(TYPE_MARKER)
+    end = message.find('"', start)
+    return message[start:end] if end != -1 else None
+
+
+class WSMessageDecoder(ABC):
+    """
+    Base class for the websocket message decoders
+    """
+    name = ''
+
+    @abstractmethod
+    def decode(self, message: WSMessage) -> Dict[str, Any]:
+        """
+        Decode a message of any type to a dict
+        """
+        raise NotImplementedError
+
+    def decode_agg_index_update(self, message: WSMessage) -> AggIndexUpdate:
+        """
+        Decode an aggregated index update, the fields which are not used by the app are skipped if the decoder
+        supports it
+        """
+        return get_agg_index_update(self.decode(message))
+
+    def decode_trade(self, message: WSMessage) -> TradeUpdate:
+        return get_trade_update(self.decode(message))
+
+    def decode_top_of_book(self, message: WSMessage) -> TopOfBookUpdate:
+        return get_top_of_book_update(self.decode(message))
+
+
+class StdlibDecoder(WSMessageDecoder):
+    name = 'json'
+
+    def decode(self, message: WSMessage) -> Dict[str, Any]:
+        return json.loads(message)
+
+    def decode_agg_index_update(self, message: WSMessage) -> AggIndexUpdate:
+        return get_agg_index_update(json.loads(message))
+
+
+class OrjsonDecoder(WSMessageDecoder):
+    """
+    Requires orjson
+    """
+    name = 'orjson'
+
+    def decode(self, message: WSMessage) -> Dict[str, Any]:
+        return orjson.loads(message)
+
+    def decode_agg_index_update(self, message: WSMessage) -> AggIndexUpdate:
+        return get_agg_index_update(orjson.loads(message))
+
+
+class MsgspecDecoder(WSMessageDecoder):
+    """
+    Decodes aggregated index updates straight into a typed struct, the other fields are skipped without creating
+    Python objects for them. Requires msgspec
+    """
+    name = 'msgspec'
+
+    def __init__(self):
+        class MsgspecAggIndexUpdate(msgspec.Struct, rename={'from_symbol': 'FROMSYMBOL', 'price': 'PRICE',
+                                                            'open_day': 'OPENDAY'}):
+            from_symbol: Optional[str] = None
+            price: Optional[float] = None
+            open_day: Optional[float] = None
+
+        self.decoder = msgspec.json.Decoder()
+        self.agg_index_update_decoder = msgspec.json.Decoder(MsgspecAggIndexUpdate)
+
+    def decode(self, message: WSMessage) -> Dict[str, Any]:
+        return self.decoder.decode(message)
+
+    def decode_agg_index_update(self, message: WSMessage) -> AggIndexUpdate:
+        # The struct has the same fields as AggIndexUpdate
+        return self.agg_index_update_decoder.decode(message)
+
+
+def get_decoders() -> Dict[str, Type[WSMessageDecoder]]:
+    """
+    Get the available decoders by name, the fastest first. The orjson and msgspec decoders are only available with
+    the packages installed
+    """
+    decoders = []
+    if msgspec is not None:
+        decoders.append(MsgspecDecoder)
+    if orjson is not None:
+        decoders.append(OrjsonDecoder)
+    decoders.append(StdlibDecoder)
+    return {decoder.name: decoder for decoder in decoders}
+
+
+def get_decoder(name: Optional[str] = None) -> WSMessageDecoder:
+    """
+    Create a decoder by name
+    :param name: 'msgspec', 'orjson' or 'json', None picks the fastest available decoder
+    """
+    decoders = get_decoders()
+    if name is None:
+        return next(iter(decoders.values()))()
+    if name not in decoders:
+        raise ValueError(f'Websocket message decoder {name!r} is not available, available decoders are '
+                         f'{", ".join(decoders)}')
+    return decoders[name]()
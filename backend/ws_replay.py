@@ -0,0 +1,128 @@
+"""
+Recording and replaying of the websocket feed. WSManager writes the received frames to a recording when
+WS_RECORD_FILE is set in the config. The replay server is a local stand-in for the CryptoCompare streamer, point
+WS_URL at it to run the app without a live connection:
+
+    python -m backend.ws_replay recording.gz --port 8765 --speed 10
+"""
+import argparse
+import asyncio
+import gzip
+from time import monotonic
+from typing import Iterator, Tuple, Optional, Union
+
+import websockets
+
+REPLAY_YIELD_INTERVAL = 1000  # frames sent at max speed before other tasks get a chance to run
+
+
+class WSRecorder:
+    """
+    The class writes the received websocket frames with the time passed since the recording started to a gzip
+    compressed text file, a frame per line
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.file = gzip.open(filename, 'wt', encoding='utf-8')
+        self.start_time: Optional[float] = None
+        self.frame_count = 0
+
+    def record(self, message: Union[str, bytes]) -> None:
+        now = monotonic()
+        if self.start_time is None:
+            self.start_time = now
+        if isinstance(message, bytes):
+            message = message.decode()
+        # Newlines can only be whitespace between JSON tokens, so replacing them keeps the frame valid
+        message = message.replace('\n', ' ')
+        self.file.write(f'{now - self.start_time:.6f}\t{message}\n')
+        self.frame_count += 1
+
+    def close(self) -> None:
+        if not self.file.closed:
+            self.file.close()
+            print(f'Recorded {self.frame_count} websocket frames to {self.filename}')
+
+
+def read_recording(filename: str) -> Iterator[Tuple[float, str]]:
+    """
+    Read the frames of a recording
+    :return: (seconds since the recording started, frame) iterator
+    """
+    with gzip.open(filename, 'rt', encoding='utf-8') as f:
+        for line in f:
+            offset, message = line.rstrip('\n').split('\t', 1)
+            yield float(offset), message
+
+
+class ReplayServer:
+    """
+    A websocket server which replays a recording to every client. The subscription messages of the clients are
+    accepted and ignored
+    """
+
+    def __init__(self, filename: str, speed: float = 1.0, loop: bool = False):
+        """
+        :param speed: replay speed multiplier, 0 sends the frames as fast as possible
+        :param loop: start over when the recording ends instead of keeping the connection idle
+        """
+        self.filename = filename
+        self.speed = speed
+        self.loop = loop
+
+    async def replay(self, ws: websockets.WebSocketServerProtocol) -> int:
+        """
+        Send the recording once
+        :return: number of sent frames
+        """
+        start_time = monotonic()
+        sent_count = 0
+        for offset, message in read_recording(self.filename):
+            if self.speed > 0:
+                delay = start_time + offset / self.speed - monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif sent_count % REPLAY_YIELD_INTERVAL == 0:
+                await asyncio.sleep(0)
+            await ws.send(message)
+            sent_count += 1
+        elapsed = monotonic() - start_time
+        print(f'Replayed {sent_count} frames in {elapsed:.2f}s ({sent_count / max(elapsed, 1e-9):.0f} frames/s)')
+        return sent_count
+
+    async def handle_client(self, ws: websockets.WebSocketServerProtocol, path: str = '') -> None:
+        async def ignore_client_messages():
+            async for _ in ws:
+                pass
+
+        reader_task = asyncio.create_task(ignore_client_messages())
+        try:
+            while True:
+                await self.replay(ws)
+                if not self.loop:
+                    await reader_task  # Keeps the connection open until the client closes it
+                    return
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            reader_task.cancel()
+
+    async def serve(self, host: str, port: int) -> None:
+        async with websockets.serve(self.handle_client, host, port):
+            print(f'Replaying {self.filename} on ws://{host}:{port}')
+            await asyncio.Future()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('recording', help='recording written by WSRecorder')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed multiplier, 0 is max speed')
+    parser.add_argument('--loop', action='store_true', help='replay the recording in a loop')
+    args = parser.parse_args()
+    try:
+        asyncio.run(ReplayServer(args.recording, args.speed, args.loop).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
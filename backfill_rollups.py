@@ -0,0 +1,16 @@
+from backend.db_management import create_db_manager, DEFAULT_DB_ENGINE, DEFAULT_SQLITE_PATH
+from backend.rollups import backfill_rollups
+import config
+
+
+def print_progress(backfilled_update_id: int, max_update_id: int) -> None:
+    print(f'Backfilled updates up to id {backfilled_update_id} of {max_update_id}')
+
+
+if __name__ == "__main__":
+    db_manager = create_db_manager(getattr(config, 'DB_ENGINE', DEFAULT_DB_ENGINE), config.DB_HOST, config.DB_USER,
+                                   config.DB_PASSWORD, config.DB_NAME,
+                                   getattr(config, 'SQLITE_PATH', DEFAULT_SQLITE_PATH))
+    backfilled = backfill_rollups(db_manager, progress_callback=print_progress)
+    print(f'Rollups backfilled from {backfilled} updates')
+    db_manager.close_pool()
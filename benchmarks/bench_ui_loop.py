@@ -0,0 +1,129 @@
+"""
+Compares the idle CPU usage and the tick-to-screen latency of the legacy Tk polling loop with the AsyncioBridge.
+Ticks are injected into the asyncio loop from a separate thread, like websocket messages arriving on a socket. The
+latency is measured from the tick arrival until Tk runs its idle tasks, which is when the changed widgets are
+redrawn. Requires a display
+
+    python -m benchmarks.bench_ui_loop --duration 5 --ticks 200
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import tkinter
+from threading import Thread
+from time import perf_counter, process_time, sleep
+from typing import Dict, List
+
+from frontend.async_bridge import AsyncioBridge
+
+POLLING_INTERVAL = 0.01  # seconds, the legacy App.update_ui sleep
+
+
+class TickTarget:
+    """
+    A window with a label which is updated on every tick
+    """
+
+    def __init__(self, root: tkinter.Tk):
+        self.root = root
+        self.label = tkinter.Label(root, text='0')
+        self.label.pack()
+        self.latencies: List[float] = []
+
+    def show_tick(self, arrival_time: float) -> None:
+        self.label.configure(text=f'{arrival_time:.6f}')
+        self.root.after_idle(self.record_latency, arrival_time)
+
+    def record_latency(self, arrival_time: float) -> None:
+        self.latencies.append(perf_counter() - arrival_time)
+
+
+def inject_ticks(loop: asyncio.AbstractEventLoop, callback, tick_count: int, seed: int) -> None:
+    rng = random.Random(seed)
+    for _ in range(tick_count):
+        sleep(rng.uniform(0.001, 0.02))
+        loop.call_soon_threadsafe(callback, perf_counter())
+
+
+def get_results(idle_cpu: float, idle_duration: float, latencies: List[float]) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    return {
+        'idle_cpu_percent': idle_cpu / idle_duration * 100,
+        'latency_mean_ms': statistics.mean(latencies) * 1000,
+        'latency_p50_ms': latencies[len(latencies) // 2] * 1000,
+        'latency_p99_ms': latencies[int(len(latencies) * 0.99)] * 1000,
+        'ticks': len(latencies)
+    }
+
+
+def bench_polling_loop(duration: float, tick_count: int, seed: int) -> Dict[str, float]:
+    """
+    The legacy loop: asyncio drives Tk by calling update() every POLLING_INTERVAL seconds
+    """
+    root = tkinter.Tk()
+    target = TickTarget(root)
+
+    async def main():
+        async def pump():
+            while True:
+                root.update()
+                await asyncio.sleep(POLLING_INTERVAL)
+
+        pump_task = asyncio.create_task(pump())
+        await asyncio.sleep(0.5)
+        cpu_start = process_time()
+        await asyncio.sleep(duration)
+        idle_cpu = process_time() - cpu_start
+        injector = Thread(target=inject_ticks, args=(asyncio.get_running_loop(), target.show_tick, tick_count, seed))
+        injector.start()
+        while injector.is_alive() or len(target.latencies) < tick_count:
+            await asyncio.sleep(0.05)
+        pump_task.cancel()
+        return idle_cpu
+
+    idle_cpu = asyncio.run(main())
+    root.destroy()
+    return get_results(idle_cpu, duration, target.latencies)
+
+
+def bench_bridge(duration: float, tick_count: int, seed: int) -> Dict[str, float]:
+    """
+    The AsyncioBridge: Tk runs its own mainloop, ticks are passed from the asyncio thread with call_in_ui
+    """
+    root = tkinter.Tk()
+    target = TickTarget(root)
+    bridge = AsyncioBridge(root)
+    results = {}
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(0.5)
+        cpu_start = process_time()
+        await asyncio.sleep(duration)
+        results['idle_cpu'] = process_time() - cpu_start
+        injector = Thread(target=inject_ticks,
+                          args=(loop, lambda t: bridge.call_in_ui(target.show_tick, t), tick_count, seed))
+        injector.start()
+        while injector.is_alive() or len(target.latencies) < tick_count:
+            await asyncio.sleep(0.05)
+        bridge.call_in_ui(root.quit)
+
+    bridge.start(main)
+    root.mainloop()
+    bridge.join()
+    root.destroy()
+    return get_results(results['idle_cpu'], duration, target.latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=5.0, help='idle measurement duration in seconds')
+    parser.add_argument('--ticks', type=int, default=200, help='number of ticks for the latency measurement')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps({
+        'polling_loop': bench_polling_loop(args.duration, args.ticks, args.seed),
+        'asyncio_bridge': bench_bridge(args.duration, args.ticks, args.seed)
+    }, indent=4))
@@ -0,0 +1,75 @@
+"""
+Measures the websocket message decoding throughput of every available decoder. The legacy path decodes every
+message with json.loads and checks the fields of the dict, the decoder paths drop the irrelevant message types after
+the type pre-check and only decode the aggregated index updates. The corpus is either a file with one message per
+line, a recording written by WSRecorder or a synthetic corpus modelled on the CryptoCompare aggregated index stream
+
+    python -m benchmarks.bench_ws_decoding --messages 200000
+    python -m benchmarks.bench_ws_decoding --corpus messages.txt
+    python -m benchmarks.bench_ws_decoding --corpus recording.gz
+"""
+import argparse
+import json
+from time import perf_counter
+from typing import List, Dict, Callable, Optional
+
+from backend.ws_replay import read_recording
+from backend.ws_decoding import get_decoders, get_message_type, AGG_INDEX_UPDATE_TYPE, WSMessageDecoder
+from benchmarks.data_generator import generate_ws_messages
+
+
+def load_corpus(filename: str) -> List[str]:
+    if filename.endswith('.gz'):
+        return [message for offset, message in read_recording(filename)]
+    with open(filename) as f:
+        return [line.rstrip('\n') for line in f if line.strip()]
+
+
+def legacy_pipeline(corpus: List[str]) -> int:
+    processed = 0
+    for message in corpus:
+        update = json.loads(message)
+        if 'TYPE' in update and update['TYPE'] == '5':
+            if 'FROMSYMBOL' in update and 'PRICE' in update:
+                processed += 1
+    return processed
+
+
+def get_decoder_pipeline(decoder: WSMessageDecoder) -> Callable[[List[str]], int]:
+    def pipeline(corpus: List[str]) -> int:
+        processed = 0
+        for message in corpus:
+            message_type = get_message_type(message)
+            if message_type is None:
+                message_type = decoder.decode(message).get('TYPE')
+            if message_type == AGG_INDEX_UPDATE_TYPE:
+                update = decoder.decode_agg_index_update(message)
+                if update.from_symbol is not None and update.price is not None:
+                    processed += 1
+        return processed
+    return pipeline
+
+
+def bench(pipeline: Callable[[List[str]], int], corpus: List[str], repeat: int) -> Dict[str, float]:
+    best: Optional[float] = None
+    processed = 0
+    for _ in range(repeat):
+        start = perf_counter()
+        processed = pipeline(corpus)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {'messages_per_second': len(corpus) / best, 'price_updates': processed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='file with one websocket message per line or a .gz recording')
+    parser.add_argument('--messages', type=int, default=100000, help='synthetic corpus size')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    corpus = load_corpus(args.corpus) if args.corpus else generate_ws_messages(args.messages, args.seed)
+    results = {'messages': len(corpus), 'legacy_json': bench(legacy_pipeline, corpus, args.repeat)}
+    for name, decoder_class in get_decoders().items():
+        results[name] = bench(get_decoder_pipeline(decoder_class()), corpus, args.repeat)
+    print(json.dumps(results, indent=4))
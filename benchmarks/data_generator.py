@@ -0,0 +1,114 @@
+"""
+Deterministic synthetic market data for the benchmarks. The same seed always produces the same data, so the results
+of different commits are comparable
+"""
+import json
+import random
+from datetime import datetime, timedelta
+from typing import List, Iterator
+
+import numpy as np
+
+from backend.market_data_management import HistoricalDataRow
+
+ASSETS = ['BTC', 'ETH', 'SOL', 'XRP', 'DOGE', 'ADA', 'AVAX', 'DOT', 'LINK', 'LTC']
+HEARTBEAT_SHARE = 0.05
+TICKS_START_TIME = datetime(2024, 1, 1)
+TICK_INTERVAL = timedelta(milliseconds=100)  # Time between two consecutive ticks of any asset
+TICKS_CHUNK_SIZE = 100000
+
+
+def generate_ws_messages(message_count: int, seed: int) -> List[str]:
+    """
+    Generate aggregated index updates with the field set of the CryptoCompare stream, mixed with heartbeats and
+    subscription messages
+    """
+    rng = random.Random(seed)
+    prices = {asset: rng.uniform(0.1, 60000) for asset in ASSETS}
+    messages = [json.dumps({'TYPE': '20', 'MESSAGE': 'STREAMERWELCOME', 'SERVER_UPTIME_SECONDS': 1,
+                            'SERVER_NAME': 'ccc-streamer01', 'SERVER_TIME_MS': 1700000000000, 'CLIENT_ID': 1,
+                            'DATA_FORMAT': 'JSON', 'SOCKET_ID': 'abc', 'SOCKETS_ACTIVE': 1, 'SOCKETS_REMAINING': 0,
+                            'RATELIMIT_MAX_SECOND': 30, 'RATELIMIT_MAX_MINUTE': 60, 'RATELIMIT_MAX_HOUR': 1200,
+                            'RATELIMIT_MAX_DAY': 10000, 'RATELIMIT_MAX_MONTH': 20000,
+                            'RATELIMIT_REMAINING_SECOND': 29, 'RATELIMIT_REMAINING_MINUTE': 59,
+                            'RATELIMIT_REMAINING_HOUR': 1199, 'RATELIMIT_REMAINING_DAY': 9999,
+                            'RATELIMIT_REMAINING_MONTH': 19999}, separators=(',', ':'))]
+    for asset in ASSETS:
+        messages.append(json.dumps({'TYPE': '16', 'MESSAGE': 'SUBSCRIBECOMPLETE', 'SUB': f'5~CCCAGG~{asset}~USD'},
+                                   separators=(',', ':')))
+    timestamp = 1700000000
+    snapshot_sent = set()
+    while len(messages) < message_count:
+        if rng.random() < HEARTBEAT_SHARE:
+            messages.append(json.dumps({'TYPE': '999', 'MESSAGE': 'HEARTBEAT', 'TIMEMS': timestamp * 1000},
+                                       separators=(',', ':')))
+            continue
+        asset = rng.choice(ASSETS)
+        prices[asset] *= 1 + rng.gauss(0, 0.0005)
+        timestamp += rng.randint(0, 1)
+        update = {'TYPE': '5', 'MARKET': 'CCCAGG', 'FROMSYMBOL': asset, 'TOSYMBOL': 'USD', 'FLAGS': rng.choice([1, 2]),
+                  'PRICE': round(prices[asset], 8), 'LASTUPDATE': timestamp,
+                  'LASTVOLUME': round(rng.uniform(0, 5), 8), 'LASTVOLUMETO': round(rng.uniform(0, 5e4), 8),
+                  'LASTTRADEID': str(rng.randint(1, 10 ** 9)), 'VOLUMEDAY': round(rng.uniform(0, 1e5), 8),
+                  'VOLUMEDAYTO': round(rng.uniform(0, 1e9), 8), 'VOLUMEHOUR': round(rng.uniform(0, 1e4), 8),
+                  'VOLUMEHOURTO': round(rng.uniform(0, 1e8), 8), 'LASTMARKET': 'Coinbase',
+                  'CURRENTSUPPLYMKTCAP': round(rng.uniform(0, 1e12), 2)}
+        # The first update of an asset is a snapshot with the day open price, only some of the next ones carry it
+        if asset not in snapshot_sent or rng.random() < 0.1:
+            snapshot_sent.add(asset)
+            update['OPENDAY'] = round(prices[asset] * rng.uniform(0.95, 1.05), 8)
+        messages.append(json.dumps(update, separators=(',', ':')))
+    return messages
+
+
+def generate_exchange_messages(message_count: int, seed: int) -> List[str]:
+    """
+    Generate trade prints and top of book updates of the Coinbase exchange with the field sets of the CryptoCompare
+    stream, half of each
+    """
+    rng = random.Random(seed)
+    prices = {asset: rng.uniform(0.1, 60000) for asset in ASSETS}
+    timestamp = 1700000000
+    messages = []
+    for i in range(message_count):
+        asset = rng.choice(ASSETS)
+        prices[asset] *= 1 + rng.gauss(0, 0.0005)
+        price = round(prices[asset], 8)
+        timestamp += rng.randint(0, 1)
+        if i % 2:
+            quantity = round(rng.uniform(0, 5), 8)
+            message = {'TYPE': '0', 'M': 'Coinbase', 'FSYM': asset, 'TSYM': 'USD', 'F': rng.choice([1, 2]),
+                       'ID': str(rng.randint(1, 10 ** 9)), 'TS': timestamp, 'Q': quantity, 'P': price,
+                       'TOTAL': round(quantity * price, 8), 'RTS': timestamp, 'CCSEQ': i, 'TSNS': 0, 'RTSNS': 0}
+        else:
+            message = {'TYPE': '30', 'M': 'Coinbase', 'FSYM': asset, 'TSYM': 'USD',
+                       'BID': [{'P': round(price * 0.9999, 8), 'Q': round(rng.uniform(0, 5), 8),
+                                'REPORTEDNS': timestamp * 10 ** 9}],
+                       'ASK': [{'P': round(price * 1.0001, 8), 'Q': round(rng.uniform(0, 5), 8),
+                                'REPORTEDNS': timestamp * 10 ** 9}]}
+        messages.append(json.dumps(message, separators=(',', ':')))
+    return messages
+
+
+def get_tick_time(index: int) -> datetime:
+    return TICKS_START_TIME + index * TICK_INTERVAL
+
+
+def generate_ticks(start_index: int, count: int, seed: int) -> Iterator[List[HistoricalDataRow]]:
+    """
+    Generate historical data rows in chunks. Tick i belongs to ASSETS[i % len(ASSETS)] and happens at get_tick_time(i).
+    Every chunk of TICKS_CHUNK_SIZE ticks is generated from its own seed, so a table can be extended with the next
+    ticks later and still contain the same data as a table generated at once
+    """
+    end_index = start_index + count
+    chunk_index = start_index // TICKS_CHUNK_SIZE
+    while chunk_index * TICKS_CHUNK_SIZE < end_index:
+        chunk_start = chunk_index * TICKS_CHUNK_SIZE
+        rng = np.random.default_rng([seed, chunk_index])
+        prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.0005, TICKS_CHUNK_SIZE)))
+        changes = rng.normal(0, 2, TICKS_CHUNK_SIZE)
+        first = max(start_index, chunk_start)
+        last = min(end_index, chunk_start + TICKS_CHUNK_SIZE)
+        yield [(ASSETS[i % len(ASSETS)], get_tick_time(i), float(prices[i - chunk_start]),
+                float(changes[i - chunk_start])) for i in range(first, last)]
+        chunk_index += 1
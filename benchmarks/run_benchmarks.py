@@ -0,0 +1,411 @@
+"""
+Benchmark suite for the hot paths: websocket update processing and channel dispatch, historical data inserts, range
+queries over large tables, in-memory recent tick queries, file export and the watchlist repaint. The db benchmarks run
+against a separate benchmark database which is filled with deterministic synthetic ticks. Results are printed or
+saved as JSON together with the commit they were measured on, so runs of different commits can be compared
+
+    python -m benchmarks.run_benchmarks --output results.json
+    python -m benchmarks.run_benchmarks --table-sizes 100000 --only ws_processing,insert,query
+    python -m benchmarks.run_benchmarks --db-engine sqlite --sqlite-path bench.db
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timedelta
+from os import path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Dict, List, Callable, Any, Optional
+
+import mysql.connector as connector
+
+from backend.db_management import DBManager, SQLiteDBManager, create_db_manager, DB_ENGINES, DB_ERRORS, \
+    DEFAULT_DB_ENGINE
+from backend.market_data_management import WSManager, BatchWriter, TickBuffer, insert_to_historical_data, \
+    insert_many_to_historical_data, get_historical_data, get_candles, DEFAULT_TICK_BUFFER_SIZE, WS_CHANNELS, \
+    CHANNEL_INSERTS
+from backend.market_updates import MarketUpdateQueue
+from backend.historical_data_export import export_historical_data, get_exporters
+from backend.ws_decoding import get_decoders, get_message_type, AGG_INDEX_UPDATE_TYPE
+from benchmarks.data_generator import ASSETS, generate_ws_messages, generate_exchange_messages, generate_ticks, \
+    get_tick_time, TICK_INTERVAL
+
+BENCHMARKS = ('ws_processing', 'ws_channels', 'tick_buffer', 'insert', 'query', 'export', 'watchlist')
+DEFAULT_BENCH_DB_NAME = 'crypto_dashboard_bench'
+DEFAULT_BENCH_SQLITE_PATH = 'crypto_dashboard_bench.db'
+DEFAULT_TABLE_SIZES = '1000000,10000000'
+POPULATE_BATCH_SIZE = 10000
+QUERY_WINDOWS = {'1h': timedelta(hours=1), '1d': timedelta(days=1)}
+
+Results = Dict[str, Any]
+
+
+def get_latency_stats(latencies: List[float]) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    return {
+        'median_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+        'min_ms': latencies[0] * 1000
+    }
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_ws_processing(message_count: int, seed: int) -> Results:
+    """
+    Throughput of the websocket message handling without the network: type check, decoding and
+    process_ws_agg_idx_update, which updates the market state and queues the history rows
+    """
+    messages = generate_ws_messages(message_count, seed)
+    results = {'messages': len(messages)}
+    for name, decoder_class in get_decoders().items():
+        decoder = decoder_class()
+        updates = [decoder.decode_agg_index_update(message) for message in messages
+                   if get_message_type(message) == AGG_INDEX_UPDATE_TYPE]
+        history_writer = BatchWriter(None, 'historical data', insert_many_to_historical_data,
+                                     max_queue_size=len(messages) * 2)
+        ws_manager = WSManager(MarketUpdateQueue(), history_writer, [], ASSETS, decoder)
+        start = perf_counter()
+        for update in updates:
+            ws_manager.process_ws_agg_idx_update(update)
+        process_time = perf_counter() - start
+        start = perf_counter()
+        for message in messages:
+            if get_message_type(message) == AGG_INDEX_UPDATE_TYPE:
+                ws_manager.process_ws_agg_idx_update(decoder.decode_agg_index_update(message))
+        pipeline_time = perf_counter() - start
+        results[name] = {
+            'process_updates_per_second': len(updates) / process_time,
+            'messages_per_second': len(messages) / pipeline_time
+        }
+    return results
+
+
+def bench_ws_channels(message_count: int, seed: int) -> Results:
+    """
+    Per-channel cost of the websocket message dispatch with all the channels subscribed: type check, routing, decoding
+    and queueing the rows of the channel tables, measured by the channel counters of WSManager
+    """
+    messages = generate_ws_messages(message_count, seed) + generate_exchange_messages(message_count, seed)
+    results = {'messages': len(messages)}
+    for name, decoder_class in get_decoders().items():
+        history_writer = BatchWriter(None, 'historical data', insert_many_to_historical_data,
+                                     max_queue_size=len(messages))
+        channel_writers = {channel: BatchWriter(None, channel, insert_rows, max_queue_size=len(messages))
+                           for channel, insert_rows in CHANNEL_INSERTS.items()}
+        ws_manager = WSManager(MarketUpdateQueue(), history_writer, [], ASSETS, decoder_class(),
+                               channels=WS_CHANNELS, channel_writers=channel_writers)
+        connection = ws_manager.connections[0]
+        start = perf_counter()
+        for message in messages:
+            ws_manager.process_message(connection, message)
+        elapsed = perf_counter() - start
+        results[name] = {
+            'messages_per_second': len(messages) / elapsed,
+            'channels': {channel.name: {'messages': channel.messages_received,
+                                        'us_per_message': channel.processing_time / channel.messages_received * 1e6}
+                         for channel in ws_manager.channels.values()}
+        }
+    return results
+
+
+def bench_tick_buffer(tick_count: int, capacity: int, repeat: int, seed: int) -> Results:
+    """
+    Cost of appending a tick to the in-memory TickBuffer of an asset and of the recent tick queries answered from it
+    without the db
+    """
+    from numpy.random import default_rng
+
+    prices = (100 * (1 + default_rng(seed).normal(0, 0.01, tick_count))).tolist()
+    tick_interval = TICK_INTERVAL // timedelta(milliseconds=1)
+    times = [i * tick_interval for i in range(tick_count)]  # epoch milliseconds
+    tick_buffer = TickBuffer(capacity)
+    start = perf_counter()
+    for timestamp, price in zip(times, prices):
+        tick_buffer.append(timestamp, price)
+    append_time = perf_counter() - start
+    end_time = times[-1]
+    queries = {
+        'last_100': lambda: tick_buffer.last(100)[1],
+        'last_minute': lambda: tick_buffer.since(end_time - 60000)[1],
+        'last_hour': lambda: tick_buffer.since(end_time - 3600000)[1],
+        'sparkline_100_points': lambda: tick_buffer.sample(end_time - 3600000, 100),
+        'summary_300_points': lambda: tick_buffer.summarize(end_time - 3600000, 300)['sparkline']
+    }
+    results = {
+        'ticks': tick_count,
+        'capacity': capacity,
+        'memory_bytes': tick_buffer.times.nbytes + tick_buffer.prices.nbytes,
+        'appends_per_second': tick_count / append_time
+    }
+    for name, query in queries.items():
+        latencies = []
+        for _ in range(repeat):
+            start = perf_counter()
+            query()
+            latencies.append(perf_counter() - start)
+        results[name] = {'rows': len(query()), 'median_us': statistics.median(latencies) * 1e6}
+    return results
+
+
+def reset_tables(db_manager: DBManager) -> None:
+    statement = 'DELETE FROM' if isinstance(db_manager, SQLiteDBManager) else 'TRUNCATE TABLE'
+    tables = ('historical_data', 'candles_1m', 'candles_1h')
+    db_manager.execute_transaction([f"{statement} {table}" for table in tables], [()] * len(tables))
+
+
+def count_rows(db_manager: DBManager) -> int:
+    return db_manager.execute_transaction(["SELECT COUNT(*) FROM historical_data"], [()])[0][0]
+
+
+def insert_ticks(db_manager: DBManager, start_index: int, count: int, seed: int, batch_size: int) -> float:
+    """
+    Insert the synthetic ticks in batches
+    :return: rows per second
+    """
+    elapsed = 0.0
+    for chunk in generate_ticks(start_index, count, seed):
+        for i in range(0, len(chunk), batch_size):
+            start = perf_counter()
+            insert_many_to_historical_data(db_manager, chunk[i:i + batch_size])
+            elapsed += perf_counter() - start
+    return count / elapsed
+
+
+def bench_insert(db_manager: DBManager, single_row_count: int, batch_row_count: int, seed: int) -> Results:
+    """
+    Rows per second of the legacy single-row insert and of the batched insert used by the history writer. The
+    benchmark appends the next synthetic ticks to the table
+    """
+    index = count_rows(db_manager)
+    results = {}
+    rows = [row for chunk in generate_ticks(index, single_row_count, seed) for row in chunk]
+    start = perf_counter()
+    for asset_name, update_time, price, change in rows:
+        insert_to_historical_data(db_manager, asset_name, price, update_time, change)
+    results['single_row_per_second'] = single_row_count / (perf_counter() - start)
+    index += single_row_count
+    for batch_size in (500, 5000):
+        results[f'batch_{batch_size}_rows_per_second'] = insert_ticks(db_manager, index, batch_row_count, seed,
+                                                                      batch_size)
+        index += batch_row_count
+    return results
+
+
+def get_query_windows(table_rows: int, window: timedelta, repeat: int, seed: int) -> List[datetime]:
+    """
+    Get deterministic window starts spread over the time range of the table
+    """
+    last_start = get_tick_time(table_rows) - window
+    if last_start <= get_tick_time(0):
+        return [get_tick_time(0)] * repeat
+    step = (last_start - get_tick_time(0)) / repeat
+    offset = step * ((seed % 97) / 97)
+    return [get_tick_time(0) + offset + i * step for i in range(repeat)]
+
+
+def measure_latency(function: Callable[[datetime], Any], starts: List[datetime]) -> Dict[str, float]:
+    latencies = []
+    rows = 0
+    for start_date in starts:
+        start = perf_counter()
+        rows = len(function(start_date))
+        latencies.append(perf_counter() - start)
+    return {**get_latency_stats(latencies), 'rows': rows}
+
+
+def bench_query(db_manager: DBManager, table_sizes: List[int], repeat: int, seed: int) -> Results:
+    """
+    Latency of the raw data and candle range queries of a single asset. The table is extended with synthetic ticks up
+    to every table size before it is measured
+    """
+    results = {}
+    asset = ASSETS[0]
+    for table_size in table_sizes:
+        row_count = count_rows(db_manager)
+        size_results = {}
+        if row_count < table_size:
+            size_results['populate_rows_per_second'] = insert_ticks(db_manager, row_count, table_size - row_count,
+                                                                    seed, POPULATE_BATCH_SIZE)
+        size_results['table_rows'] = max(row_count, table_size)
+        for window_name, window in QUERY_WINDOWS.items():
+            starts = get_query_windows(size_results['table_rows'], window, repeat, seed)
+            size_results[f'historical_data_{window_name}'] = measure_latency(
+                lambda start_date: get_historical_data(db_manager, asset, start_date, start_date + window), starts)
+            size_results[f'candles_1m_{window_name}'] = measure_latency(
+                lambda start_date: get_candles(db_manager, asset, start_date, start_date + window, '1m'), starts)
+        results[str(table_size)] = size_results
+    return results
+
+
+def bench_export(db_manager: DBManager, window: timedelta) -> Results:
+    """
+    Rows per second of the streaming export of the last window of the table to every available file format
+    """
+    results = {}
+    asset = ASSETS[0]
+    end_date = get_tick_time(count_rows(db_manager))
+    start_date = end_date - window
+    with TemporaryDirectory() as temp_dir:
+        for extension in get_exporters():
+            exported = [0]
+            filename = path.join(temp_dir, f'export{extension}')
+            start = perf_counter()
+            export_historical_data(db_manager, asset, start_date, end_date, filename,
+                                   lambda processed: exported.__setitem__(0, processed))
+            elapsed = perf_counter() - start
+            results[extension.lstrip('.')] = {'rows': exported[0], 'rows_per_second': exported[0] / elapsed,
+                                              'file_bytes': path.getsize(filename)}
+    return results
+
+
+def bench_watchlist(tick_count: int, row_count: int, seed: int) -> Results:
+    """
+    Cost of WatchlistFrame.update_asset per tick, of the following Tk redraw and of adding a watchlist row. Requires a
+    display
+    """
+    import tkinter
+    import customtkinter as ctk
+    from numpy.random import default_rng
+    import frontend.main_app  # The frontend modules import each other, the app module has to be imported first
+    from frontend.watchlist_management import WatchlistFrame
+    from frontend.image_cache import image_cache
+    from backend.market_state import MarketState
+
+    try:
+        root = ctk.CTk()
+    except tkinter.TclError as e:
+        return {'skipped': f'no display: {e}'}
+    # The asset has a bundled icon, so no icon is downloaded
+    asset = 'error_icon'
+    market_state = MarketState()
+    asset_state = market_state.add(asset, 8, 8)
+    api_keys = {'': ''}
+    watchlist_frame = WatchlistFrame(root, market_state, tkinter.StringVar(root, ''), api_keys)
+    watchlist_frame.pack()
+    root.update()
+    prices = 100 * (1 + default_rng(seed).normal(0, 0.01, tick_count))
+    start = perf_counter()
+    for price in prices:
+        market_state.set_price(asset_state, float(price), float(price) - 100)
+        watchlist_frame.update_asset(asset)
+    update_time = perf_counter() - start
+    start = perf_counter()
+    for price in prices[:tick_count // 10]:
+        market_state.set_price(asset_state, float(price) + 1, asset_state.change)
+        watchlist_frame.update_asset(asset)
+        root.update_idletasks()
+    redraw_time = perf_counter() - start
+    # The rows have no downloaded icons, so they show the bundled error icon
+    for i in range(row_count):
+        market_state.add(f'ROW{i}', 8, 8)
+    start = perf_counter()
+    for i in range(row_count):
+        watchlist_frame.add_asset(f'ROW{i}')
+    root.update_idletasks()
+    add_rows_time = perf_counter() - start
+    root.destroy()
+    return {
+        'update_asset_us_per_tick': update_time / tick_count * 1e6,
+        'update_and_redraw_us_per_tick': redraw_time / (tick_count // 10) * 1e6,
+        'add_row_ms': add_rows_time / row_count * 1000,
+        'row_widgets': len(watchlist_frame.rows),
+        'image_cache': image_cache.stats()
+    }
+
+
+def connect_bench_db(args: argparse.Namespace) -> DBManager:
+    if args.db_engine == 'mysql':
+        # MySQLDBManager only prints connection errors, so the server is checked first
+        connector.connect(host=args.db_host, user=args.db_user, password=args.db_password).close()
+    return create_db_manager(args.db_engine, args.db_host, args.db_user, args.db_password, args.db_name,
+                             args.sqlite_path)
+
+
+def run(args: argparse.Namespace) -> Results:
+    selected = args.only.split(',') if args.only else BENCHMARKS
+    table_sizes = [int(size) for size in args.table_sizes.split(',')]
+    results: Results = {}
+    if 'ws_processing' in selected:
+        results['ws_processing'] = bench_ws_processing(args.messages, args.seed)
+    if 'ws_channels' in selected:
+        results['ws_channels'] = bench_ws_channels(args.messages, args.seed)
+    if 'tick_buffer' in selected:
+        results['tick_buffer'] = bench_tick_buffer(args.ticks, args.tick_buffer_size, args.repeat, args.seed)
+    db_benchmarks = [name for name in ('insert', 'query', 'export') if name in selected]
+    if db_benchmarks:
+        db_manager = None
+        try:
+            db_manager = connect_bench_db(args)
+        except DB_ERRORS as e:
+            for name in db_benchmarks:
+                results[name] = {'skipped': f'db is not available: {e}'}
+        if db_manager is not None:
+            if not args.keep_data:
+                reset_tables(db_manager)
+            if 'insert' in selected:
+                results['insert'] = bench_insert(db_manager, args.single_rows, args.batch_rows, args.seed)
+            if 'query' in selected:
+                results['query'] = bench_query(db_manager, table_sizes, args.repeat, args.seed)
+            if 'export' in selected:
+                results['export'] = bench_export(db_manager, QUERY_WINDOWS['1d'])
+            db_manager.close_pool()
+    if 'watchlist' in selected:
+        results['watchlist'] = bench_watchlist(args.ticks, args.rows, args.seed)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    try:
+        import config
+    except ImportError:
+        config = None
+    parser.add_argument('--db-engine', choices=DB_ENGINES, default=getattr(config, 'DB_ENGINE', DEFAULT_DB_ENGINE))
+    parser.add_argument('--sqlite-path', default=DEFAULT_BENCH_SQLITE_PATH,
+                        help='SQLite benchmark database, its historical data is replaced')
+    parser.add_argument('--db-host', default=getattr(config, 'DB_HOST', 'localhost'))
+    parser.add_argument('--db-user', default=getattr(config, 'DB_USER', 'root'))
+    parser.add_argument('--db-password', default=getattr(config, 'DB_PASSWORD', ''))
+    parser.add_argument('--db-name', default=DEFAULT_BENCH_DB_NAME,
+                        help='benchmark database, its historical data is replaced')
+    parser.add_argument('--keep-data', action='store_true',
+                        help="don't clear the benchmark tables, so a large table is only populated once")
+    parser.add_argument('--only', help=f'comma separated benchmarks to run: {",".join(BENCHMARKS)}')
+    parser.add_argument('--table-sizes', default=DEFAULT_TABLE_SIZES, help='comma separated query table sizes')
+    parser.add_argument('--messages', type=int, default=200000, help='websocket messages to process')
+    parser.add_argument('--single-rows', type=int, default=2000, help='rows inserted one by one')
+    parser.add_argument('--batch-rows', type=int, default=100000, help='rows inserted per batch size')
+    parser.add_argument('--ticks', type=int, default=10000, help='watchlist and tick buffer ticks')
+    parser.add_argument('--tick-buffer-size', type=int, default=DEFAULT_TICK_BUFFER_SIZE,
+                        help='ticks kept by the tick buffer')
+    parser.add_argument('--rows', type=int, default=100, help='watchlist rows added')
+    parser.add_argument('--repeat', type=int, default=20, help='queries per measurement')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='save the results to this JSON file instead of printing them')
+    args = parser.parse_args()
+    report = {
+        'meta': {
+            'commit': get_commit(),
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'args': {name: value for name, value in vars(args).items() if name != 'db_password'},
+            'tick_interval_ms': TICK_INTERVAL / timedelta(milliseconds=1)
+        },
+        'results': run(args)
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
@@ -2,3 +2,29 @@ DB_HOST = "localhost"
 DB_USER = "root"
 DB_PASSWORD = "<PASSWORD>"
 DB_NAME = "<DB_NAME>"
+
+# Optional settings
+DB_ENGINE = 'mysql'  # 'sqlite' stores the data in an embedded db file and ignores the MySQL settings above
+SQLITE_PATH = 'crypto_data.db'  # SQLite db file
+HISTORY_FLUSH_INTERVAL = 1.0  # Max seconds a price update waits in the queue before it is written to the db
+HISTORY_BATCH_SIZE = 500  # Max price updates written to the db in a single INSERT
+HISTORY_QUEUE_SIZE = 100000  # Max price updates waiting to be written, new updates are dropped when it is full
+DB_POOL_SIZE = 5  # Max number of simultaneously opened db connections
+DB_USE_PREPARED_STATEMENTS = False  # Run queries as server-side prepared statements
+DB_PARTITION_HISTORY = False  # Partition the historical data table by month, so old months can be dropped cheaply
+RAW_RETENTION_DAYS = None  # Remove raw price updates older than this number of days, None keeps them forever
+ROLLUP_1M_RETENTION_DAYS = None  # Remove per-minute candles older than this number of days, None keeps them forever
+UI_REFRESH_RATE = 15  # Max watchlist repaints per second, updates received in between are coalesced
+INGESTION_MODE = 'thread'  # 'process' runs the websocket client and the history writer in a separate process
+WS_DECODER = None  # 'msgspec', 'orjson' or 'json', None picks the fastest installed websocket message decoder
+WS_URL = 'wss://streamer.cryptocompare.com/v2'  # Point at a local replay server (backend/ws_replay.py) to run offline
+WS_RECORD_FILE = None  # Record the received websocket frames to this gzip file for replaying
+WS_CONNECTIONS = 1  # Number of websocket connections the watchlist subscriptions are spread over
+WS_USE_ALL_API_KEYS = False  # Open a websocket connection with every stored API key, not only the active one
+WS_CHANNELS = ['agg_index']  # Add 'trades' and 'top_of_book' to store the trades and the best bid and ask in the db
+WS_EXCHANGES = ['Coinbase']  # Exchanges of the 'trades' and 'top_of_book' channels
+TICK_BUFFER_SIZE = 3600  # Recent ticks kept in memory per asset for the sparkline, 32 bytes each, 0 keeps none
+COIN_LIST_CACHE_FILE = 'coin_list_cache.json'  # The valid asset tickers are cached here, so startup needs no network
+COIN_LIST_TTL = 86400  # Seconds before the cached asset tickers are revalidated in the background
+PRINT_STATS = False  # Print the websocket and watchlist counters on exit, e.g. to measure an offline replay
+HEADLESS_STATUS_INTERVAL = 60  # Seconds between the status lines printed by the headless collector (headless.py)
@@ -1,10 +1,10 @@
 import customtkinter as ctk
 from tkinter import StringVar, IntVar
-from PIL import Image
 from typing import Dict, DefaultDict, Optional
 from os import path
 
 import frontend.main_app
+from frontend.image_cache import image_cache
 
 
 class APIKeysMenu(ctk.CTkToplevel):
@@ -112,12 +112,8 @@ class APIKeyContainer:
                                            anchor='e')
         self.key_label = ctk.CTkLabel(self.api_keys_table, textvariable=self.key_var, font=('Lucida Console', 14),
                                       anchor='e')
-        delete_image = ctk.CTkImage(light_image=Image.open(self.DELETE_ICON_BLACK_PATH),
-                                    dark_image=Image.open(self.DELETE_ICON_WHITE_PATH),
-                                    size=(30, 30))
-        show_key_image = ctk.CTkImage(light_image=Image.open(self.EYE_ICON_BLACK_PATH),
-                                      dark_image=Image.open(self.EYE_ICON_WHITE_PATH),
-                                      size=(30, 30))
+        delete_image = image_cache.get_ctk_image(self.DELETE_ICON_BLACK_PATH, self.DELETE_ICON_WHITE_PATH, (30, 30))
+        show_key_image = image_cache.get_ctk_image(self.EYE_ICON_BLACK_PATH, self.EYE_ICON_WHITE_PATH, (30, 30))
         self.delete_button = ctk.CTkButton(self.api_keys_table, text='', width=30, height=30, image=delete_image,
                                            command=self.delete, fg_color='transparent', hover_color='grey')
         self.show_private_button = ctk.CTkButton(self.api_keys_table, text='', width=30, height=30,
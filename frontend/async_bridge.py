@@ -0,0 +1,119 @@
+import asyncio
+import socket
+import tkinter
+from queue import SimpleQueue, Empty
+from threading import Thread, Event, Lock
+from typing import Callable, Coroutine, Optional, Any, Tuple
+
+UI_POLL_INTERVAL = 20  # ms, used where Tk can't watch the wakeup socket
+
+
+class AsyncioBridge:
+    """
+    The class runs an asyncio event loop in a background thread, so Tk can run its own event-driven mainloop in the
+    main thread. Both loops sleep until they have something to do. Functions are passed to the asyncio thread with
+    call_soon and back to the Tk thread with call_in_ui. The asyncio thread never calls Tcl: it wakes the Tk thread
+    up by writing to a socket which Tk watches, so a busy UI can't stall the ingestion loop
+    """
+
+    def __init__(self, root: tkinter.Misc):
+        self.root = root
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[Thread] = None
+        self.loop_ready = Event()
+        self.ui_calls: SimpleQueue[Tuple[Callable, tuple]] = SimpleQueue()
+        self.ui_wakeup_lock = Lock()
+        self.ui_wakeup_pending = False
+        self.closing = False
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.wakeup_writer.setblocking(False)
+        # Tk on Windows has no file handlers, the queued calls are polled there
+        self.watch_wakeup = hasattr(self.root.tk, 'createfilehandler')
+        if self.watch_wakeup:
+            self.root.tk.createfilehandler(self.wakeup_reader, tkinter.READABLE, self.on_wakeup)
+
+    def start(self, main: Callable[[], Coroutine[Any, Any, None]]) -> None:
+        """
+        Start the asyncio thread and run the main coroutine in it
+        """
+        self.thread = Thread(target=self.run_loop, args=(main,), name='asyncio', daemon=True)
+        self.thread.start()
+        self.loop_ready.wait()
+        if not self.watch_wakeup:
+            self.root.after(UI_POLL_INTERVAL, self.poll_ui_calls)
+
+    def run_loop(self, main: Callable[[], Coroutine[Any, Any, None]]) -> None:
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop_ready.set()
+        try:
+            self.loop.run_until_complete(main())
+        finally:
+            self.loop.close()
+
+    def join(self) -> None:
+        """
+        Wait for the main coroutine to finish after the Tk mainloop has exited. The Tk thread stops accepting calls
+        from the asyncio thread
+        """
+        self.closing = True
+        if self.thread is not None:
+            self.thread.join()
+        if self.watch_wakeup:
+            self.root.tk.deletefilehandler(self.wakeup_reader)
+        self.wakeup_reader.close()
+        self.wakeup_writer.close()
+
+    def call_soon(self, callback: Callable, *args) -> None:
+        """
+        Schedule a call in the asyncio thread. Safe to call from the Tk thread
+        """
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # The main coroutine has already finished and the loop is closed
+            pass
+
+    def call_in_ui(self, callback: Callable, *args) -> None:
+        """
+        Schedule a call in the Tk thread. Safe to call from any thread, it never blocks. Calls made before the Tk
+        thread wakes up are processed together
+        """
+        if self.closing:
+            return
+        self.ui_calls.put((callback, args))
+        with self.ui_wakeup_lock:
+            if self.ui_wakeup_pending:
+                return
+            self.ui_wakeup_pending = True
+        if self.watch_wakeup:
+            try:
+                self.wakeup_writer.send(b'\0')
+            except OSError:
+                # The socket buffer is full, so a wakeup is already on its way, or the bridge is closed
+                pass
+
+    def on_wakeup(self, file: socket.socket, mask: int) -> None:
+        try:
+            while self.wakeup_reader.recv(4096):
+                pass
+        except OSError:
+            # Drained
+            pass
+        self.process_ui_calls()
+
+    def poll_ui_calls(self) -> None:
+        self.process_ui_calls()
+        if not self.closing:
+            self.root.after(UI_POLL_INTERVAL, self.poll_ui_calls)
+
+    def process_ui_calls(self) -> None:
+        with self.ui_wakeup_lock:
+            self.ui_wakeup_pending = False
+        while True:
+            try:
+                callback, args = self.ui_calls.get_nowait()
+            except Empty:
+                break
+            callback(*args)
@@ -1,51 +1,232 @@
 import customtkinter as ctk
-from typing import List, Union
+from typing import Optional, List
 from tkinter import StringVar
 from datetime import datetime
-import csv
+from threading import Thread, Event
 
 import frontend.main_app
-from backend.db_management import MIN_DATETIME, MAX_DATETIME
+from backend.db_management import MIN_DATETIME, MAX_DATETIME, MAX_INT, DB_ERRORS
+from backend.market_data_management import CANDLE_INTERVALS, RecentTicksSummary
+from backend.historical_data_export import DATETIME_FORMAT, ExportCancelled, UnsupportedExportFormat, \
+    get_exporter_class
 
-DATETIME_FORMAT = '%Y-%m-%d_%H:%M:%S'
+EXPORT_POLL_INTERVAL = 100  # ms
+RECENT_TICKS_WINDOW = 3600  # seconds
+RECENT_TICKS_REFRESH_INTERVAL = 1000  # ms
+SPARKLINE_POINTS = 300
+SPARKLINE_HEIGHT = 60  # px
 
 
 class HistoricalDataMenu(ctk.CTkToplevel):
     """
-    A CTkToplevel window that allows the user to view saved historical data
+    A CTkToplevel window that allows the user to view saved historical data and the recent ticks of the asset
     """
 
     def __init__(self, master: 'frontend.main_app.App', asset_ticker: str):
         super().__init__(master)
         self.app = master
         self.title(f'{asset_ticker} historical data')
-        self.geometry(f"{600}x{160}")
+        self.geometry(f"{700}x{260}")
+        self.protocol('WM_DELETE_WINDOW', self.on_close)
         self.asset_ticker = asset_ticker
         self.search_frame = HistoricalDataSearch(self, self.app, self.asset_ticker)
+        self.export_progress_frame = ExportProgressFrame(self)
+        self.recent_ticks_frame = RecentTicksFrame(self, self.app, self.asset_ticker)
+        self.export_thread: Optional[Thread] = None
+        self.export_cancel_event = Event()
+        self.export_error: Optional[BaseException] = None
+        self.export_total_rows = 0
+        self.export_processed_rows = 0
+        self.export_filename = ''
         self.columnconfigure(0, weight=1)
-        self.rowconfigure(1, weight=1)
+        self.rowconfigure(2, weight=1)
         self.search_frame.grid(row=0, column=0, sticky='ew', padx=10, pady=(10, 0))
+        self.recent_ticks_frame.grid(row=2, column=0, sticky='nsew', padx=10, pady=10)
+        self.recent_ticks_frame.request_summary()
+
+    def start_export(self, start_datetime: datetime, end_datetime: datetime, output_filename: str,
+                     interval: Optional[str]) -> None:
+        """
+        Start exporting the historical data in a worker thread and show the export progress
+        :param interval: export OHLC candles of the given interval instead of raw updates
+        """
+        self.export_cancel_event = Event()
+        self.export_error = None
+        self.export_total_rows = 0
+        self.export_processed_rows = 0
+        self.export_filename = output_filename
+        self.export_thread = Thread(target=self.run_export,
+                                    args=(start_datetime, end_datetime, output_filename, interval), daemon=True)
+        self.export_thread.start()
+        self.search_frame.enter_button.configure(state='disabled')
+        self.export_progress_frame.reset()
+        self.export_progress_frame.grid(row=1, column=0, sticky='ew', padx=10, pady=(5, 0))
+        self.after(EXPORT_POLL_INTERVAL, self.check_export)
+
+    def run_export(self, start_datetime: datetime, end_datetime: datetime, output_filename: str,
+                   interval: Optional[str]) -> None:
+        """
+        Export worker, runs outside the UI thread
+        """
+        try:
+            if interval is None:
+                self.export_total_rows = self.app.count_historical_data(self.asset_ticker, start_datetime,
+                                                                        end_datetime)
+            self.app.export_historical_data(self.asset_ticker, start_datetime, end_datetime, output_filename,
+                                            interval, self.set_export_progress, self.export_cancel_event)
+        except BaseException as e:
+            self.export_error = e
+
+    def set_export_progress(self, processed_rows: int) -> None:
+        self.export_processed_rows = processed_rows
+
+    def check_export(self) -> None:
+        """
+        Update the export progress and show the export result when the worker is finished
+        """
+        if not self.winfo_exists():
+            return
+        self.export_progress_frame.set_progress(self.export_processed_rows, self.export_total_rows)
+        if self.export_thread.is_alive():
+            self.after(EXPORT_POLL_INTERVAL, self.check_export)
+            return
+        self.export_thread = None
+        self.export_progress_frame.grid_remove()
+        self.search_frame.enter_button.configure(state='normal')
+        if self.export_error is None:
+            self.search_frame.show_status(f'Data successfully saved to {self.export_filename}', 'LimeGreen')
+        elif isinstance(self.export_error, ExportCancelled):
+            self.search_frame.show_status('Export cancelled', 'red')
+        elif isinstance(self.export_error, PermissionError):
+            self.search_frame.show_status(f'Permission denied writing to {self.export_filename}', 'red')
+        elif isinstance(self.export_error, (OSError, *DB_ERRORS)):
+            self.search_frame.show_status(f'Export failed: {self.export_error}', 'red')
+        else:
+            raise self.export_error
+
+    def cancel_export(self) -> None:
+        self.export_cancel_event.set()
+
+    def on_close(self) -> None:
+        self.cancel_export()
+        self.destroy()
+
+
+class ExportProgressFrame(ctk.CTkFrame):
+    """
+    The class displays the historical data export progress and allows user to cancel it
+    """
+
+    def __init__(self, master: HistoricalDataMenu):
+        super().__init__(master, fg_color='transparent')
+        self.historical_data_menu = master
+        self.progress_message = StringVar(self, '')
+        self.progress_bar = ctk.CTkProgressBar(self)
+        self.progress_label = ctk.CTkLabel(self, textvariable=self.progress_message, font=('Helvetica', 14))
+        self.cancel_button = ctk.CTkButton(self, text='Cancel', command=self.historical_data_menu.cancel_export)
+        self.columnconfigure(0, weight=1)
+        self.progress_bar.grid(row=0, column=0, sticky='ew')
+        self.progress_label.grid(row=0, column=1, padx=10)
+        self.cancel_button.grid(row=0, column=2)
+
+    def reset(self) -> None:
+        self.progress_bar.set(0)
+        self.progress_message.set('Querying data')
+
+    def set_progress(self, processed_rows: int, total_rows: int) -> None:
+        if total_rows:
+            self.progress_bar.set(min(processed_rows / total_rows, 1))
+            self.progress_message.set(f'{processed_rows} / {total_rows} rows')
+        elif processed_rows:
+            self.progress_message.set(f'{processed_rows} rows')
+
+
+class RecentTicksFrame(ctk.CTkFrame):
+    """
+    The class shows a sparkline and the price range of the asset ticks received in the last hour. The ticks are
+    summarized by the ingestion side from its in-memory tick buffer, so the db is not queried
+    """
+
+    def __init__(self, master: HistoricalDataMenu, app: 'frontend.main_app.App', asset_ticker: str):
+        super().__init__(master)
+        self.app = app
+        self.asset_ticker = asset_ticker
+        self.summary: Optional[RecentTicksSummary] = None
+        self.summary_message = StringVar(self, 'Loading the recent ticks')
+        self.summary_label = ctk.CTkLabel(self, textvariable=self.summary_message, font=('Helvetica', 14),
+                                          anchor='w')
+        sparkline_height = round(SPARKLINE_HEIGHT * ctk.ScalingTracker.get_widget_scaling(self))
+        self.sparkline = ctk.CTkCanvas(self, height=sparkline_height, highlightthickness=0)
+        self.columnconfigure(0, weight=1)
+        self.summary_label.grid(row=0, column=0, sticky='ew', padx=10)
+        self.sparkline.grid(row=1, column=0, sticky='ew', padx=10, pady=(0, 10))
+        self.sparkline.bind('<Configure>', lambda event: self.draw_sparkline())
+
+    def request_summary(self) -> None:
+        self.app.send_ingestion_query('get_recent_ticks_summary',
+                                      (self.asset_ticker, RECENT_TICKS_WINDOW, SPARKLINE_POINTS), self.show_summary)
+
+    def show_summary(self, summary: Optional[RecentTicksSummary]) -> None:
+        """
+        Show the summary and request the next one after the refresh interval. The next summary is only requested
+        after the previous one is shown, so the requests don't pile up behind a busy ingestion loop
+        """
+        if not self.winfo_exists():
+            return
+        self.summary = summary
+        if summary is None:
+            self.summary_message.set('No ticks received in the last hour')
+        else:
+            asset_state = self.app.market_state.get(self.asset_ticker)
+            rounding = asset_state.price_rounding if asset_state is not None else MAX_INT
+            change = (summary['close'] - summary['open']) / summary['open'] * 100 if summary['open'] else 0.0
+            self.summary_message.set(f"Last hour: {summary['tick_count']} ticks, "
+                                     f"low {round(summary['low'], rounding)}, high {round(summary['high'], rounding)}, "
+                                     f"last {round(summary['close'], rounding)} ({change:+.2f}%)")
+        self.draw_sparkline()
+        self.after(RECENT_TICKS_REFRESH_INTERVAL, self.request_summary)
+
+    def draw_sparkline(self) -> None:
+        self.sparkline.configure(bg=self._apply_appearance_mode(self.cget('fg_color')))
+        self.sparkline.delete('all')
+        if self.summary is None or len(self.summary['sparkline']) < 2:
+            return
+        prices: List[float] = self.summary['sparkline']
+        width = self.sparkline.winfo_width()
+        height = self.sparkline.winfo_height()
+        low = min(prices)
+        price_range = max(prices) - low or 1.0
+        step = (width - 1) / (len(prices) - 1)
+        coords = []
+        for i, price in enumerate(prices):
+            coords.append(i * step)
+            coords.append((height - 2) * (1 - (price - low) / price_range) + 1)
+        color = 'red' if prices[-1] < prices[0] else 'LimeGreen'
+        self.sparkline.create_line(*coords, fill=color, width=2)
 
 
 class HistoricalDataSearch(ctk.CTkFrame):
     """
     The class allows user to specify what asset historical data he wants to load
     """
-    CSV_HEADER = ['Asset', 'Update_time', 'Price', 'Change']
+    RAW_DATA_RESOLUTION = 'Raw updates'
 
     def __init__(self, master: HistoricalDataMenu, app: 'frontend.main_app.App', asset_ticker: str):
         super().__init__(master, fg_color='transparent')
+        self.historical_data_menu = master
         self.app = app
         self.asset_ticker = asset_ticker
         self.start_date_var = StringVar(self, value=MIN_DATETIME.strftime(DATETIME_FORMAT))
         self.end_date_var = StringVar(self, value=MAX_DATETIME.strftime(DATETIME_FORMAT))
         self.output_filename_var = StringVar(self, value='output.csv')
+        self.resolution_var = StringVar(self, value=self.RAW_DATA_RESOLUTION)
         self.status_message = StringVar(self, '')
-        self.columnconfigure((0, 1, 2, 3), weight=1)
+        self.columnconfigure((0, 1, 2, 3, 4), weight=1)
         self.status_label = None
         self.start_date_entry = None
         self.end_date_entry = None
         self.output_filename_entry = None
+        self.resolution_optionmenu = None
         self.enter_button = None
         self._create_header()
         self.init_frames()
@@ -54,9 +235,11 @@ class HistoricalDataSearch(ctk.CTkFrame):
         asset = ctk.CTkLabel(self, text='Start date', font=('Helvetica', 14))
         price = ctk.CTkLabel(self, text='End date', font=('Helvetica', 14))
         change = ctk.CTkLabel(self, text='Output filename', font=('Helvetica', 14))
+        resolution = ctk.CTkLabel(self, text='Resolution', font=('Helvetica', 14))
         asset.grid(row=0, column=0, sticky='w')
         price.grid(row=0, column=1, sticky='w')
         change.grid(row=0, column=2, sticky='w')
+        resolution.grid(row=0, column=3, sticky='w')
 
     def init_frames(self) -> None:
         self.status_label = ctk.CTkLabel(self, textvariable=self.status_message,
@@ -64,40 +247,37 @@ class HistoricalDataSearch(ctk.CTkFrame):
         self.start_date_entry = ctk.CTkEntry(self, textvariable=self.start_date_var)
         self.end_date_entry = ctk.CTkEntry(self, textvariable=self.end_date_var)
         self.output_filename_entry = ctk.CTkEntry(self, textvariable=self.output_filename_var)
+        self.resolution_optionmenu = ctk.CTkOptionMenu(self, values=[self.RAW_DATA_RESOLUTION, *CANDLE_INTERVALS],
+                                                       variable=self.resolution_var)
         self.enter_button = ctk.CTkButton(self, text='Save', command=self.validate_query)
         self.start_date_entry.grid(row=1, column=0, sticky='ew')
         self.end_date_entry.grid(row=1, column=1, sticky='ew')
         self.output_filename_entry.grid(row=1, column=2, sticky='ew')
-        self.enter_button.grid(row=1, column=3, sticky='ew')
-        self.status_label.grid(row=2, column=0, sticky='ew', columnspan=4)
+        self.resolution_optionmenu.grid(row=1, column=3, sticky='ew')
+        self.enter_button.grid(row=1, column=4, sticky='ew')
+        self.status_label.grid(row=2, column=0, sticky='ew', columnspan=5)
 
-    def save_history_data_to_csv(self, output_filename: str, data: List[List[Union[str, datetime, float]]]):
-        """
-        Saves an extracted list of historical data to a csv file
-        """
-        for row in data:
-            row[1] = row[1].strftime(DATETIME_FORMAT)
-        with open(output_filename, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(self.CSV_HEADER)
-            writer.writerows(data)
+    def show_status(self, message: str, color: str) -> None:
+        self.status_label.configure(text_color=color)
+        self.status_message.set(message)
 
     def validate_query(self) -> None:
         """
-        Check if the query is correct and load the requested data
+        Check if the query is correct and start exporting the requested data
         """
         try:
             start_datetime = datetime.strptime(self.start_date_var.get(), DATETIME_FORMAT)
             end_datetime = datetime.strptime(self.end_date_var.get(), DATETIME_FORMAT)
-            data = self.app.get_historical_data(self.asset_ticker, start_datetime, end_datetime)
-            try:
-                self.save_history_data_to_csv(self.output_filename_var.get(), data)
-                self.status_label.configure(text_color='LimeGreen')
-                self.status_message.set(f'Data successfully saved to {self.output_filename_var.get()}')
-            except PermissionError:
-                self.status_label.configure(text_color='red')
-                self.status_message.set(f'Permission denied writing to {self.output_filename_var.get()}')
         except ValueError:
             valid_format = MAX_DATETIME.strftime(DATETIME_FORMAT)
-            self.status_label.configure(text_color='red')
-            self.status_message.set(f'Invalid date format, valid format is {valid_format}')
+            self.show_status(f'Invalid date format, valid format is {valid_format}', 'red')
+            return
+        try:
+            get_exporter_class(self.output_filename_var.get())
+        except UnsupportedExportFormat as e:
+            self.show_status(str(e), 'red')
+            return
+        interval = None if self.resolution_var.get() == self.RAW_DATA_RESOLUTION else self.resolution_var.get()
+        self.show_status('', 'LimeGreen')
+        self.historical_data_menu.start_export(start_datetime, end_datetime, self.output_filename_var.get(),
+                                               interval)
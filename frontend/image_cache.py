@@ -0,0 +1,56 @@
+import customtkinter as ctk
+from PIL import Image
+from typing import Dict, Tuple
+
+ImageKey = Tuple[str, str, Tuple[int, int]]  # (light theme image path, dark theme image path, size)
+
+
+class ImageCache:
+    """
+    The class keeps the decoded images and the CTkImage objects built from them, so every image file is read once and
+    the rows showing the same icon share a single CTkImage. CTkImage objects support being shown by several widgets
+    and switch between the light and the dark image with the theme. Must be used in the UI thread only
+    """
+
+    def __init__(self):
+        self.images: Dict[str, Image.Image] = {}
+        self.ctk_images: Dict[ImageKey, ctk.CTkImage] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_image(self, image_path: str) -> Image.Image:
+        image = self.images.get(image_path)
+        if image is None:
+            image = Image.open(image_path)
+            image.load()  # Decodes the image and closes the file
+            self.images[image_path] = image
+        return image
+
+    def get_ctk_image(self, light_image_path: str, dark_image_path: str, size: Tuple[int, int]) -> ctk.CTkImage:
+        """
+        Get the shared CTkImage of the given theme images and size
+        """
+        key = (light_image_path, dark_image_path, size)
+        ctk_image = self.ctk_images.get(key)
+        if ctk_image is not None:
+            self.hits += 1
+            return ctk_image
+        self.misses += 1
+        ctk_image = ctk.CTkImage(light_image=self.get_image(light_image_path),
+                                 dark_image=self.get_image(dark_image_path), size=size)
+        self.ctk_images[key] = ctk_image
+        return ctk_image
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the cache hit and miss counters and the number of cached images
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'decoded_images': len(self.images),
+            'ctk_images': len(self.ctk_images)
+        }
+
+
+image_cache = ImageCache()  # Shared by all the windows of the app
@@ -1,14 +1,27 @@
 import asyncio
 import customtkinter as ctk
 from tkinter import StringVar
-from typing import List, Union, Optional
+from typing import List, Union, Optional, Callable, Set, Sequence, Any
 from collections import defaultdict
 from datetime import datetime
+from threading import Event
 
-from backend.market_data_management import WSManager, get_historical_data, get_valid_assets
-from backend.db_management import DBManager, MAX_INT
-from frontend.watchlist_management import WatchlistFrame
+from backend.market_data_management import get_historical_data, count_historical_data, get_candles, Candle
+from backend.historical_data_export import export_historical_data, export_candles
+from backend.market_data_management import DEFAULT_HISTORY_FLUSH_INTERVAL, DEFAULT_HISTORY_BATCH_SIZE, \
+    DEFAULT_HISTORY_QUEUE_SIZE, DEFAULT_WS_URL, DEFAULT_WS_CONNECTIONS, DEFAULT_TICK_BUFFER_SIZE, DEFAULT_WS_CHANNELS, \
+    DEFAULT_WS_EXCHANGES
+from backend.db_management import RetentionManager, create_db_manager, MAX_INT, DEFAULT_POOL_SIZE, DEFAULT_DB_ENGINE, \
+    DEFAULT_SQLITE_PATH
+from backend.market_updates import MarketUpdateQueue
+from backend.market_state import MarketState
+from backend.asset_icons import AssetIconService
+from backend.coin_list import CoinListCache, DEFAULT_COIN_LIST_CACHE_FILE, DEFAULT_COIN_LIST_TTL, \
+    COIN_LIST_RETRY_INTERVAL
+from backend.ingestion import IngestionService, IngestionProcess, INGESTION_MODES, DEFAULT_INGESTION_MODE
+from frontend.watchlist_management import WatchlistFrame, DEFAULT_UI_REFRESH_RATE, ASSETS_ICON_PATH
 from frontend.sidebar_menu import SidebarMenu
+from frontend.async_bridge import AsyncioBridge
 
 APP_NAME = 'PyCryptoDashboard'
 
@@ -19,32 +32,92 @@ class App(ctk.CTk):
     The main app class which is used for general configuration, application layout and data management
     """
 
-    def __init__(self, db_host: str, db_user: str, db_password: str, db_name: str):
+    def __init__(self, db_host: str, db_user: str, db_password: str, db_name: str,
+                 history_flush_interval: float = DEFAULT_HISTORY_FLUSH_INTERVAL,
+                 history_batch_size: int = DEFAULT_HISTORY_BATCH_SIZE,
+                 history_queue_size: int = DEFAULT_HISTORY_QUEUE_SIZE, db_pool_size: int = DEFAULT_POOL_SIZE,
+                 db_use_prepared_statements: bool = False, db_partition_history: bool = False,
+                 raw_retention_days: Optional[int] = None, rollup_1m_retention_days: Optional[int] = None,
+                 ui_refresh_rate: float = DEFAULT_UI_REFRESH_RATE, ingestion_mode: str = DEFAULT_INGESTION_MODE,
+                 ws_decoder: Optional[str] = None, ws_url: str = DEFAULT_WS_URL, ws_record_file: Optional[str] = None,
+                 db_engine: str = DEFAULT_DB_ENGINE, sqlite_path: str = DEFAULT_SQLITE_PATH,
+                 coin_list_cache_file: str = DEFAULT_COIN_LIST_CACHE_FILE,
+                 coin_list_ttl: float = DEFAULT_COIN_LIST_TTL, ws_connections: int = DEFAULT_WS_CONNECTIONS,
+                 ws_use_all_api_keys: bool = False, tick_buffer_size: int = DEFAULT_TICK_BUFFER_SIZE,
+                 ws_channels: Sequence[str] = DEFAULT_WS_CHANNELS, ws_exchanges: Sequence[str] = DEFAULT_WS_EXCHANGES,
+                 print_stats: bool = False):
+        """
+        :param ingestion_mode: 'thread' runs the websocket client and the history writer in the asyncio thread of the
+        app, 'process' runs them in a separate process
+        :param ws_decoder: websocket message decoder name, None picks the fastest available decoder
+        :param ws_url: streamer url, can point at a local replay server
+        :param ws_record_file: record the received websocket frames to this file
+        :param db_engine: 'mysql' or 'sqlite', the embedded SQLite db needs no server
+        :param sqlite_path: SQLite db file
+        :param coin_list_cache_file: file the valid asset tickers are cached in
+        :param coin_list_ttl: seconds before the cached asset tickers are revalidated with the API
+        :param ws_connections: number of websocket connections the subscriptions are spread over
+        :param ws_use_all_api_keys: open a websocket connection with every stored API key, not only the active one
+        :param tick_buffer_size: recent ticks kept in memory per asset
+        :param ws_channels: subscribed websocket channels: 'agg_index', 'trades' and 'top_of_book'
+        :param ws_exchanges: exchanges of the trade and top of book subscriptions
+        :param print_stats: print the websocket and watchlist counters when the app is closed
+        """
+        if ingestion_mode not in INGESTION_MODES:
+            raise ValueError(f'Unknown ingestion mode {ingestion_mode!r}, supported modes are {INGESTION_MODES}')
         super().__init__()
         self.title(APP_NAME)
         self.geometry(f'{1100}x{580}')
         self.protocol('WM_DELETE_WINDOW', self.on_close)
-        self.valid_assets = get_valid_assets()
-        self.watchlist_assets = {}
-        self.assets_settings = {}
+        # The cached coin set is refreshed in the background and updated in place, the sidebar shares it
+        self.coin_list = CoinListCache(coin_list_cache_file, coin_list_ttl)
+        self.valid_assets = self.coin_list.load()
+        self.market_state = MarketState()  # Watchlist assets with their latest market data and display settings
         self.api_keys = defaultdict()  # {name: key}
         self.api_keys.setdefault('')
         self.active_api_key = StringVar(self, '')  # name
+        self.ws_use_all_api_keys = ws_use_all_api_keys
         self.asyncio_tasks_dct = {}
         self.asyncio_task_group = None
-        self.db_manager = DBManager(db_host, db_user, db_password, db_name)
+        self.async_bridge = AsyncioBridge(self)
+        db_settings = {'db_engine': db_engine, 'db_host': db_host, 'db_user': db_user, 'db_password': db_password,
+                       'db_name': db_name, 'sqlite_path': sqlite_path, 'pool_size': db_pool_size,
+                       'use_prepared_statements': db_use_prepared_statements}
+        self.db_manager = create_db_manager(**db_settings, partition_history=db_partition_history)
+        self.retention_manager: Optional[RetentionManager] = None
+        if raw_retention_days is not None:
+            self.retention_manager = RetentionManager(self.db_manager, raw_retention_days, rollup_1m_retention_days)
         self.load_watchlist_assets()
         self.load_api_keys()
-        self.ws_manager = WSManager(self, self.db_manager, self.api_keys[self.active_api_key.get()],
-                                    self.watchlist_assets, self.assets_settings)
+        # Latest market data per asset, drained by the UI thread
+        self.market_updates = MarketUpdateQueue(self.schedule_market_updates)
+        api_keys = self.get_ws_api_keys()
+        self.ingestion: Optional[IngestionService] = None
+        self.ingestion_process: Optional[IngestionProcess] = None
+        if ingestion_mode == 'process':
+            service_settings = {'history_flush_interval': history_flush_interval,
+                                'history_batch_size': history_batch_size, 'history_queue_size': history_queue_size,
+                                'ws_decoder': ws_decoder, 'ws_url': ws_url, 'ws_record_file': ws_record_file,
+                                'ws_connections': ws_connections, 'tick_buffer_size': tick_buffer_size,
+                                'ws_channels': ws_channels, 'ws_exchanges': ws_exchanges, 'print_stats': print_stats}
+            self.ingestion_process = IngestionProcess(self.market_updates, db_settings, service_settings, api_keys,
+                                                      list(self.market_state))
+        else:
+            self.ingestion = IngestionService(self.db_manager, self.market_updates, api_keys, list(self.market_state),
+                                              history_flush_interval, history_batch_size, history_queue_size,
+                                              ws_decoder, ws_url, ws_record_file, ws_connections,
+                                              tick_buffer_size, ws_channels, ws_exchanges, print_stats)
+        self.icon_service = AssetIconService(ASSETS_ICON_PATH, self.async_bridge.call_in_ui)
         self.watchlist_frame: Optional[WatchlistFrame] = None
         self.sidebar_frame: Optional[SidebarMenu] = None
+        self.ui_refresh_rate = ui_refresh_rate
+        self.print_stats = print_stats
         self.init_frames()
 
     def init_frames(self):
-        self.watchlist_frame = WatchlistFrame(self, self.watchlist_assets, self.active_api_key, self.api_keys,
-                                              self.assets_settings)
-        self.sidebar_frame = SidebarMenu(self, self.valid_assets, self.watchlist_assets, self.api_keys,
+        self.watchlist_frame = WatchlistFrame(self, self.market_state, self.active_api_key, self.api_keys,
+                                              self.ui_refresh_rate, self.icon_service)
+        self.sidebar_frame = SidebarMenu(self, self.valid_assets, self.market_state, self.api_keys,
                                          self.active_api_key)
         self.columnconfigure(1, weight=1)
         self.rowconfigure(0, weight=1)
@@ -55,125 +128,214 @@ class App(ctk.CTk):
         """
         Load watchlist assets from the database
         """
-        query = "SELECT * FROM watchlist_assets"
-        values = ()
-        res = self.db_manager.execute_transaction([query], [values])
-        for row in res:
-            self.watchlist_assets[row[0]] = {'open_price': 0, 'price': 0, 'change': 0}
-            self.assets_settings[row[0]] = {'price_rounding': row[2], 'change_rounding': row[1]}
+        for asset_ticker, price_decimals, change_decimals in self.db_manager.get_watchlist_assets():
+            self.market_state.add(asset_ticker, price_decimals, change_decimals)
 
     def add_asset_to_watchlist(self, asset_ticker: str) -> None:
         """
         Adds a new asset to the watchlist and requests market data for it
         """
-        query = "INSERT INTO watchlist_assets (price_decimals, change_decimals, asset_ticker) VALUES (%s, %s, %s)"
-        values = (MAX_INT, MAX_INT, asset_ticker)
-        self.db_manager.execute_transaction([query], [values])
-        self.watchlist_assets[asset_ticker] = {'open_price': 0, 'price': 0, 'change': 0}
-        self.assets_settings[asset_ticker] = {'price_rounding': MAX_INT, 'change_rounding': MAX_INT}
-        self.stop_ws()
-        self.start_ws()
+        self.db_manager.add_watchlist_asset(asset_ticker, MAX_INT, MAX_INT)
+        self.market_state.add(asset_ticker, MAX_INT, MAX_INT)
+        self.send_ingestion_command('subscribe_asset', asset_ticker)
         self.watchlist_frame.add_asset(asset_ticker)
 
-    def update_watchlist_asset(self, asset_ticker: str) -> None:
+    def schedule_market_updates(self) -> None:
         """
-        Updates the watchlist assets based on the external websocket data
+        Wake up the UI thread to apply the market updates. Called by the ingestion side once per batch of updates
         """
-        self.watchlist_frame.update_asset(asset_ticker)
+        self.async_bridge.call_in_ui(self.apply_market_updates)
+
+    def apply_market_updates(self) -> None:
+        """
+        Updates the watchlist assets with the latest external websocket data, the rows are repainted by the watchlist
+        refresh pass
+        """
+        updates = self.market_updates.drain()
+        for asset_ticker, update in updates.items():
+            self.market_state.apply(asset_ticker, update)
+        if updates:
+            self.watchlist_frame.schedule_refresh(len(updates))
+
+    def set_valid_assets(self, coins: Set[str]) -> None:
+        """
+        Replace the valid assets with the refreshed coin set
+        """
+        self.valid_assets.clear()
+        self.valid_assets.update(coins)
 
     def update_watchlist_asset_settings(self, asset_ticker: str) -> None:
         """
         Updates the watchlist asset settings in the db after a user-triggered change
         """
-        query = "UPDATE watchlist_assets SET price_decimals = %s, change_decimals = %s WHERE asset_ticker = %s"
-        settings = self.assets_settings[asset_ticker]
-        values = (settings['price_rounding'], settings['change_rounding'], asset_ticker)
-        self.db_manager.execute_transaction([query], [values])
+        asset_state = self.market_state[asset_ticker]
+        self.db_manager.update_watchlist_asset_settings(asset_ticker, asset_state.price_rounding,
+                                                        asset_state.change_rounding)
+        # The row is repainted with the new rounding without waiting for the next price update
+        self.market_state.touch(asset_state)
+        self.watchlist_frame.schedule_refresh()
 
     def delete_watchlist_asset(self, asset_ticker: str) -> None:
         """
-        Deletes a watchlist asset from the db after a user-triggered removal
+        Deletes a watchlist asset from the db and stops its market data subscription after a user-triggered removal
         """
-        query = "DELETE FROM watchlist_assets WHERE asset_ticker = %s"
-        values = (asset_ticker,)
-        self.db_manager.execute_transaction([query], [values])
+        self.db_manager.delete_watchlist_asset(asset_ticker)
+        self.market_state.remove(asset_ticker)
+        self.send_ingestion_command('unsubscribe_asset', asset_ticker)
 
     def load_api_keys(self) -> None:
         """
         Load API keys from the db
         """
-        query = "SELECT * FROM api_keys"
-        values = ()
-        res = self.db_manager.execute_transaction([query], [values])
-        for row in res:
-            self.api_keys[row[0]] = row[1]
-            if row[2]:
-                self.active_api_key.set(row[0])
+        for name, key, active in self.db_manager.get_api_keys():
+            self.api_keys[name] = key
+            if active:
+                self.active_api_key.set(name)
 
     def add_api_key(self, api_key: str) -> None:
         """
         Adds a new API key to the db
         """
-        query = "INSERT INTO api_keys (name, `key`) VALUES (%s, %s)"
-        values = (api_key, self.api_keys[api_key])
-        self.db_manager.execute_transaction([query], [values])
+        self.db_manager.add_api_key(api_key, self.api_keys[api_key])
+        if self.ws_use_all_api_keys and self.active_api_key.get():
+            self.send_ingestion_command('restart_ws', self.get_ws_api_keys())
 
     def change_active_api_key(self, new_val: str) -> None:
         """
         Changes the active api key for websocket manager and updates it in the db
         """
-        upd_query = "UPDATE api_keys SET active = %s WHERE name = %s"
-        values1 = (False, self.active_api_key.get())
-        values2 = (True, new_val)
-        self.db_manager.execute_transaction([upd_query, upd_query], [values1, values2])
+        self.db_manager.set_active_api_key(self.active_api_key.get(), new_val)
         self.active_api_key.set(new_val)
-        self.stop_ws()
-        if self.active_api_key.get():
-            self.ws_manager.api_key = self.api_keys[self.active_api_key.get()]
-            self.start_ws()
+        self.send_ingestion_command('restart_ws', self.get_ws_api_keys())
 
     def delete_api_key(self, api_key: str) -> None:
         """
         Deletes an API key from the db after a user-triggered removal
         """
-        query = "DELETE FROM api_keys WHERE name = %s"
-        values = (api_key,)
-        self.db_manager.execute_transaction([query], [values])
+        self.db_manager.delete_api_key(api_key)
+        if self.ws_use_all_api_keys and self.active_api_key.get() and api_key != self.active_api_key.get():
+            self.send_ingestion_command('restart_ws', self.get_ws_api_keys())
+
+    def get_ws_api_keys(self) -> List[str]:
+        """
+        Get the API keys of the websocket connections, the active key first. Without an active key the websocket is
+        stopped
+        :return: active key and the other stored keys if all of them are used, empty list if there is no active key
+        """
+        active_name = self.active_api_key.get()
+        if not active_name:
+            return []
+        api_keys = [self.api_keys[active_name]]
+        if self.ws_use_all_api_keys:
+            api_keys.extend(key for name, key in self.api_keys.items() if name and name != active_name)
+        return api_keys
 
     def get_historical_data(self, asset_ticker: str, start_date: datetime,
                             end_date: datetime) -> List[List[Union[str, datetime, float]]]:
         res = get_historical_data(self.db_manager, asset_ticker, start_date, end_date)
         return res
 
-    def stop_ws(self) -> None:
-        if 'ws_task' in self.asyncio_tasks_dct:
-            self.asyncio_tasks_dct['ws_task'].cancel()
-            self.ws_manager.stop_active_ws()
+    def count_historical_data(self, asset_ticker: str, start_date: datetime, end_date: datetime) -> int:
+        return count_historical_data(self.db_manager, asset_ticker, start_date, end_date)
+
+    def get_candles(self, asset_ticker: str, start_date: datetime, end_date: datetime, interval: str) -> List[Candle]:
+        return get_candles(self.db_manager, asset_ticker, start_date, end_date, interval)
+
+    def export_historical_data(self, asset_ticker: str, start_date: datetime, end_date: datetime,
+                               output_filename: str, interval: Optional[str] = None,
+                               progress_callback: Optional[Callable[[int], None]] = None,
+                               cancel_event: Optional[Event] = None) -> None:
+        """
+        Stream the asset historical data to a file, the file format is picked by the output file extension. Blocks
+        until the export is finished, so it should be called outside the UI loop
+        :param interval: export OHLC candles of the given interval instead of raw updates
+        """
+        if interval is None:
+            export_historical_data(self.db_manager, asset_ticker, start_date, end_date, output_filename,
+                                   progress_callback, cancel_event)
+        else:
+            export_candles(self.db_manager, asset_ticker, start_date, end_date, interval, output_filename,
+                           progress_callback, cancel_event)
 
-    def start_ws(self) -> None:
-        ws_task = self.asyncio_task_group.create_task(self.ws_manager.ws_subscribe_to_agg_index())
-        self.asyncio_tasks_dct['ws_task'] = ws_task
+    def send_ingestion_command(self, command: str, *args) -> None:
+        """
+        Call an IngestionService method in the asyncio thread or in the ingestion process
+        """
+        if self.ingestion_process is not None:
+            self.ingestion_process.send_command(command, *args)
+        else:
+            self.async_bridge.call_soon(getattr(self.ingestion, command), *args)
 
-    async def update_ui(self) -> None:
+    def send_ingestion_query(self, query: str, args: tuple, callback: Callable[[Any], None]) -> None:
         """
-        UI update function which substitutes the App.mainloop functionality
+        Call an IngestionService method in the asyncio thread or in the ingestion process and pass its result to the
+        callback in the UI thread
         """
+        if self.ingestion_process is not None:
+            self.ingestion_process.send_query(query, args,
+                                              lambda result: self.async_bridge.call_in_ui(callback, result))
+        else:
+            self.async_bridge.call_soon(self.run_ingestion_query, query, args, callback)
+
+    # The methods below run in the asyncio thread
+
+    def run_ingestion_query(self, query: str, args: tuple, callback: Callable[[Any], None]) -> None:
+        self.async_bridge.call_in_ui(callback, getattr(self.ingestion, query)(*args))
+
+    def stop_async_tasks(self) -> None:
+        if self.ingestion is not None:
+            self.ingestion.stop()
+        for task_name in ('retention_task', 'coin_list_task'):
+            if task_name in self.asyncio_tasks_dct:
+                self.asyncio_tasks_dct[task_name].cancel()
+
+    async def refresh_valid_assets(self) -> None:
+        """
+        Refresh the cached coin set whenever it expires, the request runs in a worker thread
+        """
+        coins = set(self.valid_assets)
         while True:
-            self.update()
-            await asyncio.sleep(0.01)
+            await asyncio.sleep(self.coin_list.get_expiry_delay())
+            refreshed_coins = await asyncio.to_thread(self.coin_list.refresh, coins)
+            if refreshed_coins is None:
+                await asyncio.sleep(COIN_LIST_RETRY_INTERVAL)
+            elif refreshed_coins is not coins:
+                coins = refreshed_coins
+                self.async_bridge.call_in_ui(self.set_valid_assets, coins)
 
-    async def run(self) -> None:
+    async def run_async_tasks(self) -> None:
         """
-        Program entrypoint, runs both the UI and ws subscription
+        Runs the ingestion and the db background tasks until the app is closed
         """
         async with asyncio.TaskGroup() as tg:
             self.asyncio_task_group = tg
-            ui_task = tg.create_task(self.update_ui())
-            self.asyncio_tasks_dct['ui_task'] = ui_task
-            if self.active_api_key.get():
-                self.start_ws()
+            if self.ingestion is not None:
+                ingestion_task = tg.create_task(self.ingestion.run())
+                self.asyncio_tasks_dct['ingestion_task'] = ingestion_task
+            if self.retention_manager is not None:
+                retention_task = tg.create_task(self.retention_manager.run())
+                self.asyncio_tasks_dct['retention_task'] = retention_task
+            self.asyncio_tasks_dct['coin_list_task'] = tg.create_task(self.refresh_valid_assets())
+
+    def run(self) -> None:
+        """
+        Program entrypoint, runs the asyncio tasks in a background thread and the UI mainloop in the main thread
+        """
+        if self.ingestion_process is not None:
+            self.ingestion_process.start()
+        self.async_bridge.start(self.run_async_tasks)
+        self.mainloop()
+        self.async_bridge.join()
+        self.icon_service.close()
+        if self.ingestion_process is not None:
+            self.ingestion_process.stop()
+        if self.print_stats:
+            # Printed after the ingestion counters, so an offline replay shows the ingested, persisted and rendered
+            # counts
+            print(f'Watchlist rendered: {self.watchlist_frame.get_render_stats()}')
+        self.db_manager.close_pool()
 
     def on_close(self) -> None:
-        self.stop_ws()
-        self.asyncio_tasks_dct['ui_task'].cancel()
+        self.withdraw()
+        self.async_bridge.call_soon(self.stop_async_tasks)
         self.quit()
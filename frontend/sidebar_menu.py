@@ -1,8 +1,9 @@
 import customtkinter as ctk
 from tkinter import StringVar
-from typing import Dict, DefaultDict, Set, Optional
+from typing import DefaultDict, Set, Optional
 
 import frontend.main_app
+from backend.market_state import MarketState
 from frontend.api_keys_management import APIKeysMenu
 
 
@@ -12,12 +13,12 @@ class NewAssetWindow(ctk.CTkToplevel):
     """
     WINDOW_NAME = 'Add asset'
 
-    def __init__(self, master: 'frontend.main_app.App', valid_assets: Set[str],
-                 watchlist_assets: Dict[str, Dict[str, float]], active_api_key: StringVar):
+    def __init__(self, master: 'frontend.main_app.App', valid_assets: Set[str], market_state: MarketState,
+                 active_api_key: StringVar):
         super().__init__(master)
         self.title(self.WINDOW_NAME)
         self.valid_assets = valid_assets
-        self.watchlist_assets = watchlist_assets
+        self.market_state = market_state
         self.active_api_key = active_api_key
         self.app = master
         self.geometry('500x150')
@@ -39,9 +40,12 @@ class NewAssetWindow(ctk.CTkToplevel):
         if not self.active_api_key.get():
             self.status_message.set('No API key selected')
             self.status_label.configure(text_color='red')
-        elif new_asset in self.watchlist_assets:
+        elif new_asset in self.market_state:
             self.status_message.set('The asset is already present in the watchlist')
             self.status_label.configure(text_color='red')
+        elif not self.valid_assets:
+            self.status_message.set('The coin list is not loaded yet, try again later')
+            self.status_label.configure(text_color='red')
         elif new_asset not in self.valid_assets:
             self.status_message.set('Incorrect asset ticker')
             self.status_label.configure(text_color='red')
@@ -56,13 +60,12 @@ class SidebarMenu(ctk.CTkFrame):
     The class implements a sidebar menu which contains UI settings, watchlist editing functionality, API keys settings
     """
 
-    def __init__(self, master: 'frontend.main_app.App', valid_assets: Set[str],
-                 watchlist_assets: Dict[str, Dict[str, float]], api_keys: DefaultDict[str, str],
-                 active_api_key: StringVar):
+    def __init__(self, master: 'frontend.main_app.App', valid_assets: Set[str], market_state: MarketState,
+                 api_keys: DefaultDict[str, str], active_api_key: StringVar):
         super().__init__(master, width=140, corner_radius=0)
         self.app = master
         self.valid_assets = valid_assets
-        self.watchlist_assets = watchlist_assets
+        self.market_state = market_state
         self.api_keys = api_keys
         self.active_api_key = active_api_key
         self.new_asset_window: Optional[NewAssetWindow] = None
@@ -96,7 +99,7 @@ class SidebarMenu(ctk.CTkFrame):
         """
         # noinspection PyTypeChecker
         if self.new_asset_window is None or not self.new_asset_window.winfo_exists():
-            self.new_asset_window = NewAssetWindow(self.app, self.valid_assets, self.watchlist_assets,
+            self.new_asset_window = NewAssetWindow(self.app, self.valid_assets, self.market_state,
                                                    self.active_api_key)
         self.new_asset_window.deiconify()
         self.after(10, lambda: self.new_asset_window.focus_force())
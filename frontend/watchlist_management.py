@@ -1,13 +1,37 @@
 import customtkinter as ctk
 from tkinter import StringVar, DoubleVar
-from PIL import Image
-from typing import Dict, DefaultDict, Optional, Tuple, Callable
+from PIL import Image, ImageDraw
+from typing import Dict, DefaultDict, Optional, Callable, List
 from os import path
+from time import monotonic
 
 import frontend.main_app
 from frontend.historical_data_viewer import HistoricalDataMenu
 from backend.db_management import MAX_INT
-from backend.market_data_management import download_asset_icon
+from backend.asset_icons import AssetIconService
+from backend.market_state import MarketState, AssetState
+from frontend.image_cache import image_cache
+from frontend.watchlist_model import WatchlistModel
+
+DEFAULT_UI_REFRESH_RATE = 15  # Hz
+ICON_SIZE = (30, 30)
+PLACEHOLDER_ICON_COLOR = 'grey'
+HEADER_HEIGHT = 30  # px
+ROW_HEIGHT = 40  # px
+WHEEL_SCROLL_ROWS = 3
+MOUSE_WHEEL_SEQUENCES = ('<MouseWheel>', '<Button-4>', '<Button-5>')  # Windows and macOS, X11 up and down
+
+RESOURCES_DIR = path.join(path.dirname(__file__), 'resources')
+DELETE_ICON_BLACK_PATH = f'{RESOURCES_DIR}/delete_icon_black.png'
+DELETE_ICON_WHITE_PATH = f'{RESOURCES_DIR}/delete_icon_white.png'
+SETTINGS_ICON_BLACK_PATH = f'{RESOURCES_DIR}/asset_settings_icon_black.png'
+SETTINGS_ICON_WHITE_PATH = f'{RESOURCES_DIR}/asset_settings_icon_white.png'
+HISTORICAL_DATA_ICON_BLACK_PATH = f'{RESOURCES_DIR}/historical_data_black.png'
+HISTORICAL_DATA_ICON_WHITE_PATH = f'{RESOURCES_DIR}/historical_data_white.png'
+ASSETS_ICON_PATH = f'{RESOURCES_DIR}/asset_icons'
+ERROR_ICON_PATH = f'{ASSETS_ICON_PATH}/error_icon.png'
+
+placeholder_icon: Optional[ctk.CTkImage] = None
 
 
 def convert_asset_settings_to_str(asset_settings: Dict[str, Optional[int]]) -> Dict[str, str]:
@@ -42,146 +66,318 @@ def convert_asset_settings_to_int(asset_settings: Dict[str, str]) -> Optional[Di
     return ans_dct
 
 
-class WatchlistFrame(ctk.CTkScrollableFrame):
+def get_placeholder_icon() -> ctk.CTkImage:
+    """
+    Get the icon shown until the asset icon is downloaded, it is shared by all the rows
+    """
+    global placeholder_icon
+    if placeholder_icon is None:
+        scale = 4  # The circle is drawn larger and downscaled to smooth its edge
+        image = Image.new('RGBA', (ICON_SIZE[0] * scale, ICON_SIZE[1] * scale))
+        ImageDraw.Draw(image).ellipse((0, 0, image.width - 1, image.height - 1), fill=PLACEHOLDER_ICON_COLOR)
+        image = image.resize(ICON_SIZE, Image.LANCZOS)
+        placeholder_icon = ctk.CTkImage(light_image=image, dark_image=image, size=ICON_SIZE)
+    return placeholder_icon
+
+
+class WatchlistFrame(ctk.CTkFrame):
     """
-    The class implements a watchlist frame which is displayed on the main page
+    The class implements a watchlist frame which is displayed on the main page. The watchlist is virtualized: widgets
+    are only created for the rows which fit into the frame and are recycled to show other assets when the watchlist is
+    scrolled, so the number of widgets doesn't grow with the number of assets
     """
 
-    def __init__(self, master: 'frontend.main_app.App', watchlist_assets: Dict[str, Dict[str, float]],
-                 active_api_key: StringVar, api_keys: DefaultDict[str, str],
-                 assets_settings: Dict[str, Dict[str, Optional[int]]]):
+    def __init__(self, master: 'frontend.main_app.App', market_state: MarketState, active_api_key: StringVar,
+                 api_keys: DefaultDict[str, str], refresh_rate: float = DEFAULT_UI_REFRESH_RATE,
+                 icon_service: Optional[AssetIconService] = None):
+        """
+        :param icon_service: downloads the missing asset icons, without it only the already downloaded icons are shown
+        """
         super().__init__(master, fg_color='transparent')
         self.app = master
-        self.assets_settings = assets_settings
-        self.watchlist_assets = watchlist_assets
+        self.market_state = market_state
         self.active_api_key = active_api_key
         self.api_keys = api_keys
-        self.asset_frames: Dict[str, AssetContainer] = {}
-        self.shown_data = {}
+        self.icon_service = icon_service
+        self.model = WatchlistModel(market_state)
+        self.rows: List[AssetContainer] = []  # Row widgets, the first visible_row_count rows are shown
+        self.visible_row_count = 0
+        self.first_position = 0  # Position of the asset shown in the first row
+        self.asset_settings_windows: Dict[str, AssetSettingsWindow] = {}
+        self.historical_data_windows: Dict[str, HistoricalDataMenu] = {}
+        # Updated assets are repainted together at most refresh_rate times per second
+        self.refresh_interval = 1 / refresh_rate
+        self.refresh_scheduled = False
+        self.last_refresh_time = 0.0
+        self.refreshed_version = 0  # Market state version of the last refresh pass
+        self.ticks_received = 0
+        self.rows_repainted = 0
+        self.refresh_passes = 0
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+        self.table = ctk.CTkFrame(self, fg_color='transparent')
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.scroll)
+        self.table.grid(row=0, column=0, sticky='nsew')
+        self.scrollbar.grid(row=0, column=1, sticky='ns')
         self._create_header()
-        self.used_rows = 1
-        for asset_ticker in self.watchlist_assets:
-            self.add_asset(asset_ticker)
+        self.bind('<Configure>', self.on_resize)
+        for widget in (self, self.table, self.scrollbar):
+            self.bind_mouse_wheel(widget)
 
     def _create_header(self) -> None:
-        self.columnconfigure((1, 2, 3), weight=1)
-        asset = ctk.CTkLabel(self, text='Asset', font=('Helvetica', 14))
-        price = ctk.CTkLabel(self, text='Price', font=('Helvetica', 14))
-        change = ctk.CTkLabel(self, text='Price change', font=('Helvetica', 14))
+        self.table.columnconfigure((1, 2, 3), weight=1)
+        self.table.rowconfigure(0, minsize=round(HEADER_HEIGHT * ctk.ScalingTracker.get_widget_scaling(self)))
+        asset = ctk.CTkLabel(self.table, text='Asset', font=('Helvetica', 14))
+        price = ctk.CTkLabel(self.table, text='Price', font=('Helvetica', 14))
+        change = ctk.CTkLabel(self.table, text='Price change', font=('Helvetica', 14))
         asset.grid(row=0, column=1, sticky='w')
         price.grid(row=0, column=2, sticky='w')
         change.grid(row=0, column=3, sticky='w')
+        for label in (asset, price, change):
+            self.bind_mouse_wheel(label)
+
+    def on_resize(self, event) -> None:
+        """
+        Create the row widgets which fit into the resized frame. Rows are never destroyed, the ones which don't fit
+        are hidden
+        """
+        scaling = ctk.ScalingTracker.get_widget_scaling(self)
+        row_height = round(ROW_HEIGHT * scaling)
+        visible_row_count = max(1, (event.height - round(HEADER_HEIGHT * scaling)) // row_height)
+        if visible_row_count == self.visible_row_count:
+            return
+        self.visible_row_count = visible_row_count
+        while len(self.rows) < visible_row_count:
+            row = len(self.rows) + 1
+            self.table.rowconfigure(row, minsize=row_height)
+            self.rows.append(AssetContainer(self, row))
+        self.render()
+
+    def render(self) -> None:
+        """
+        Show the assets starting at the first position in the visible rows and update the scrollbar
+        """
+        asset_count = len(self.model)
+        self.first_position = max(0, min(self.first_position, asset_count - self.visible_row_count))
+        for i, row in enumerate(self.rows):
+            position = self.first_position + i
+            if i < self.visible_row_count and position < asset_count:
+                row.show_asset(self.model.tickers[position])
+            else:
+                row.hide()
+        if asset_count:
+            last_position = min(asset_count, self.first_position + self.visible_row_count)
+            self.scrollbar.set(self.first_position / asset_count, last_position / asset_count)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def scroll(self, command: str, value: str, unit: Optional[str] = None) -> None:
+        """
+        Scrollbar command: ('moveto', fraction) or ('scroll', steps, 'units' or 'pages')
+        """
+        if command == 'moveto':
+            first_position = round(float(value) * len(self.model))
+        elif unit == 'pages':
+            first_position = self.first_position + int(value) * self.visible_row_count
+        else:
+            first_position = self.first_position + int(value)
+        if first_position != self.first_position:
+            self.first_position = first_position
+            self.render()
+
+    def bind_mouse_wheel(self, widget: ctk.CTkBaseClass) -> None:
+        """
+        Scroll the watchlist with the mouse wheel while the pointer is over the widget. The wheel events are delivered
+        to the widget under the pointer, so each widget of the watchlist binds them
+        """
+        for sequence in MOUSE_WHEEL_SEQUENCES:
+            widget.bind(sequence, self.on_mouse_wheel, add='+')
+
+    def on_mouse_wheel(self, event) -> None:
+        if event.num == 4:
+            steps = -1
+        elif event.num == 5:
+            steps = 1
+        else:
+            steps = -1 if event.delta > 0 else 1
+        self.scroll('scroll', str(steps * WHEEL_SCROLL_ROWS), 'units')
+
+    def get_row(self, asset_ticker: str) -> Optional['AssetContainer']:
+        """
+        :return: the row showing the asset, None if the asset is not visible
+        """
+        position = self.model.get_position(asset_ticker)
+        if position is None:
+            return None
+        i = position - self.first_position
+        if 0 <= i < self.visible_row_count:
+            return self.rows[i]
+        return None
+
+    def get_asset_icon(self, asset_ticker: str) -> ctk.CTkImage:
+        """
+        Get the asset icon, the icon is requested when the asset is shown for the first time and the placeholder is
+        returned until it is downloaded
+        """
+        if asset_ticker not in self.model.icon_paths:
+            if self.icon_service is None:
+                icon_path = f'{ASSETS_ICON_PATH}/{asset_ticker}.png'
+                self.model.icon_paths[asset_ticker] = icon_path if path.isfile(icon_path) else ERROR_ICON_PATH
+            else:
+                api_key = self.api_keys[self.active_api_key.get()] or ''
+                self.model.icon_paths[asset_ticker] = self.icon_service.request_icon(asset_ticker, api_key,
+                                                                                     self.set_asset_icon)
+        icon_path = self.model.icon_paths[asset_ticker]
+        if icon_path is None:
+            return get_placeholder_icon()
+        return image_cache.get_ctk_image(icon_path, icon_path, ICON_SIZE)
+
+    def set_asset_icon(self, asset_ticker: str, icon_path: Optional[str]) -> None:
+        """
+        Replace the placeholder with the downloaded icon or with the error icon if the download failed
+        """
+        if asset_ticker not in self.model:
+            return
+        self.model.icon_paths[asset_ticker] = icon_path or ERROR_ICON_PATH
+        row = self.get_row(asset_ticker)
+        if row is not None:
+            row.set_icon(self.get_asset_icon(asset_ticker))
 
     def add_asset(self, asset_ticker: str) -> None:
-        self.shown_data[asset_ticker] = {}
-        self.shown_data[asset_ticker]['price'] = self.watchlist_assets[asset_ticker]['price']
-        self.shown_data[asset_ticker]['change'] = self.watchlist_assets[asset_ticker]['change']
-        data = self.shown_data[asset_ticker]
-        price, change = data['price'], data['change']
-        asset = AssetContainer(self, self.app, asset_ticker, price, change, self.assets_settings[asset_ticker],
-                               self.used_rows, self.api_keys, self.active_api_key)
-        self.asset_frames[asset_ticker] = asset
-        self.used_rows += 1
-
-    def update_asset(self, asset_ticker: str) -> None:
-        """
-        Process the asset data update and display it in the interface
-        """
-        asset_frame = self.asset_frames[asset_ticker]
-        asset_shown_data = self.shown_data[asset_ticker]
-        asset_settings = self.assets_settings[asset_ticker]
-        update = self.watchlist_assets[asset_ticker]
-        rounded_price = round(update['price'], asset_settings['price_rounding'])
-        rounded_change = round(update['change'], asset_settings['change_rounding'])
-        if rounded_price != asset_shown_data['price'] or rounded_change != asset_shown_data['change']:
-            asset_shown_data['price'] = rounded_price
-            asset_shown_data['change'] = rounded_change
-            asset_frame.update_data(asset_shown_data)
+        self.model.add(asset_ticker)
+        self.render()
+
+    def schedule_refresh(self, update_count: int = 0) -> None:
+        """
+        Schedule a refresh pass for the changed assets. Refresh passes are only scheduled while there are changes
+        :param update_count: number of market updates applied since the last call
+        """
+        self.ticks_received += update_count
+        if not self.refresh_scheduled:
+            self.refresh_scheduled = True
+            delay = max(0.0, self.last_refresh_time + self.refresh_interval - monotonic())
+            self.after(int(delay * 1000), self.refresh_rows)
+
+    def refresh_rows(self) -> None:
+        """
+        Repaint the visible rows whose assets have changed since they were painted. The hidden assets are painted
+        with their latest data when they are scrolled into view
+        """
+        self.refresh_scheduled = False
+        self.last_refresh_time = monotonic()
+        if self.market_state.version == self.refreshed_version:
+            return
+        self.refreshed_version = self.market_state.version
+        self.refresh_passes += 1
+        for row in self.rows[:self.visible_row_count]:
+            if row.asset_ticker is not None and row.refresh():
+                self.rows_repainted += 1
+
+    def get_render_stats(self) -> Dict[str, int]:
+        """
+        Get the counters of received updates, refresh passes, repainted rows and row widgets
+        """
+        return {
+            'ticks_received': self.ticks_received,
+            'refresh_passes': self.refresh_passes,
+            'rows_repainted': self.rows_repainted,
+            'row_widgets': len(self.rows)
+        }
+
+    def update_asset(self, asset_ticker: str) -> bool:
+        """
+        Process the asset data update and display it in the interface if the asset is visible
+        :return: True if the displayed data has changed
+        """
+        row = self.get_row(asset_ticker)
+        if row is None:
+            return False
+        return row.refresh()
 
     def delete_asset(self, asset_ticker: str) -> None:
         """
         Process the user-triggered asset removal
         """
-        self.asset_frames.pop(asset_ticker)
-        self.shown_data.pop(asset_ticker)
-        self.watchlist_assets.pop(asset_ticker)
+        asset_settings_window = self.asset_settings_windows.pop(asset_ticker, None)
+        if asset_settings_window is not None:
+            asset_settings_window.destroy()
+        self.historical_data_windows.pop(asset_ticker, None)  # An export started from the window keeps running
+        self.model.remove(asset_ticker)
+        self.render()
         self.app.delete_watchlist_asset(asset_ticker)
-        self.app.stop_ws()
-        self.app.start_ws()
+
+    def open_settings_window(self, asset_ticker: str) -> None:
+        """
+        Open the AssetSettingsWindow
+        """
+        window = self.asset_settings_windows.get(asset_ticker)
+        if window is None or not window.winfo_exists():
+            window = AssetSettingsWindow(self.app, asset_ticker, self.market_state[asset_ticker])
+            self.asset_settings_windows[asset_ticker] = window
+        window.deiconify()
+        self.app.after(10, window.focus_force)
+
+    def open_historical_data(self, asset_ticker: str) -> None:
+        """
+        Open the HistoricalDataMenu
+        """
+        window = self.historical_data_windows.get(asset_ticker)
+        if window is None or not window.winfo_exists():
+            window = HistoricalDataMenu(self.app, asset_ticker)
+            self.historical_data_windows[asset_ticker] = window
+        window.deiconify()
+        self.app.after(10, window.focus_force)
 
 
 class AssetContainer:
     """
-    The class acts as a container for the asset row
+    The class acts as a container for the widgets of a watchlist row. The row shows any asset it is given, so it is
+    reused for other assets when the watchlist is scrolled
     """
-    RESOURCES_DIR = path.join(path.dirname(__file__), 'resources')
-    DELETE_ICON_BLACK_PATH = f'{RESOURCES_DIR}/delete_icon_black.png'
-    DELETE_ICON_WHITE_PATH = f'{RESOURCES_DIR}/delete_icon_white.png'
-    SETTINGS_ICON_BLACK_PATH = f'{RESOURCES_DIR}/asset_settings_icon_black.png'
-    SETTINGS_ICON_WHITE_PATH = f'{RESOURCES_DIR}/asset_settings_icon_white.png'
-    HISTORICAL_DATA_ICON_BLACK_PATH = f'{RESOURCES_DIR}/historical_data_black.png'
-    HISTORICAL_DATA_ICON_WHITE_PATH = f'{RESOURCES_DIR}/historical_data_white.png'
-    ASSETS_ICON_PATH = f'{RESOURCES_DIR}/asset_icons'
-
-    def __init__(self, master: WatchlistFrame, app: 'frontend.main_app.App', asset_ticker: str, price: float,
-                 change: float, asset_settings: Dict[str, Optional[int]], row: int, api_keys: DefaultDict[str, str],
-                 active_api_key: StringVar):
+
+    def __init__(self, master: WatchlistFrame, row: int):
         self.watchlist_frame = master
-        self.app = app
-        self.asset_ticker = asset_ticker
-        self.asset_settings = asset_settings
-        icon_path = f'{self.ASSETS_ICON_PATH}/{asset_ticker}.png'
-        error_icon_path = f'{self.ASSETS_ICON_PATH}/error_icon.png'
-        self.price_var = DoubleVar(master, price)
-        self.change_var = DoubleVar(master, change)
         self.row = row
-        self.asset_image = None
+        self.asset_ticker: Optional[str] = None
+        self.shown_version = -1  # Market state version of the shown asset data
+        self.shown_price: Optional[float] = None
+        self.shown_change: Optional[float] = None
+        self.price_var = DoubleVar(master, 0)
+        self.change_var = DoubleVar(master, 0)
+        self.asset_image: Optional[ctk.CTkLabel] = None
         self.change_label: Optional[ctk.CTkLabel] = None
         self.price_label: Optional[ctk.CTkLabel] = None
-        self.asset_ticker_label = None
-        self.asset_settings_window: Optional[ctk.CTkToplevel] = None
+        self.asset_ticker_label: Optional[ctk.CTkLabel] = None
         self.settings_button: Optional[ctk.CTkButton] = None
-        self.historical_data_window: Optional[ctk.CTkToplevel] = None
         self.historical_data_button: Optional[ctk.CTkButton] = None
         self.delete_button: Optional[ctk.CTkButton] = None
-        if download_asset_icon(self.asset_ticker, icon_path, api_keys[active_api_key.get()]):
-            self.icon_path = icon_path
-        else:
-            self.icon_path = error_icon_path
+        self.widgets: List[ctk.CTkBaseClass] = []
         self.init_frames()
 
     @staticmethod
-    def generate_ctk_image(light_image_path: str, dark_image_path: str, size: Tuple[int, int]) -> ctk.CTkImage:
-        img = ctk.CTkImage(light_image=Image.open(light_image_path),
-                           dark_image=Image.open(dark_image_path),
-                           size=size)
-        return img
-
-    def generate_button(self, master, light_image_path: str, black_image_path: str, command: Callable, width: int = 30,
+    def generate_button(master, light_image_path: str, black_image_path: str, command: Callable, width: int = 30,
                         height: int = 30, text: str = '', fg_color: str = 'transparent',
                         hover_color: str = 'grey') -> ctk.CTkButton:
-        image = self.generate_ctk_image(light_image_path, black_image_path, (width, height))
+        image = image_cache.get_ctk_image(light_image_path, black_image_path, (width, height))
         button = ctk.CTkButton(master, text=text, width=width, height=height, image=image, command=command,
                                fg_color=fg_color, hover_color=hover_color)
         return button
 
     def init_frames(self) -> None:
-        image = self.generate_ctk_image(self.icon_path, self.icon_path, (30, 30))
-        self.asset_image = ctk.CTkLabel(self.watchlist_frame, image=image, text='')
-        self.asset_ticker_label = ctk.CTkLabel(self.watchlist_frame, text=self.asset_ticker, font=('Helvetica', 14),
-                                               anchor='w')
-        color = 'red' if self.change_var.get() < 0 else 'LimeGreen'
-        self.price_label = ctk.CTkLabel(self.watchlist_frame, textvariable=self.price_var, font=('Helvetica', 14),
-                                        text_color=color, anchor='e')
-        self.change_label = ctk.CTkLabel(self.watchlist_frame, textvariable=self.change_var, font=('Helvetica', 14),
-                                         text_color=color, anchor='e')
-        self.settings_button = self.generate_button(self.watchlist_frame, self.SETTINGS_ICON_BLACK_PATH,
-                                                    self.SETTINGS_ICON_WHITE_PATH, self.open_settings_window)
-        self.historical_data_button = self.generate_button(self.watchlist_frame, self.HISTORICAL_DATA_ICON_BLACK_PATH,
-                                                           self.HISTORICAL_DATA_ICON_WHITE_PATH,
-                                                           self.open_historical_data)
-        self.delete_button = self.generate_button(self.watchlist_frame, self.DELETE_ICON_BLACK_PATH,
-                                                  self.DELETE_ICON_WHITE_PATH, self.delete)
+        table = self.watchlist_frame.table
+        self.asset_image = ctk.CTkLabel(table, image=get_placeholder_icon(), text='')
+        self.asset_ticker_label = ctk.CTkLabel(table, text='', font=('Helvetica', 14), anchor='w')
+        self.price_label = ctk.CTkLabel(table, textvariable=self.price_var, font=('Helvetica', 14),
+                                        text_color='LimeGreen', anchor='e')
+        self.change_label = ctk.CTkLabel(table, textvariable=self.change_var, font=('Helvetica', 14),
+                                         text_color='LimeGreen', anchor='e')
+        self.settings_button = self.generate_button(table, SETTINGS_ICON_BLACK_PATH, SETTINGS_ICON_WHITE_PATH,
+                                                    self.open_settings_window)
+        self.historical_data_button = self.generate_button(table, HISTORICAL_DATA_ICON_BLACK_PATH,
+                                                           HISTORICAL_DATA_ICON_WHITE_PATH, self.open_historical_data)
+        self.delete_button = self.generate_button(table, DELETE_ICON_BLACK_PATH, DELETE_ICON_WHITE_PATH, self.delete)
+        self.widgets = [self.asset_image, self.asset_ticker_label, self.price_label, self.change_label,
+                        self.settings_button, self.historical_data_button, self.delete_button]
         self.asset_image.grid(row=self.row, column=0)
         self.asset_ticker_label.grid(row=self.row, column=1, sticky='w')
         self.price_label.grid(row=self.row, column=2, sticky='w')
@@ -189,52 +385,73 @@ class AssetContainer:
         self.settings_button.grid(row=self.row, column=4)
         self.historical_data_button.grid(row=self.row, column=5)
         self.delete_button.grid(row=self.row, column=6)
+        for widget in self.widgets:
+            self.watchlist_frame.bind_mouse_wheel(widget)
+        self.hide()
+
+    def show_asset(self, asset_ticker: str) -> None:
+        """
+        Show the asset with its latest data in the row
+        """
+        if asset_ticker != self.asset_ticker:
+            if self.asset_ticker is None:
+                for widget in self.widgets:
+                    widget.grid()
+            self.asset_ticker = asset_ticker
+            self.asset_ticker_label.configure(text=asset_ticker)
+            self.set_icon(self.watchlist_frame.get_asset_icon(asset_ticker))
+            self.shown_version = -1
+            self.shown_price = self.shown_change = None
+        self.refresh()
+
+    def hide(self) -> None:
+        for widget in self.widgets:
+            widget.grid_remove()
+        self.asset_ticker = None
+
+    def set_icon(self, image: ctk.CTkImage) -> None:
+        self.asset_image.configure(image=image)
+
+    def refresh(self) -> bool:
+        """
+        Show the latest data of the asset if it has changed since it was shown
+        :return: True if the shown data has changed
+        """
+        asset_state = self.watchlist_frame.market_state[self.asset_ticker]
+        if asset_state.version == self.shown_version:
+            return False
+        self.shown_version = asset_state.version
+        return self.update_data(*self.watchlist_frame.model.get_shown_data(self.asset_ticker))
 
-    def update_data(self, update: Dict[str, float]) -> None:
+    def update_data(self, price: float, change: float) -> bool:
         """
         Update the asset pricing data and change the textcolor if needed in the UI
+        :return: True if the shown data has changed
         """
-        new_price, new_change = update['price'], update['change']
-        self.price_var.set(new_price)
-        self.change_var.set(new_change)
+        if price == self.shown_price and change == self.shown_change:
+            return False
+        self.shown_price = price
+        self.shown_change = change
+        self.price_var.set(price)
+        self.change_var.set(change)
         cur_color = self.price_label.cget('text_color')
-        new_color = 'red' if new_change < 0 else 'LimeGreen'
+        new_color = 'red' if change < 0 else 'LimeGreen'
         if new_color != cur_color:
             self.price_label.configure(text_color=new_color)
             self.change_label.configure(text_color=new_color)
+        return True
 
     def delete(self) -> None:
         """
-        Delete all the container frames and real-time market data. Triggered by user
-        """
-        self.asset_image.destroy()
-        self.asset_ticker_label.destroy()
-        self.price_label.destroy()
-        self.change_label.destroy()
-        self.historical_data_button.destroy()
-        self.delete_button.destroy()
-        if self.asset_settings_window:
-            self.asset_settings_window.destroy()
-        self.settings_button.destroy()
+        Remove the shown asset from the watchlist. Triggered by user
+        """
         self.watchlist_frame.delete_asset(self.asset_ticker)
 
-    def open_settings_window(self):
-        """
-        Open the AssetSettingsWindow
-        """
-        if self.asset_settings_window is None or not self.asset_settings_window.winfo_exists():
-            self.asset_settings_window = AssetSettingsWindow(self.app, self.asset_ticker, self.asset_settings)
-        self.asset_settings_window.deiconify()
-        self.app.after(10, lambda: self.asset_settings_window.focus_force())
+    def open_settings_window(self) -> None:
+        self.watchlist_frame.open_settings_window(self.asset_ticker)
 
-    def open_historical_data(self):
-        """
-        Open the HistoricalDataMenu
-        """
-        if self.historical_data_window is None or not self.historical_data_window.winfo_exists():
-            self.historical_data_window = HistoricalDataMenu(self.app, self.asset_ticker)
-        self.historical_data_window.deiconify()
-        self.app.after(10, lambda: self.historical_data_window.focus_force())
+    def open_historical_data(self) -> None:
+        self.watchlist_frame.open_historical_data(self.asset_ticker)
 
 
 class AssetSettingsWindow(ctk.CTkToplevel):
@@ -242,14 +459,14 @@ class AssetSettingsWindow(ctk.CTkToplevel):
     A CTkToplevel window that allows the user to change the asset display settings
     """
 
-    def __init__(self, master: 'frontend.main_app.App', asset_ticker: str, asset_settings: Dict[str, int]):
+    def __init__(self, master: 'frontend.main_app.App', asset_ticker: str, asset_state: AssetState):
         super().__init__(master)
         self.title(asset_ticker)
         self.geometry('500x120')
         self.app = master
         self.asset_ticker = asset_ticker
-        self.asset_settings = asset_settings
-        self.shown_asset_settings = convert_asset_settings_to_str(asset_settings)
+        self.asset_state = asset_state
+        self.shown_asset_settings = convert_asset_settings_to_str(asset_state.get_settings())
         self.price_rounding_var = StringVar(self, value=self.shown_asset_settings['price_rounding'])
         self.change_rounding_var = StringVar(self, value=self.shown_asset_settings['change_rounding'])
         self.status_message = StringVar(self, value='')
@@ -285,8 +502,8 @@ class AssetSettingsWindow(ctk.CTkToplevel):
         }
         new_asset_settings = convert_asset_settings_to_int(new_shown_asset_settings)
         if new_asset_settings is not None:
-            for setting in new_asset_settings:
-                self.asset_settings[setting] = new_asset_settings[setting]
+            self.asset_state.price_rounding = new_asset_settings['price_rounding']
+            self.asset_state.change_rounding = new_asset_settings['change_rounding']
             self.shown_asset_settings = new_shown_asset_settings
             self.app.update_watchlist_asset_settings(self.asset_ticker)
             self.withdraw()
@@ -0,0 +1,60 @@
+from typing import Dict, List, Optional, Tuple
+
+from backend.market_state import MarketState
+
+
+class WatchlistModel:
+    """
+    The class keeps the order of the watchlist assets and computes the data shown in their rows. It holds no widgets,
+    so the watchlist can hold thousands of assets while only the visible rows have widgets
+    """
+
+    def __init__(self, market_state: MarketState):
+        self.market_state = market_state
+        self.tickers: List[str] = list(market_state)
+        self.positions: Dict[str, int] = {asset_ticker: i for i, asset_ticker in enumerate(self.tickers)}
+        # Positions from this one on are outdated by the removals, None if all the positions are up to date
+        self.stale_position: Optional[int] = None
+        self.icon_paths: Dict[str, Optional[str]] = {}  # {asset ticker: icon path or None while it is downloaded}
+
+    def __len__(self) -> int:
+        return len(self.tickers)
+
+    def __contains__(self, asset_ticker: str) -> bool:
+        return asset_ticker in self.positions
+
+    def add(self, asset_ticker: str) -> None:
+        self.positions[asset_ticker] = len(self.tickers)
+        self.tickers.append(asset_ticker)
+
+    def remove(self, asset_ticker: str) -> None:
+        """
+        Remove the asset. The positions of the following assets are not shifted here, they are updated when they
+        are requested
+        """
+        position = self.get_position(asset_ticker)
+        del self.tickers[position]
+        del self.positions[asset_ticker]
+        if self.stale_position is not None:
+            position = min(position, self.stale_position)
+        self.stale_position = position if position < len(self.tickers) else None
+        self.icon_paths.pop(asset_ticker, None)
+
+    def get_position(self, asset_ticker: str) -> Optional[int]:
+        position = self.positions.get(asset_ticker)
+        if position is None or self.stale_position is None or position < self.stale_position:
+            return position
+        # Removals only move the assets towards the start, so the asset is at most at its outdated position and only
+        # the positions up to it are updated
+        end = min(position + 1, len(self.tickers))
+        self.positions.update(zip(self.tickers[self.stale_position:end], range(self.stale_position, end)))
+        self.stale_position = end if end < len(self.tickers) else None
+        return self.positions[asset_ticker]
+
+    def get_shown_data(self, asset_ticker: str) -> Tuple[float, float]:
+        """
+        :return: (price, change) rounded with the asset settings
+        """
+        asset_state = self.market_state[asset_ticker]
+        return (round(asset_state.price, asset_state.price_rounding),
+                round(asset_state.change, asset_state.change_rounding))
@@ -0,0 +1,117 @@
+"""
+Headless collector: runs the websocket ingestion, the history writer and the retention policy without the GUI, e.g.
+on a server without a display. The watchlist and the active API key are read from the db, they are edited in the app.
+SIGTERM and SIGINT stop the collector after the queued price updates are written
+
+    python headless.py
+"""
+import asyncio
+import signal
+from typing import Optional, List
+
+from backend.db_management import DBManager, RetentionManager, create_db_manager, DEFAULT_POOL_SIZE, \
+    DEFAULT_DB_ENGINE, DEFAULT_SQLITE_PATH
+from backend.ingestion import IngestionService
+from backend.market_data_management import DEFAULT_HISTORY_FLUSH_INTERVAL, DEFAULT_HISTORY_BATCH_SIZE, \
+    DEFAULT_HISTORY_QUEUE_SIZE, DEFAULT_WS_URL, DEFAULT_WS_CONNECTIONS, DEFAULT_TICK_BUFFER_SIZE, DEFAULT_WS_CHANNELS, \
+    DEFAULT_WS_EXCHANGES
+from backend.market_updates import LatestMarketUpdates
+import config
+
+DEFAULT_STATUS_INTERVAL = 60.0  # seconds
+
+
+class HeadlessCollector:
+    """
+    The class runs the ingestion service and the db background tasks in an asyncio loop until it is stopped by a
+    signal
+    """
+
+    def __init__(self, db_manager: DBManager, service: IngestionService, market_updates: LatestMarketUpdates,
+                 retention_manager: Optional[RetentionManager] = None,
+                 status_interval: float = DEFAULT_STATUS_INTERVAL):
+        self.db_manager = db_manager
+        self.service = service
+        self.market_updates = market_updates
+        self.retention_manager = retention_manager
+        self.status_interval = status_interval
+        self.background_tasks: List[asyncio.Task] = []
+        self.stopping = False
+
+    def stop(self) -> None:
+        """
+        Stop the websocket and the background tasks, the ingestion service finishes after the history writer is
+        flushed
+        """
+        if self.stopping:
+            return
+        self.stopping = True
+        print('Stopping the collector')
+        self.service.stop()
+        for task in self.background_tasks:
+            task.cancel()
+
+    async def report_status(self) -> None:
+        while True:
+            await asyncio.sleep(self.status_interval)
+            print(f'Websocket: {self.service.ws_manager.stats()}, history: {self.service.history_writer.stats()}, '
+                  f'market updates: {self.market_updates.stats()}')
+
+    def add_signal_handlers(self) -> None:
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(signal_number, self.stop)
+            except NotImplementedError:
+                # Windows event loops have no signal handlers, the Python handler runs between bytecodes of the loop
+                signal.signal(signal_number, lambda *args: loop.call_soon_threadsafe(self.stop))
+
+    async def run(self) -> None:
+        self.add_signal_handlers()
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(self.service.run())
+            self.background_tasks.append(tg.create_task(self.report_status()))
+            if self.retention_manager is not None:
+                self.background_tasks.append(tg.create_task(self.retention_manager.run()))
+
+
+def main() -> None:
+    db_manager = create_db_manager(getattr(config, 'DB_ENGINE', DEFAULT_DB_ENGINE), config.DB_HOST, config.DB_USER,
+                                   config.DB_PASSWORD, config.DB_NAME,
+                                   getattr(config, 'SQLITE_PATH', DEFAULT_SQLITE_PATH),
+                                   getattr(config, 'DB_POOL_SIZE', DEFAULT_POOL_SIZE),
+                                   getattr(config, 'DB_USE_PREPARED_STATEMENTS', False),
+                                   getattr(config, 'DB_PARTITION_HISTORY', False))
+    assets = [asset_ticker for asset_ticker, price_decimals, change_decimals in db_manager.get_watchlist_assets()]
+    stored_api_keys = db_manager.get_api_keys()
+    api_keys = [key for name, key, active in stored_api_keys if active]
+    if api_keys and getattr(config, 'WS_USE_ALL_API_KEYS', False):
+        api_keys.extend(key for name, key, active in stored_api_keys if not active)
+    market_updates = LatestMarketUpdates()
+    service = IngestionService(db_manager, market_updates, api_keys, assets,
+                               getattr(config, 'HISTORY_FLUSH_INTERVAL', DEFAULT_HISTORY_FLUSH_INTERVAL),
+                               getattr(config, 'HISTORY_BATCH_SIZE', DEFAULT_HISTORY_BATCH_SIZE),
+                               getattr(config, 'HISTORY_QUEUE_SIZE', DEFAULT_HISTORY_QUEUE_SIZE),
+                               getattr(config, 'WS_DECODER', None), getattr(config, 'WS_URL', DEFAULT_WS_URL),
+                               getattr(config, 'WS_RECORD_FILE', None),
+                               getattr(config, 'WS_CONNECTIONS', DEFAULT_WS_CONNECTIONS),
+                               getattr(config, 'TICK_BUFFER_SIZE', DEFAULT_TICK_BUFFER_SIZE),
+                               getattr(config, 'WS_CHANNELS', DEFAULT_WS_CHANNELS),
+                               getattr(config, 'WS_EXCHANGES', DEFAULT_WS_EXCHANGES),
+                               getattr(config, 'PRINT_STATS', False))
+    retention_manager = None
+    raw_retention_days = getattr(config, 'RAW_RETENTION_DAYS', None)
+    if raw_retention_days is not None:
+        retention_manager = RetentionManager(db_manager, raw_retention_days,
+                                             getattr(config, 'ROLLUP_1M_RETENTION_DAYS', None))
+    collector = HeadlessCollector(db_manager, service, market_updates, retention_manager,
+                                  getattr(config, 'HEADLESS_STATUS_INTERVAL', DEFAULT_STATUS_INTERVAL))
+    print(f'Collecting {len(assets)} assets: {", ".join(assets)}')
+    try:
+        asyncio.run(collector.run())
+    finally:
+        db_manager.close_pool()
+
+
+if __name__ == "__main__":
+    main()
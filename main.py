@@ -1,8 +1,37 @@
 from frontend.main_app import App
-from config import DB_HOST, DB_USER, DB_PASSWORD, DB_NAME
-import asyncio
+from backend.market_data_management import DEFAULT_HISTORY_FLUSH_INTERVAL, DEFAULT_HISTORY_BATCH_SIZE, \
+    DEFAULT_HISTORY_QUEUE_SIZE, DEFAULT_WS_URL, DEFAULT_WS_CONNECTIONS, DEFAULT_TICK_BUFFER_SIZE, DEFAULT_WS_CHANNELS, \
+    DEFAULT_WS_EXCHANGES
+from backend.db_management import DEFAULT_POOL_SIZE, DEFAULT_DB_ENGINE, DEFAULT_SQLITE_PATH
+from backend.ingestion import DEFAULT_INGESTION_MODE
+from backend.coin_list import DEFAULT_COIN_LIST_CACHE_FILE, DEFAULT_COIN_LIST_TTL
+from frontend.watchlist_management import DEFAULT_UI_REFRESH_RATE
+import config
 
 
 if __name__ == "__main__":
-    app = App(DB_HOST, DB_USER, DB_PASSWORD, DB_NAME)
-    asyncio.run(app.run())
+    app = App(config.DB_HOST, config.DB_USER, config.DB_PASSWORD, config.DB_NAME,
+              history_flush_interval=getattr(config, 'HISTORY_FLUSH_INTERVAL', DEFAULT_HISTORY_FLUSH_INTERVAL),
+              history_batch_size=getattr(config, 'HISTORY_BATCH_SIZE', DEFAULT_HISTORY_BATCH_SIZE),
+              history_queue_size=getattr(config, 'HISTORY_QUEUE_SIZE', DEFAULT_HISTORY_QUEUE_SIZE),
+              db_pool_size=getattr(config, 'DB_POOL_SIZE', DEFAULT_POOL_SIZE),
+              db_use_prepared_statements=getattr(config, 'DB_USE_PREPARED_STATEMENTS', False),
+              db_partition_history=getattr(config, 'DB_PARTITION_HISTORY', False),
+              raw_retention_days=getattr(config, 'RAW_RETENTION_DAYS', None),
+              rollup_1m_retention_days=getattr(config, 'ROLLUP_1M_RETENTION_DAYS', None),
+              ui_refresh_rate=getattr(config, 'UI_REFRESH_RATE', DEFAULT_UI_REFRESH_RATE),
+              ingestion_mode=getattr(config, 'INGESTION_MODE', DEFAULT_INGESTION_MODE),
+              ws_decoder=getattr(config, 'WS_DECODER', None),
+              ws_url=getattr(config, 'WS_URL', DEFAULT_WS_URL),
+              ws_record_file=getattr(config, 'WS_RECORD_FILE', None),
+              db_engine=getattr(config, 'DB_ENGINE', DEFAULT_DB_ENGINE),
+              sqlite_path=getattr(config, 'SQLITE_PATH', DEFAULT_SQLITE_PATH),
+              coin_list_cache_file=getattr(config, 'COIN_LIST_CACHE_FILE', DEFAULT_COIN_LIST_CACHE_FILE),
+              coin_list_ttl=getattr(config, 'COIN_LIST_TTL', DEFAULT_COIN_LIST_TTL),
+              ws_connections=getattr(config, 'WS_CONNECTIONS', DEFAULT_WS_CONNECTIONS),
+              ws_use_all_api_keys=getattr(config, 'WS_USE_ALL_API_KEYS', False),
+              tick_buffer_size=getattr(config, 'TICK_BUFFER_SIZE', DEFAULT_TICK_BUFFER_SIZE),
+              ws_channels=getattr(config, 'WS_CHANNELS', DEFAULT_WS_CHANNELS),
+              ws_exchanges=getattr(config, 'WS_EXCHANGES', DEFAULT_WS_EXCHANGES),
+              print_stats=getattr(config, 'PRINT_STATS', False))
+    app.run()
@@ -0,0 +1,44 @@
+from backend.market_updates import MarketUpdateQueue, LatestMarketUpdates
+
+
+def make_update(price: float) -> dict:
+    return {'open_price': 100.0, 'price': price, 'change': price - 100.0}
+
+
+def test_queue_coalesces_pending_updates_of_an_asset():
+    queue = MarketUpdateQueue()
+    for price in (101.0, 102.0, 103.0):
+        queue.put('BTC', make_update(price))
+    queue.put('ETH', make_update(99.0))
+    assert queue.stats() == {'received': 4, 'coalesced': 2, 'pending': 2}
+    assert queue.drain() == {'BTC': make_update(103.0), 'ETH': make_update(99.0)}
+    assert queue.drain() == {}
+    assert queue.stats()['pending'] == 0
+
+
+def test_queue_wakes_the_consumer_once_per_drain():
+    wakeups = []
+    queue = MarketUpdateQueue(on_pending=lambda: wakeups.append(True))
+    queue.put_many({'BTC': make_update(101.0), 'ETH': make_update(99.0)})
+    queue.put('BTC', make_update(102.0))
+    assert len(wakeups) == 1
+    queue.drain()
+    queue.put('BTC', make_update(103.0))
+    assert len(wakeups) == 2
+
+
+def test_restore_keeps_newer_updates():
+    queue = MarketUpdateQueue()
+    queue.put_many({'BTC': make_update(101.0), 'ETH': make_update(99.0)})
+    updates = queue.drain()
+    queue.put('BTC', make_update(105.0))
+    queue.restore(updates)
+    assert queue.drain() == {'BTC': make_update(105.0), 'ETH': make_update(99.0)}
+
+
+def test_latest_market_updates_keeps_the_last_update():
+    sink = LatestMarketUpdates()
+    sink.put('BTC', make_update(101.0))
+    sink.put('BTC', make_update(102.0))
+    assert sink.updates == {'BTC': make_update(102.0)}
+    assert sink.stats() == {'received': 2, 'assets': 1}
@@ -0,0 +1,130 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend.db_management import SQLiteDBManager, MIN_DATETIME, MAX_DATETIME
+from backend.market_data_management import insert_many_to_historical_data, get_candles, CANDLE_INTERVALS
+from backend.rollups import RollupAccumulator, EPOCH, ROLLUP_TABLES, get_bucket_start, get_rollup_table, \
+    backfill_rollups
+
+START_TIME = datetime(2024, 1, 1, 22, 47, 13, 250000)
+ASSETS = ('BTC', 'ETH')
+
+
+def generate_rows(count: int, seed: int = 0) -> list:
+    """
+    Generate deterministic price updates of the test assets in update time order, a few seconds to minutes apart
+    """
+    rng = random.Random(seed)
+    update_time = START_TIME
+    rows = []
+    for _ in range(count):
+        update_time += timedelta(seconds=rng.uniform(0.5, 900))
+        rows.append((rng.choice(ASSETS), update_time, round(rng.uniform(90, 110), 2), round(rng.uniform(-5, 5), 2)))
+    return rows
+
+
+def insert_rows(db_manager: SQLiteDBManager, rows: list, batch_size: int = 97) -> None:
+    # Uneven batches, so candles are split between batches and merged by the upserts
+    for i in range(0, len(rows), batch_size):
+        insert_many_to_historical_data(db_manager, rows[i:i + batch_size])
+
+
+@pytest.fixture
+def db_manager(tmp_path):
+    db_manager = SQLiteDBManager(str(tmp_path / 'test.db'))
+    db_manager.create_database_and_tables()
+    yield db_manager
+    db_manager.close_pool()
+
+
+@pytest.mark.parametrize('seconds', [60, 300, 3600, 86400])
+def test_bucket_start_is_epoch_aligned(seconds):
+    update_time = START_TIME
+    for _ in range(1000):
+        bucket_start = get_bucket_start(update_time, seconds)
+        assert bucket_start.timestamp() % seconds == 0
+        assert bucket_start <= update_time < bucket_start + timedelta(seconds=seconds)
+        update_time += timedelta(seconds=37.3)
+
+
+def test_bucket_start_of_bucket_start_is_unchanged():
+    bucket_start = get_bucket_start(START_TIME, 3600)
+    assert get_bucket_start(bucket_start, 3600) == bucket_start
+
+
+@pytest.mark.parametrize('update_time', [MIN_DATETIME, EPOCH - timedelta(days=1), EPOCH])
+def test_bucket_start_clamps_pre_epoch_times(update_time):
+    assert get_bucket_start(update_time, 3600) == EPOCH
+
+
+@pytest.mark.parametrize('interval_seconds, expected', [
+    (60, (60, 'candles_1m')),
+    (300, (60, 'candles_1m')),
+    (3600, (3600, 'candles_1h')),
+    (86400, (3600, 'candles_1h')),
+    (30, None),
+    (90, None)
+])
+def test_rollup_table_is_the_coarsest_fitting_one(interval_seconds, expected):
+    assert get_rollup_table(interval_seconds) == expected
+
+
+def test_accumulator_merges_updates_into_candles():
+    accumulator = RollupAccumulator()
+    bucket_start = get_bucket_start(START_TIME, 60)
+    updates = [(bucket_start + timedelta(seconds=30), 101.0), (bucket_start + timedelta(seconds=10), 100.0),
+               (bucket_start + timedelta(seconds=50), 99.0), (bucket_start + timedelta(seconds=20), 105.0)]
+    for update_time, price in updates:
+        accumulator.add('BTC', update_time, price)
+    assert accumulator.get_rows(60) == [('BTC', bucket_start, 100.0, 105.0, 99.0, 99.0, 4, updates[1][0],
+                                         updates[2][0])]
+    accumulator.clear()
+    assert all(not accumulator.get_rows(seconds) for seconds in ROLLUP_TABLES)
+
+
+@pytest.mark.parametrize('interval', list(CANDLE_INTERVALS))
+# The rollup buckets which overlap the date range are included as a whole, so the range is aligned to them
+@pytest.mark.parametrize('start_date, end_date', [
+    (MIN_DATETIME, MAX_DATETIME),
+    (get_bucket_start(datetime(2024, 1, 2), 3600),
+     get_bucket_start(datetime(2024, 1, 4), 3600) - timedelta(microseconds=1))
+])
+def test_rollup_candles_match_raw_candles(db_manager, interval, start_date, end_date):
+    insert_rows(db_manager, generate_rows(2000))
+    for asset_name in ASSETS:
+        raw_candles = get_candles(db_manager, asset_name, start_date, end_date, interval, use_rollups=False)
+        rollup_candles = get_candles(db_manager, asset_name, start_date, end_date, interval)
+        assert raw_candles
+        assert rollup_candles == raw_candles
+
+
+def test_raw_candles_are_aggregated_from_the_updates(db_manager):
+    rows = generate_rows(500)
+    insert_rows(db_manager, rows)
+    candles = get_candles(db_manager, 'BTC', MIN_DATETIME, MAX_DATETIME, '1h', use_rollups=False)
+    expected = {}
+    for asset_name, update_time, price, change in rows:
+        if asset_name == 'BTC':
+            expected.setdefault(get_bucket_start(update_time, 3600), []).append(price)
+    assert candles == [(open_time, prices[0], max(prices), min(prices), prices[-1], len(prices))
+                       for open_time, prices in sorted(expected.items())]
+
+
+def test_candles_use_raw_data_until_backfilled(db_manager):
+    rows = generate_rows(1000)
+    # Updates inserted before the rollup tables existed: the raw rows without rollups
+    query = "INSERT INTO historical_data (asset_name, update_time, price, `change`) VALUES (%s, %s, %s, %s)"
+    db_manager.execute_many(query, rows[:600])
+    db_manager.execute_transaction(["DELETE FROM rollup_backfill"], [()])
+    db_manager.create_database_and_tables()
+    insert_rows(db_manager, rows[600:])
+    raw_candles = get_candles(db_manager, 'ETH', MIN_DATETIME, MAX_DATETIME, '1h', use_rollups=False)
+    assert not db_manager.is_rollup_backfilled()
+    assert get_candles(db_manager, 'ETH', MIN_DATETIME, MAX_DATETIME, '1h') == raw_candles
+
+    assert backfill_rollups(db_manager, chunk_size=128) == 600
+    assert db_manager.is_rollup_backfilled()
+    assert get_candles(db_manager, 'ETH', MIN_DATETIME, MAX_DATETIME, '1h') == raw_candles
+    assert backfill_rollups(db_manager) == 0
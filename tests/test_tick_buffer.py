@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from backend.market_data_management import TickBuffer
+
+START_TIME = 1700000000000  # epoch ms
+
+
+def fill(tick_buffer: TickBuffer, count: int) -> None:
+    for i in range(count):
+        tick_buffer.append(START_TIME + i * 1000, 100.0 + i)
+
+
+def test_times_are_int64_epoch_ms():
+    tick_buffer = TickBuffer(4)
+    fill(tick_buffer, 2)
+    times, prices = tick_buffer.last(2)
+    assert times.dtype == np.int64
+    assert times.tolist() == [START_TIME, START_TIME + 1000]
+    assert prices.tolist() == [100.0, 101.0]
+
+
+@pytest.mark.parametrize('count', [0, 1, 4, 5, 11, 12])
+def test_last_ticks_are_contiguous_after_wraparound(count):
+    tick_buffer = TickBuffer(4)
+    fill(tick_buffer, count)
+    times, prices = tick_buffer.last(10)
+    expected_prices = [100.0 + i for i in range(max(0, count - 4), count)]
+    assert len(tick_buffer) == len(expected_prices)
+    assert prices.tolist() == expected_prices
+    assert times.tolist() == [START_TIME + int(price - 100) * 1000 for price in expected_prices]
+    assert prices.base is tick_buffer.prices
+    assert not prices.flags.writeable
+
+
+def test_since_and_sample():
+    tick_buffer = TickBuffer(8)
+    fill(tick_buffer, 20)
+    times, prices = tick_buffer.since(START_TIME + 15000)
+    assert prices.tolist() == [115.0, 116.0, 117.0, 118.0, 119.0]
+    assert tick_buffer.sample(START_TIME + 15000, 3).tolist() == [115.0, 117.0, 119.0]
+    assert tick_buffer.sample(START_TIME + 15000, 10).tolist() == prices.tolist()
+
+
+def test_summarize():
+    tick_buffer = TickBuffer(8)
+    fill(tick_buffer, 20)
+    assert tick_buffer.summarize(START_TIME + 18000, 10) == {
+        'tick_count': 2,
+        'first_time': START_TIME + 18000,
+        'last_time': START_TIME + 19000,
+        'open': 118.0,
+        'high': 119.0,
+        'low': 118.0,
+        'close': 119.0,
+        'sparkline': [118.0, 119.0]
+    }
+    assert tick_buffer.summarize(START_TIME + 20000, 10) is None